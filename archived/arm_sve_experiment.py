@@ -1,10 +1,9 @@
 from gem5_launch_utils.Experiment import Experiment
 from gem5_launch_utils.ExperimentUnit import ExperimentUnit
+from gem5_launch_utils.DiskImageFingerprint import is_expected_image
 
 from pathlib import Path
 
-import subprocess
-
 experiment_tag = "bougainvillea-2"
 gem5_binary_path = "/home/hn/gem5/build/ARM/gem5.opt"
 gem5_config_path = "/home/hn/gem5/configs/example/arm/fs_xsbench.py"
@@ -12,17 +11,7 @@ gem5_output_path_prefix = "/home/hn/experiment-results/arm_sve_xsbench/"
 env = {'M5_PATH': '/home/hn/gem5/arm-system/'}
 disk_image_path = "/home/hn/disk-images/arm64-ubuntu-xsbench.img"
 
-def get_md5sum(filepath):
-    filepath = str(filepath)
-    process_info = subprocess.run(["md5sum", filepath], capture_output=True)
-    md5sum = "-1"
-    if process_info.returncode == 0:
-        md5sum = process_info.stdout.strip().split()[0]
-    else:
-        print("Warn: md5sum failed for", filepath)
-    return md5sum
-
-disk_image_hash = get_md5sum(disk_image_path)
+disk_image_md5sum = "22237d4d5609f3e5d24dd4ee5f01e97e"
 gem5_binary_md5sum = "41e34aed209775e16d12f02438b2c6715f20efd3"
 
 def sanity_check():
@@ -30,7 +19,8 @@ def sanity_check():
     assert(Path(gem5_output_path_prefix).exists())
     assert(Path(env['M5_PATH']).exists())
     assert(Path(disk_image_path).exists())
-    assert(disk_image_hash == "22237d4d5609f3e5d24dd4ee5f01e97e")
+    # only reads the image if it changed since it was last fingerprinted
+    assert(is_expected_image(disk_image_path, disk_image_md5sum))
 def output_folder_generator(cpu_type, vl, benchmark_size, benchmark_threads):
     return "_".join([experiment_tag, cpu_type, vl, benchmark_size, benchmark_threads])
 
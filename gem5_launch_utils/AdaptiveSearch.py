@@ -0,0 +1,145 @@
+import math
+from pathlib import Path
+
+"""
+    Adaptive search of a design space by successive halving.
+
+    Instead of simulating every point of the space for the whole ROI, every
+    point is first simulated for a short ROI (min_roi_ticks, passed to the
+    config as --max_roi_ticks by make_unit), only the best 1/eta of them are
+    simulated again with an eta times larger budget, and so on until a single
+    point would be left in each group (e.g. one group per workload, see
+    group_keys), or until the budget reached max_roi_ticks; the best point of
+    the last rung is the best one of the group.
+    A space of n points takes about log_eta(n) rounds ("rungs") and
+    n * eta / (eta - 1) short simulations instead of n full ones.
+
+    The search is a unit source for Experiment.add_adaptive_search(): it
+    yields the units of a rung, then None while they run, and picks the next
+    rung from their results once they all finished (retries included). The
+    objective is read from the outputs of each unit, by default the DRAM
+    bandwidth of the last stats dump; units without a result are dropped.
+
+    make_unit(point, roi_ticks) has to return a unit with its own output
+    folder per budget, e.g. with the budget in the folder name.
+"""
+
+dram_byte_stat_names = ["board.memory.mem_ctrl*.dram.bytesRead::total", "board.memory.mem_ctrl*.dram.bytesWritten::total"]
+
+# bytes/s moved by the DRAM controllers in the last stats dump, which covers
+# the ROI since the stats are reset at m5_work_begin()
+def get_dram_bandwidth(unit):
+    from gem5_stats_utils.StatsParser import parse_stats
+    try:
+        stats = parse_stats(Path(unit.gem5_output_path) / "stats.txt", ["simSeconds"] + dram_byte_stat_names)
+    except FileNotFoundError:
+        return None
+    if not "simSeconds" in stats or len(stats["simSeconds"]) == 0:
+        return None
+    sim_seconds = stats["simSeconds"][-1]
+    dram_bytes = sum(values[-1] for name, values in stats.items() if name != "simSeconds" and values[-1] == values[-1])
+    if not sim_seconds > 0:
+        return None
+    return float(dram_bytes / sim_seconds)
+
+class SuccessiveHalving:
+    # objective(unit) returns a value to maximize, or None
+    def __init__(self, space, make_unit, min_roi_ticks, max_roi_ticks, eta = 3, group_keys = [], objective = get_dram_bandwidth):
+        assert eta >= 2
+        self.space = space
+        self.make_unit = make_unit
+        self.min_roi_ticks = min_roi_ticks
+        self.max_roi_ticks = max_roi_ticks
+        self.eta = eta
+        self.group_keys = group_keys
+        self.objective = objective
+        self.supervisor = None
+        # units of the current rung, keyed by uuid
+        self.units = {}
+        # objective of every unit of the current rung that finished, keyed by uuid
+        self.results = {}
+        # best (point, objective, roi_ticks) of each group
+        self.best = {}
+        self.n_units = 0
+
+    def attach(self, supervisor):
+        self.supervisor = supervisor
+        supervisor.add_finish_hook(self.on_finish)
+
+    # also called for units that were not simulated, e.g. restored from the
+    # result cache, their outputs are there
+    def on_finish(self, unit):
+        if not unit.uuid in self.units:
+            return
+        # no status: the unit was not launched by this process
+        status = getattr(unit, "status", None)
+        if status is None or (status == "finished" and unit.return_code == 0):
+            self.results[unit.uuid] = self.objective(unit)
+        else:
+            self.results[unit.uuid] = None
+
+    def get_roi_ticks(self, rung):
+        return min(self.max_roi_ticks, self.min_roi_ticks * self.eta ** rung)
+
+    def __get_group(self, point):
+        return tuple(point.get(key, None) for key in self.group_keys)
+
+    def __is_rung_done(self):
+        if any(not uuid in self.results for uuid in self.units):
+            return False
+        # a unit waiting for a retry, or already queued again for it, is going
+        # to finish again
+        if self.supervisor is not None and any(uuid in self.supervisor.retrying for uuid in self.units):
+            return False
+        return True
+
+    def __iter__(self):
+        # the first rung streams the points of the space, which is never
+        # materialized; the next rungs simulate the survivors of each group
+        candidates = ((self.__get_group(point), point) for point in self.space)
+        rung = 0
+        while True:
+            roi_ticks = self.get_roi_ticks(rung)
+            self.units = {}
+            self.results = {}
+            points = {}
+            for group, point in candidates:
+                unit = self.make_unit(point, roi_ticks)
+                unit.add_metadata("search-rung", str(rung))
+                unit.add_metadata("search-roi-ticks", str(roi_ticks))
+                self.units[unit.uuid] = unit
+                points[unit.uuid] = (group, point)
+                self.n_units += 1
+                yield unit
+            if not points:
+                break
+            print("Info: adaptive search rung", rung, "simulates", len(points), "points for", roi_ticks, "ROI ticks")
+            while not self.__is_rung_done():
+                yield None
+
+            ranked = {}
+            for uuid, (group, point) in points.items():
+                value = self.results[uuid]
+                if value is None:
+                    print("Warn: no result for", self.units[uuid].gem5_output_path + ", dropping it from the search")
+                    continue
+                ranked.setdefault(group, []).append((value, point))
+            next_survivors = {}
+            for group, values in ranked.items():
+                values.sort(key = lambda item: item[0], reverse = True)
+                self.best[group] = (values[0][1], values[0][0], roi_ticks)
+                n_kept = math.ceil(len(values) / self.eta)
+                # a group is done once a single point would be left, or once
+                # its points had the whole budget: another rung would simulate
+                # them again for the same ROI, in the same output folders
+                if n_kept > 1 and roi_ticks < self.max_roi_ticks:
+                    next_survivors[group] = [point for value, point in values[:n_kept]]
+            candidates = [(group, point) for group, group_points in next_survivors.items() for point in group_points]
+            rung += 1
+        self.print_summary()
+
+    def print_summary(self):
+        print("Info: adaptive search simulated", self.n_units, "units")
+        for group, (point, value, roi_ticks) in sorted(self.best.items(), key = lambda item: str(item[0])):
+            name = "/".join(str(val) for val in group) if group else "all"
+            print(f"    {name}: {point} with {value:.4g} after {roi_ticks} ROI ticks")
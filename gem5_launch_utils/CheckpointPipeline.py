@@ -0,0 +1,76 @@
+import hashlib
+import uuid
+from pathlib import Path
+
+from .ExperimentUnit import ExperimentUnit
+
+"""
+    Boot once, fork many.
+
+    Units sharing the parameters that determine the guest state at
+    m5_work_begin() (disk image, kernel, core count, memory size, and, since
+    the checkpoint is taken inside the workload, the vector length and the
+    command) are grouped together. Each group gets one checkpointing unit
+    that boots with the Atomic CPU and saves a checkpoint at m5_work_begin(),
+    then every unit of the group restores that checkpoint and only simulates
+    the ROI. The restoring units depend on the checkpointing unit, the
+    Supervisor takes care of the ordering (the WorkQueue, when the units are
+    submitted to workers on several hosts).
+
+    The gem5 config has to understand
+        --take_checkpoint <path>       save a checkpoint at m5_work_begin() and exit
+        --restore_checkpoint <path>    restore and simulate the ROI in detail
+    (see experiment-10-CHI-correct-latency/configs/gem5/arm64sve-chi.py).
+"""
+
+# metadata keys, a missing key is treated as the same value for all units
+default_boot_keys = ["disk-image-path", "disk-image-md5sum", "kernel", "num_ccds", "memory-size", "vlen", "command"]
+
+def get_boot_key(unit, boot_keys = default_boot_keys):
+    fields = [unit.gem5_binary_hash, unit.gem5_config_path]
+    fields += [str(unit.metadata.get(key, "")) for key in boot_keys]
+    return tuple(fields)
+
+def _get_group_name(boot_key):
+    return hashlib.sha1("\0".join(boot_key).encode()).hexdigest()[:16]
+
+def _is_checkpoint(path):
+    # gem5 writes m5.cpt in the checkpoint directory
+    return (Path(path) / "m5.cpt").exists()
+
+# Returns the list of units to launch: one checkpointing unit per group whose
+# checkpoint does not exist yet, followed by all units rewritten to restore
+# the checkpoint of their group.
+def add_checkpoint_stage(units, checkpoint_path_prefix, boot_keys = default_boot_keys):
+    groups = {}
+    for unit in units:
+        groups.setdefault(get_boot_key(unit, boot_keys), []).append(unit)
+
+    checkpointing_units = []
+    restoring_units = []
+    for boot_key, group in groups.items():
+        group_name = _get_group_name(boot_key)
+        checkpoint_path = str(Path(checkpoint_path_prefix) / group_name / "checkpoint")
+
+        checkpointing_unit = None
+        if not _is_checkpoint(checkpoint_path):
+            checkpointing_unit = ExperimentUnit.init_from_ExperimentUnit(group[0])
+            checkpointing_unit.uuid = str(uuid.uuid4())
+            checkpointing_unit.gem5_output_path = str(Path(checkpoint_path_prefix) / group_name / "boot")
+            if "--outdir" in checkpointing_unit.gem5_params:
+                checkpointing_unit.gem5_params["--outdir"] = checkpointing_unit.gem5_output_path
+            checkpointing_unit.config_params["--take_checkpoint"] = checkpoint_path
+            checkpointing_unit.add_metadata("checkpoint-path", checkpoint_path)
+            checkpointing_unit.add_metadata("checkpoint-stage", "take")
+            checkpointing_units.append(checkpointing_unit)
+
+        for unit in group:
+            unit.config_params["--restore_checkpoint"] = checkpoint_path
+            unit.add_metadata("checkpoint-path", checkpoint_path)
+            unit.add_metadata("checkpoint-stage", "restore")
+            if checkpointing_unit is not None:
+                unit.depends_on.append(checkpointing_unit.uuid)
+            restoring_units.append(unit)
+
+    print("Info:", len(units), "units share", len(groups), "boot checkpoints,", len(checkpointing_units), "of which have to be taken")
+    return checkpointing_units + restoring_units
@@ -0,0 +1,350 @@
+import abc
+import itertools
+import math
+import random
+
+"""
+    Declarative design spaces, enumerated lazily.
+
+    A design space is a sequence of points, a point being a dict of parameter
+    values. Spaces are built from
+        Axis("vlen", [512, 2048])         one parameter, any sequence (a range
+                                          of a billion values is fine)
+        Fixed(isa = "arm64sve")           a single point
+        a * b                             every point of a with every point of b
+        a + b                             the points of a, then those of b, e.g.
+                                          one space per workload with its own
+                                          parameter ranges
+        a.zip(b)                          the i-th point of a with the i-th of b
+        a.where(predicate)                the points for which predicate(point)
+                                          is true, a filtered space can be part
+                                          of a product or a union (but not of a
+                                          zip)
+    and from_config(), which turns the list attributes of a Config (see
+    utils/configs/configs.py, "values" entries) or of a class like
+    ARM64SVE_Design_Space into axes and the other attributes into fixed values.
+
+    Nothing is enumerated up front: len() and space[i] are computed from the
+    sizes of the parts, iterating yields one point at a time, shuffled() walks
+    the space in a pseudo-random order and sample(n) takes the first n points
+    of that walk, so that a constrained million-point space starts launching
+    immediately. A space with a filter anywhere inside has no len() or
+    space[i] (TypeError), its shuffled() walks the unfiltered space and skips
+    the points the filters reject. map(make_unit) turns the points into ExperimentUnits as they
+    are pulled, see Experiment.add_experiment_units().
+"""
+
+class DesignSpace(abc.ABC):
+    @abc.abstractmethod
+    def __len__(self):
+        pass
+
+    @abc.abstractmethod
+    def __getitem__(self, index):
+        pass
+
+    def __iter__(self):
+        for index in range(len(self)):
+            yield self[index]
+
+    def __mul__(self, other):
+        return Product(self, other)
+
+    def __add__(self, other):
+        return Union(self, other)
+
+    def zip(self, other):
+        return Zip(self, other)
+
+    def where(self, predicate):
+        return Filtered(self, predicate)
+
+    def shuffled(self, seed = 0):
+        if self.is_filtered():
+            return FilteredShuffled(self, seed)
+        return Shuffled(self, seed)
+
+    def sample(self, n, seed = 0):
+        return itertools.islice(self.shuffled(seed), n)
+
+    def map(self, fn):
+        return (fn(point) for point in self)
+
+    # the names of the parameters of the points
+    @abc.abstractmethod
+    def get_names(self):
+        pass
+
+    # whether a filter is part of the space; the filtered points are then the
+    # points of get_unfiltered() whose index passes accepts(index)
+    def is_filtered(self):
+        return False
+
+    def get_unfiltered(self):
+        return self
+
+    def accepts(self, index):
+        return True
+
+class Axis(DesignSpace):
+    def __init__(self, name, values):
+        self.name = name
+        # ranges and lists are indexed lazily, other iterables are materialized
+        self.values = values if hasattr(values, "__getitem__") and hasattr(values, "__len__") else list(values)
+
+    def __len__(self):
+        return len(self.values)
+
+    def __getitem__(self, index):
+        return {self.name: self.values[index]}
+
+    def get_names(self):
+        return [self.name]
+
+class Fixed(DesignSpace):
+    def __init__(self, **params):
+        self.params = params
+
+    def __len__(self):
+        return 1
+
+    def __getitem__(self, index):
+        if index != 0 and index != -1:
+            raise IndexError(index)
+        return dict(self.params)
+
+    def get_names(self):
+        return list(self.params.keys())
+
+class Product(DesignSpace):
+    def __init__(self, *spaces):
+        self.spaces = spaces
+        names = [name for space in spaces for name in space.get_names()]
+        assert len(names) == len(set(names)), f"a parameter appears more than once in {names}"
+        self.unfiltered = Product(*[space.get_unfiltered() for space in spaces]) if self.is_filtered() else self
+
+    def __len__(self):
+        return math.prod(len(space) for space in self.spaces)
+
+    # mixed radix, the last space varies the fastest like nested for loops
+    def __getitem__(self, index):
+        if index < 0:
+            index += len(self)
+        if index < 0 or index >= len(self):
+            raise IndexError(index)
+        parts = []
+        for space in reversed(self.spaces):
+            index, digit = divmod(index, len(space))
+            parts.append(space[digit])
+        point = {}
+        for part in reversed(parts):
+            point.update(part)
+        return point
+
+    # nested loops over the spaces, the inner spaces are iterated again for
+    # every point of the outer ones instead of being materialized
+    def __iter__(self):
+        return Product.__iter_product(self.spaces, {})
+
+    def __iter_product(spaces, point):
+        if not spaces:
+            yield dict(point)
+            return
+        for part in spaces[0]:
+            yield from Product.__iter_product(spaces[1:], {**point, **part})
+
+    def get_names(self):
+        return [name for space in self.spaces for name in space.get_names()]
+
+    def is_filtered(self):
+        return any(space.is_filtered() for space in self.spaces)
+
+    def get_unfiltered(self):
+        return self.unfiltered
+
+    def accepts(self, index):
+        for space in reversed(self.spaces):
+            index, digit = divmod(index, len(space.get_unfiltered()))
+            if not space.accepts(digit):
+                return False
+        return True
+
+class Union(DesignSpace):
+    def __init__(self, *spaces):
+        self.spaces = spaces
+        self.unfiltered = Union(*[space.get_unfiltered() for space in spaces]) if self.is_filtered() else self
+
+    def __len__(self):
+        return sum(len(space) for space in self.spaces)
+
+    def __getitem__(self, index):
+        if index < 0:
+            index += len(self)
+        for space in self.spaces:
+            if 0 <= index < len(space):
+                return space[index]
+            index -= len(space)
+        raise IndexError(index)
+
+    def __iter__(self):
+        for space in self.spaces:
+            yield from space
+
+    def get_names(self):
+        names = []
+        for space in self.spaces:
+            names += [name for name in space.get_names() if not name in names]
+        return names
+
+    def is_filtered(self):
+        return any(space.is_filtered() for space in self.spaces)
+
+    def get_unfiltered(self):
+        return self.unfiltered
+
+    def accepts(self, index):
+        for space in self.spaces:
+            n = len(space.get_unfiltered())
+            if index < n:
+                return space.accepts(index)
+            index -= n
+        return False
+
+class Zip(DesignSpace):
+    def __init__(self, *spaces):
+        self.spaces = spaces
+        # the i-th point of a filtered space is unknown until enumerated
+        assert not any(space.is_filtered() for space in spaces), "zipped spaces cannot be filtered, filter the zip instead"
+        assert len(set(len(space) for space in spaces)) == 1, "zipped spaces must have the same length"
+
+    def __len__(self):
+        return len(self.spaces[0])
+
+    def __getitem__(self, index):
+        point = {}
+        for space in self.spaces:
+            point.update(space[index])
+        return point
+
+    def get_names(self):
+        return [name for space in self.spaces for name in space.get_names()]
+
+# the number of points passing the predicates is unknown until enumerated, so
+# there is no len() or indexing; shuffling shuffles the unfiltered space
+class Filtered(DesignSpace):
+    def __init__(self, space, predicate):
+        self.space = space
+        self.predicate = predicate
+
+    def __len__(self):
+        raise TypeError("the size of a filtered design space is unknown, iterate it or use shuffled()")
+
+    def __getitem__(self, index):
+        raise TypeError("a filtered design space cannot be indexed, iterate it or use shuffled()")
+
+    def __iter__(self):
+        return (point for point in self.space if self.predicate(point))
+
+    def get_names(self):
+        return self.space.get_names()
+
+    def is_filtered(self):
+        return True
+
+    def get_unfiltered(self):
+        return self.space.get_unfiltered()
+
+    def accepts(self, index):
+        return self.space.accepts(index) and self.predicate(self.get_unfiltered()[index])
+
+def _mix(x):
+    # splitmix64 finalizer
+    x = ((x ^ (x >> 30)) * 0xbf58476d1ce4e5b9) & 0xffffffffffffffff
+    x = ((x ^ (x >> 27)) * 0x94d049bb133111eb) & 0xffffffffffffffff
+    return x ^ (x >> 31)
+
+# a pseudo-random permutation of the indices that needs no memory: a Feistel
+# network over the smallest even number of bits holding len(space), walking
+# the cycle until the index falls inside the space (4 steps at most on average)
+class Shuffled(DesignSpace):
+    n_rounds = 4
+
+    def __init__(self, space, seed = 0):
+        self.space = space
+        self.half_bits = max(1, (max(1, len(space) - 1).bit_length() + 1) // 2)
+        rng = random.Random(seed)
+        self.keys = [rng.getrandbits(64) for _ in range(Shuffled.n_rounds)]
+
+    def __permute(self, index):
+        mask = (1 << self.half_bits) - 1
+        left, right = index >> self.half_bits, index & mask
+        for key in self.keys:
+            left, right = right, left ^ (_mix(right ^ key) & mask)
+        return (left << self.half_bits) | right
+
+    def __len__(self):
+        return len(self.space)
+
+    # the index in the space of the index-th point of the walk
+    def get_index(self, index):
+        n = len(self)
+        if index < 0:
+            index += n
+        if index < 0 or index >= n:
+            raise IndexError(index)
+        index = self.__permute(index)
+        while index >= n:
+            index = self.__permute(index)
+        return index
+
+    def __getitem__(self, index):
+        return self.space[self.get_index(index)]
+
+    def get_names(self):
+        return self.space.get_names()
+
+# the shuffled walk of a space with filters inside: the unfiltered space is
+# walked and the points the filters reject are skipped
+class FilteredShuffled(DesignSpace):
+    def __init__(self, space, seed = 0):
+        self.space = space
+        self.walk = Shuffled(space.get_unfiltered(), seed)
+
+    def __len__(self):
+        raise TypeError("the size of a filtered design space is unknown, iterate it")
+
+    def __getitem__(self, index):
+        raise TypeError("a filtered design space cannot be indexed, iterate it")
+
+    def __iter__(self):
+        unfiltered = self.space.get_unfiltered()
+        for i in range(len(unfiltered)):
+            index = self.walk.get_index(i)
+            if self.space.accepts(index):
+                yield unfiltered[index]
+
+    def get_names(self):
+        return self.space.get_names()
+
+    # shuffling again reshuffles the filtered space
+    def shuffled(self, seed = 0):
+        return FilteredShuffled(self.space, seed)
+
+# the attributes of config (a Config, or any object or class with parameter
+# attributes) that are lists become axes, the others fixed parameters; names
+# restricts and orders the parameters
+def from_config(config, names = None):
+    params = {key: val for key, val in vars(config).items() if not key.startswith("_") and not callable(val) and not isinstance(val, (classmethod, staticmethod))}
+    if names is None:
+        names = list(params.keys())
+    spaces = []
+    fixed = {}
+    for name in names:
+        val = params[name]
+        if isinstance(val, (list, tuple, range)):
+            spaces.append(Axis(name, val))
+        else:
+            fixed[name] = val
+    if fixed:
+        spaces.append(Fixed(**fixed))
+    return Product(*spaces)
@@ -0,0 +1,199 @@
+import argparse
+import hashlib
+import json
+import os
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+
+"""
+    Fingerprints of (multi-GB) disk images, so that checking "is this the
+    image the launcher expects" does not read the whole image every time.
+
+    The fingerprint of an image is a list of blake2b digests, one per chunk of
+    chunk_size bytes, and a root digest over the size and the chunk digests.
+    The chunks are hashed in parallel threads (hashlib releases the GIL).
+    The fingerprint is stored with the stat info of the image,
+        <image>.fingerprint.json
+    or, if the image directory is not writable,
+        ~/.cache/gem5_launch_utils/fingerprints/<sha1 of the image path>.json
+    and as long as the size, mtime and inode of the image are unchanged, the
+    stored fingerprint is used without reading the image.
+
+    The launchers record the md5sum of the image, so the fingerprint also
+    holds the md5sum once it has been asked for. A changed mtime cannot tell
+    which chunks changed, so the image is read again, but only once: when the
+    md5sum is asked for, it is computed in the same pass as the chunks, and
+    the md5sum is not recomputed at all when the chunks turn out the same.
+"""
+
+default_chunk_size = 2**26
+default_fingerprint_cache_path = Path.home() / ".cache" / "gem5_launch_utils" / "fingerprints"
+
+def _hash_chunk(fd, offset, length):
+    h = hashlib.blake2b(digest_size = 32)
+    block_size = 2**22
+    end = offset + length
+    while offset < end:
+        data = os.pread(fd, min(block_size, end - offset), offset)
+        if not data:
+            break
+        h.update(data)
+        offset += len(data)
+    return h.hexdigest()
+
+def _get_root(size, chunks):
+    h = hashlib.blake2b(digest_size = 32)
+    h.update(str(size).encode())
+    for chunk in chunks:
+        h.update(bytes.fromhex(chunk))
+    return h.hexdigest()
+
+def _get_md5sum(image_path):
+    h = hashlib.md5()
+    with open(image_path, "rb") as f:
+        while True:
+            data = f.read(2**24)
+            if not data:
+                break
+            h.update(data)
+    return h.hexdigest()
+
+def _get_stat_info(image_path):
+    st = os.stat(image_path)
+    return {"size": st.st_size, "mtime_ns": st.st_mtime_ns, "inode": st.st_ino}
+
+def get_fingerprint_paths(image_path):
+    image_path = Path(image_path).absolute()
+    cache_name = hashlib.sha1(str(image_path).encode()).hexdigest() + ".json"
+    return [image_path.with_name(image_path.name + ".fingerprint.json"), default_fingerprint_cache_path / cache_name]
+
+def load_fingerprint(image_path):
+    for fingerprint_path in get_fingerprint_paths(image_path):
+        if not fingerprint_path.exists():
+            continue
+        try:
+            with open(fingerprint_path, "r") as f:
+                return json.load(f)
+        except (OSError, json.JSONDecodeError):
+            print("Warn: failed to read", fingerprint_path)
+    return None
+
+def save_fingerprint(image_path, fingerprint):
+    for fingerprint_path in get_fingerprint_paths(image_path):
+        tmp_path = fingerprint_path.with_name("." + fingerprint_path.name + f".{os.getpid()}.tmp")
+        try:
+            fingerprint_path.parent.mkdir(parents=True, exist_ok=True)
+            with open(tmp_path, "w") as f:
+                json.dump(fingerprint, f, indent=4)
+            os.replace(tmp_path, fingerprint_path)
+            return fingerprint_path
+        except OSError:
+            continue
+    print("Warn: failed to save the fingerprint of", image_path)
+    return None
+
+def compute_chunks(image_path, size, chunk_size = default_chunk_size, n_threads = None):
+    if n_threads is None:
+        n_threads = min(8, os.cpu_count() or 1)
+    fd = os.open(image_path, os.O_RDONLY)
+    try:
+        offsets = range(0, size, chunk_size)
+        with ThreadPoolExecutor(max_workers = n_threads) as executor:
+            return list(executor.map(lambda offset: _hash_chunk(fd, offset, min(chunk_size, size - offset)), offsets))
+    finally:
+        os.close(fd)
+
+# the chunks and the md5sum in a single sequential pass over the image
+def compute_chunks_and_md5sum(image_path, size, chunk_size = default_chunk_size):
+    md5 = hashlib.md5()
+    chunks = []
+    with open(image_path, "rb") as f:
+        for offset in range(0, size, chunk_size):
+            h = hashlib.blake2b(digest_size = 32)
+            remaining = min(chunk_size, size - offset)
+            while remaining > 0:
+                data = f.read(min(2**22, remaining))
+                if not data:
+                    break
+                h.update(data)
+                md5.update(data)
+                remaining -= len(data)
+            chunks.append(h.hexdigest())
+    return chunks, md5.hexdigest()
+
+# returns the fingerprint of the image, re-hashing it only if the image
+# changed since the stored fingerprint was taken
+def get_fingerprint(image_path, with_md5sum = False, chunk_size = default_chunk_size, n_threads = None):
+    image_path = Path(image_path)
+    stat_info = _get_stat_info(image_path)
+    stored = load_fingerprint(image_path)
+    if stored is not None and stored.get("chunk_size", None) != chunk_size:
+        stored = None
+
+    if stored is not None and all(stored.get(key, None) == val for key, val in stat_info.items()):
+        fingerprint = stored
+    else:
+        print("Info: fingerprinting", image_path)
+        md5sum = None
+        if with_md5sum:
+            chunks, md5sum = compute_chunks_and_md5sum(image_path, stat_info["size"], chunk_size)
+        else:
+            chunks = compute_chunks(image_path, stat_info["size"], chunk_size, n_threads)
+        fingerprint = dict(stat_info)
+        fingerprint["chunk_size"] = chunk_size
+        fingerprint["chunks"] = chunks
+        fingerprint["root"] = _get_root(stat_info["size"], chunks)
+        if stored is not None:
+            old_chunks = stored.get("chunks", [])
+            n_changed = sum(1 for i, chunk in enumerate(chunks) if i >= len(old_chunks) or old_chunks[i] != chunk)
+            print("Info:", n_changed, "of", len(chunks), "chunks of", image_path, "changed")
+            # same content, the md5sum still holds
+            if stored.get("root", None) == fingerprint["root"] and "md5sum" in stored:
+                fingerprint["md5sum"] = stored["md5sum"]
+        if md5sum is not None:
+            fingerprint["md5sum"] = md5sum
+        save_fingerprint(image_path, fingerprint)
+
+    if with_md5sum and not "md5sum" in fingerprint:
+        print("Info: computing the md5sum of", image_path)
+        fingerprint["md5sum"] = _get_md5sum(image_path)
+        save_fingerprint(image_path, fingerprint)
+    return fingerprint
+
+# expected is either an md5sum (32 hex digits) or a fingerprint root
+def is_expected_image(image_path, expected):
+    if not Path(image_path).exists():
+        print("Error: the disk image", image_path, "does not exist")
+        return False
+    with_md5sum = len(expected) == 32
+    fingerprint = get_fingerprint(image_path, with_md5sum = with_md5sum)
+    actual = fingerprint["md5sum"] if with_md5sum else fingerprint["root"]
+    if actual != expected:
+        print("Error: the disk image", image_path, "is", actual, "but", expected, "is expected")
+        return False
+    return True
+
+# checks each distinct (disk-image-path, disk-image-md5sum) of the units once,
+# returns the set of the image paths that did not match
+def verify_disk_images(units):
+    expected_images = set()
+    for unit in units:
+        image_path = unit.metadata.get("disk-image-path", None)
+        expected = unit.metadata.get("disk-image-md5sum", None)
+        if image_path is None or expected is None:
+            continue
+        expected_images.add((image_path, expected))
+    mismatched = set()
+    for image_path, expected in expected_images:
+        if not is_expected_image(image_path, expected):
+            mismatched.add(image_path)
+    return mismatched
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description = "Print (and store) the fingerprint of disk images")
+    parser.add_argument("image_paths", type=str, nargs="+")
+    parser.add_argument("--md5sum", action="store_true", help="Also compute the md5sum")
+    args = parser.parse_args()
+    for image_path in args.image_paths:
+        fingerprint = get_fingerprint(image_path, with_md5sum = args.md5sum)
+        print(image_path, fingerprint["root"], fingerprint.get("md5sum", ""))
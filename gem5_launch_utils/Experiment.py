@@ -1,16 +1,290 @@
-from multiprocessing import Pool
+import itertools
 
-def launching_function(experiment):
-    experiment.try_launch()
+from .CheckpointPipeline import add_checkpoint_stage, default_boot_keys
+from .DiskImageFingerprint import is_expected_image, verify_disk_images
+from .FailureClassifier import RetryPolicy, print_failure_summary
+from .HostTelemetry import print_telemetry_summary
+from .OutputRecycler import OutputRecycler
+from .RuntimeHistory import RuntimeHistory
+from .Supervisor import Supervisor
+from .SweepIndex import SweepIndices
+from .WorkQueue import WorkQueue
 
 class Experiment:
-    def __init__(self):
+    def __init__(self, runtime_history = None):
         self.experiment_units = []
+        # iterables of units consumed while the sweep runs
+        self.lazy_unit_sources = []
+        # unit sources that need the results of their units, see add_feedback_source()
+        self.feedback_sources = []
+        if runtime_history is None:
+            runtime_history = RuntimeHistory()
+        self.runtime_history = runtime_history
+        self.checkpoint_path_prefix = None
+        self.boot_keys = default_boot_keys
+        self.sweep_indices = SweepIndices()
+        self.results_store = None
+        self.stats_tail = None
+        self.verify_disk_images = False
+        self.keep_generations = 0
+        self.byte_budget = None
+        self.output_archive_level = None
+        self.retry_policy_params = {}
+        self.watchdog = None
+        self.result_cache = None
 
     def add_experiment_unit(self, unit):
         self.experiment_units.append(unit)
 
-    def launch(self, n_processes):
-        with Pool(n_processes) as pool:
-            pool.map(launching_function, self.experiment_units)
+    # units is any iterable of units, e.g. DesignSpace.map(), consumed only as
+    # slots free up during the launch; such units are not sorted by predicted
+    # runtime, and boot checkpoints (which group all the units) materialize them
+    def add_experiment_units(self, units):
+        self.lazy_unit_sources.append(units)
 
+    # source is a unit source that picks its next units from the results of
+    # the previous ones (e.g. SimPointPipeline): it has attach(supervisor) and
+    # on_finish(unit), and yields None while waiting for results
+    def add_feedback_source(self, source):
+        self.feedback_sources.append(source)
+        self.lazy_unit_sources.append(source)
+
+    # e.g. AdaptiveSearch.SuccessiveHalving
+    def add_adaptive_search(self, search):
+        self.add_feedback_source(search)
+
+    # the units added lazily are not counted
+    def get_number_of_experiment_units(self):
+        return len(self.experiment_units)
+
+    # boot once per group of units sharing the boot-relevant parameters and
+    # restore the checkpoint for every unit of the group, see CheckpointPipeline
+    def enable_boot_checkpoints(self, checkpoint_path_prefix, boot_keys = default_boot_keys):
+        self.checkpoint_path_prefix = checkpoint_path_prefix
+        self.boot_keys = boot_keys
+
+    # folds the metadata and the selected stats of each finished unit into a
+    # columnar store, see gem5_stats_utils/ResultsStore (requires pyarrow)
+    def enable_results_store(self, store_path, stat_names = []):
+        from gem5_stats_utils.ResultsStore import ResultsStore
+        self.results_store = ResultsStore(store_path, stat_names)
+
+    def __add_to_results_store(self, unit):
+        if unit.status == "finished":
+            self.results_store.add_unit(unit)
+
+    # follows the periodic stats dumps of the running units into per-unit
+    # time series, and terminates those for which should_stop returns a reason,
+    # see StatsTail
+    def enable_live_stats(self, stat_names, should_stop = None):
+        from .StatsTail import StatsTail
+        self.stats_tail = StatsTail(stat_names, should_stop)
+
+    # checks once per sweep that each disk image is the one whose md5sum is in
+    # the units' metadata, and drops the units of the images that are not,
+    # see DiskImageFingerprint
+    def enable_disk_image_verification(self):
+        self.verify_disk_images = True
+
+    # terminates the units without progress for stall_timeout seconds, and
+    # those running for more than overrun_factor times their predicted runtime
+    # or predicted to take more than wall_budget seconds, see Watchdog; the
+    # stalls are only detected for units with --stats_dump_period
+    def enable_watchdog(self, stall_timeout = 3600, wall_budget = None, overrun_factor = 3):
+        from .Watchdog import Watchdog
+        self.watchdog = Watchdog(stall_timeout, wall_budget, self.runtime_history, overrun_factor)
+
+    # transient failures (see FailureClassifier) are retried up to max_retries
+    # times, backoff seconds after the failure and backoff_factor times longer
+    # at each retry; max_retries = 0 disables the retries
+    def set_retry_policy(self, max_retries = 2, backoff = 60, backoff_factor = 2):
+        self.retry_policy_params = {"max_retries": max_retries, "backoff": backoff, "backoff_factor": backoff_factor}
+
+    # packs the output files of each finished unit into a random-access zstd
+    # archive, see gem5_stats_utils/OutputArchive (requires zstandard)
+    def enable_output_archive(self, level = 3):
+        import gem5_stats_utils.OutputArchive
+        self.output_archive_level = level
+
+    def __pack_output(self, unit):
+        from gem5_stats_utils.OutputArchive import pack_output
+        if unit.status == "finished":
+            pack_output(unit.gem5_output_path, level = self.output_archive_level)
+
+    # old output dirs are always deleted in the background, this keeps the
+    # keep_generations previous outputs of each unit under
+    # <sweep dir>/.recycled/generations, the oldest are deleted while the
+    # sweep, live outputs included, takes more than byte_budget bytes, see
+    # OutputRecycler
+    def enable_output_generations(self, keep_generations, byte_budget = None):
+        self.keep_generations = keep_generations
+        self.byte_budget = byte_budget
+
+    # units already simulated with the same binary, config, parameters and
+    # disk image, by any sweep using the same cache_path, are linked from the
+    # cache instead of being launched, see ResultCache
+    def enable_result_cache(self, cache_path):
+        from .ResultCache import ResultCache
+        self.result_cache = ResultCache(cache_path)
+
+    def __try_restore_from_cache(self, unit, output_recycler):
+        entry_path = self.result_cache.lookup(unit)
+        if entry_path is None or not self.result_cache.restore(unit, entry_path, output_recycler):
+            return False
+        self.sweep_indices.record(unit)
+        if self.results_store is not None:
+            self.__add_to_results_store(unit)
+        return True
+
+    # returns the units that still have to be launched
+    def __restore_from_cache(self, units, output_recycler):
+        restored = set(unit.uuid for unit in units if self.__try_restore_from_cache(unit, output_recycler))
+        if not restored:
+            return units
+        units = [unit for unit in units if not unit.uuid in restored]
+        for unit in units:
+            unit.depends_on = [uuid for uuid in unit.depends_on if not uuid in restored]
+        # no need to take a checkpoint that nobody is going to restore
+        dependencies = set(uuid for unit in units for uuid in unit.depends_on)
+        units = [unit for unit in units if unit.metadata.get("checkpoint-stage", None) != "take" or unit.uuid in dependencies]
+        print("Info:", len(restored), "units are restored from the result cache")
+        return units
+
+    # hostSeconds, hostInstRate, ... of the run, see gem5_stats_utils/SimThroughput
+    def __record_sim_throughput(self, unit):
+        from gem5_stats_utils.SimThroughput import get_sim_throughput
+        if unit.status == "finished":
+            unit.sim_throughput = get_sim_throughput(unit.gem5_output_path)
+            unit.save_info()
+
+    def __get_units_to_launch(self, run_if_failed = False, run_if_already_run = True):
+        if self.checkpoint_path_prefix is not None and len(self.lazy_unit_sources) > len(self.feedback_sources):
+            print("Warn: boot checkpoints group all the units, the lazily added units are materialized")
+            for units in self.lazy_unit_sources:
+                if not units in self.feedback_sources:
+                    self.experiment_units.extend(units)
+            self.lazy_unit_sources = list(self.feedback_sources)
+        units = self.experiment_units
+        if self.verify_disk_images:
+            mismatched = verify_disk_images(units)
+            if mismatched:
+                n_units = len(units)
+                units = [unit for unit in units if not unit.metadata.get("disk-image-path", None) in mismatched]
+                print("Error:", n_units - len(units), "units use a disk image that is not the expected one and are not launched")
+        if self.checkpoint_path_prefix is not None:
+            units = add_checkpoint_stage(units, self.checkpoint_path_prefix, self.boot_keys)
+        if not run_if_already_run:
+            n_units = len(units)
+            units = [unit for unit in units if self.sweep_indices.get(unit).is_runnable(unit, run_if_failed)]
+            # no need to take a checkpoint that nobody is going to restore
+            dependencies = set(uuid for unit in units for uuid in unit.depends_on)
+            units = [unit for unit in units if unit.metadata.get("checkpoint-stage", None) != "take" or unit.uuid in dependencies]
+            print("Info:", n_units - len(units), "units are not launchable and are skipped")
+        # predicted-longest units first to cut the tail of the sweep
+        return self.runtime_history.sort_longest_first(units)
+
+    # __get_units_to_launch() and __restore_from_cache() one unit at a time
+    # for the units added lazily, the units that are yielded are appended to
+    # yielded_units
+    def __iter_lazy_units(self, yielded_units, run_if_failed = False, run_if_already_run = True, output_recycler = None, restore_from_cache = False):
+        # (disk image path, expected md5sum) -> whether it matched
+        image_checks = {}
+        for units in self.lazy_unit_sources:
+            for unit in units:
+                if unit is None:
+                    # nothing available yet, see Supervisor
+                    yield None
+                    continue
+                image = (unit.metadata.get("disk-image-path", None), unit.metadata.get("disk-image-md5sum", None))
+                if self.verify_disk_images and not None in image:
+                    if not image in image_checks:
+                        image_checks[image] = is_expected_image(*image)
+                    if not image_checks[image]:
+                        continue
+                if (not run_if_already_run and not self.sweep_indices.get(unit).is_runnable(unit, run_if_failed)) \
+                   or (restore_from_cache and self.__try_restore_from_cache(unit, output_recycler)):
+                    # the outputs are there, the feedback sources take them as results
+                    for source in self.feedback_sources:
+                        source.on_finish(unit)
+                    continue
+                yielded_units.append(unit)
+                yield unit
+
+    def __record_runtime(self, unit):
+        if unit.return_code == 0 and unit.run_time >= 0:
+            self.runtime_history.record(unit, unit.run_time)
+
+    # n_processes is an upper bound on the concurrency, the actual number of
+    # running units is limited by the memory and cores demanded by the units.
+    # See Supervisor for timeout and concurrency_file, and
+    # ExperimentUnit.try_launch for run_if_failed and run_if_already_run.
+    # Returns True if the launch was cancelled (Ctrl-C or SIGTERM), the
+    # summaries are then not printed.
+    def launch(self, n_processes, resource_scheduler = None, timeout = None, concurrency_file = None, run_if_failed = False, run_if_already_run = True):
+        output_recycler = OutputRecycler(self.keep_generations, self.byte_budget)
+        supervisor = Supervisor(max_concurrency = n_processes,
+                                resource_scheduler = resource_scheduler,
+                                timeout = timeout,
+                                concurrency_file = concurrency_file,
+                                output_recycler = output_recycler)
+        supervisor.add_finish_hook(self.__record_runtime)
+        sim_throughput = None
+        try:
+            import gem5_stats_utils.SimThroughput as sim_throughput
+            supervisor.add_finish_hook(self.__record_sim_throughput)
+        except ImportError as e:
+            print("Warn: the simulation throughput is not recorded:", e)
+        # also records the launches, cancellations and skips, so that a unit
+        # whose old outputs were recycled is not taken as done
+        supervisor.add_status_hook(self.sweep_indices.record)
+        if self.results_store is not None:
+            supervisor.add_finish_hook(self.__add_to_results_store)
+        if self.stats_tail is not None:
+            self.stats_tail.attach(supervisor)
+        if self.watchdog is not None:
+            self.watchdog.attach(supervisor)
+        RetryPolicy(**self.retry_policy_params).attach(supervisor)
+        if self.result_cache is not None:
+            supervisor.add_finish_hook(self.result_cache.store)
+        for source in self.feedback_sources:
+            source.attach(supervisor)
+        # last, the hooks above read the output files
+        if self.output_archive_level is not None:
+            supervisor.add_finish_hook(self.__pack_output)
+
+        units = self.__get_units_to_launch(run_if_failed, run_if_already_run)
+        units_to_run = units
+        lazy_units = []
+        cancelled = False
+        try:
+            if self.result_cache is not None:
+                units_to_run = self.__restore_from_cache(units, output_recycler)
+            cancelled = supervisor.run(itertools.chain(units_to_run, self.__iter_lazy_units(lazy_units, run_if_failed, run_if_already_run, output_recycler,
+                                                                                restore_from_cache = self.result_cache is not None)))
+        finally:
+            self.sweep_indices.flush()
+            self.runtime_history.save()
+            if self.results_store is not None:
+                self.results_store.flush()
+            output_recycler.close()
+        if cancelled:
+            print("Warn: the launch was cancelled, the cancelled units are relaunched by the next launch")
+            return True
+        units = units + lazy_units
+        print_failure_summary(units)
+        infos = [unit.to_dict() for unit in units if unit.telemetry]
+        print_telemetry_summary(infos)
+        if sim_throughput is not None:
+            sim_throughput.print_sim_throughput_summary(infos)
+        return False
+
+    # distributed mode: the units are written to a shared work queue instead
+    # of being launched, see WorkQueue for how to start workers on each host
+    def submit_to_queue(self, queue_dir):
+        if self.feedback_sources:
+            print("Error: adaptive searches and simpoint pipelines need the results of their units and cannot be submitted to a queue, they are left out")
+            self.lazy_unit_sources = [source for source in self.lazy_unit_sources if not source in self.feedback_sources]
+        units = self.__get_units_to_launch()
+        lazy_units = []
+        WorkQueue(queue_dir).put(itertools.chain(units, self.__iter_lazy_units(lazy_units)))
+        print("Info: submitted", len(units) + len(lazy_units), "units to", queue_dir)
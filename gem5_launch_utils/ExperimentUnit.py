@@ -4,11 +4,15 @@ import json
 import shutil
 import subprocess
 import shlex
+import resource
 import time
 
 from pprint import pprint
 from pathlib import Path
-from filelock import FileLock, Timeout
+
+from .FailureClassifier import classify_failure
+from .HashCache import get_file_hash
+from .HostTelemetry import get_children_rusage_telemetry
 
 """
     This class is mainly for sanity checking rather than archiving information.
@@ -19,17 +23,20 @@ class ExperimentUnit:
         for key, val in src.items():
             dst[key] = val
 
-    def __get_md5sum(filepath):
-        filepath = str(filepath)
-        process_info = subprocess.run(["md5sum", filepath], capture_output=True)
+    # cached across processes by (path, inode, size, mtime), see HashCache.py
+    def get_md5sum(filepath):
         md5sum = "-1"
-        if process_info.returncode == 0:
-            md5sum = process_info.stdout.strip().split()[0].decode()
-        else:
+        try:
+            md5sum = get_file_hash(filepath, "md5")
+        except OSError:
             print("Warn: md5sum failed for", filepath)
         return md5sum
 
-    def __init__(self, gem5_binary_path, gem5_config_path, gem5_output_path, gem5_params, config_params, env):
+    # estimated_memory (bytes) and estimated_cores are used for admission
+    # control, None means the scheduler's default
+    # timeout is the wall-clock limit in seconds, None means no limit
+    # depends_on is a list of uuids of units that must succeed before this one
+    def __init__(self, gem5_binary_path, gem5_config_path, gem5_output_path, gem5_params, config_params, env, estimated_memory = None, estimated_cores = None, timeout = None, depends_on = None):
         self.gem5_binary_path = gem5_binary_path
         self.gem5_config_path = gem5_config_path
         self.gem5_output_path = gem5_output_path
@@ -41,20 +48,51 @@ class ExperimentUnit:
         self.metadata = {}
         self.return_code = -1
         self.launch_time = -1
+        self.run_time = -1
+        self.termination_reason = None
+        self.telemetry = None
+        self.sim_throughput = None
+        self.failure_class = None
+        self.failure_evidence = None
+        # convergence.json of configs that end the ROI once converged
+        self.convergence = None
+        self.retries = 0
+        # output folder the outputs were linked from, see ResultCache
+        self.cached_from = None
         self.env = {}
         ExperimentUnit.__copy_one_level_dict(env, self.env)
+        self.estimated_memory = estimated_memory
+        self.estimated_cores = estimated_cores
+        self.timeout = timeout
+        self.depends_on = [] if depends_on is None else list(depends_on)
 
-        self.gem5_binary_hash = ExperimentUnit.__get_md5sum(self.gem5_binary_path)
+        self.gem5_binary_hash = ExperimentUnit.get_md5sum(self.gem5_binary_path)
 
     def init_from_ExperimentUnit(other):
-        unit = ExperimentUnit(other.gem5_binary_path, other.gem5_config_path, other.gem5_output_path, other.gem5_params, other.config_params, env)
+        unit = ExperimentUnit(other.gem5_binary_path, other.gem5_config_path, other.gem5_output_path, other.gem5_params, other.config_params, other.env, other.estimated_memory, other.estimated_cores, other.timeout, other.depends_on)
         unit.uuid = other.uuid
         unit.metadata = {}
         ExperimentUnit.__copy_one_level_dict(other.metadata, unit.metadata)
         unit.return_code = other.return_code
         unit.launch_time = other.launch_time
+        unit.run_time = other.run_time
+        unit.termination_reason = other.termination_reason
+
+        return unit
+
+    # the inverse of the info.json dump, does not re-hash the gem5 binary
+    def init_from_dict(d):
+        unit = ExperimentUnit.__new__(ExperimentUnit)
+        # fields that older info.json files might not have
+        unit.__dict__.update({"estimated_memory": None, "estimated_cores": None, "timeout": None,
+                              "run_time": -1, "termination_reason": None, "depends_on": [], "telemetry": None,
+                              "sim_throughput": None, "failure_class": None, "failure_evidence": None, "convergence": None, "retries": 0,
+                              "cached_from": None})
+        unit.__dict__.update(d)
+        return unit
 
-        unit.gem5_binary_hash = ExperimentUnit.__get_md5sum(unit.gem5_binary_path)
+    def to_dict(self):
+        return json.loads(self.__to_JSON_str())
 
     def add_metadata(self, key, val):
         self.metadata[key] = val
@@ -69,11 +107,16 @@ class ExperimentUnit:
                 params_list.append(val)
         return params_list
 
-    def __launch(self):
+    # The launch is split into steps so that a supervisor can run the gem5
+    # process itself, __launch() is the blocking version of the same steps.
+    # output_recycler (see OutputRecycler) moves the old output dir away
+    # instead of removing it here
+    def prepare_launch(self, output_recycler = None):
         # remove old output dir
         dirpath = Path(self.gem5_output_path)
         if dirpath.exists() and dirpath.is_dir():
-            shutil.rmtree(dirpath)
+            if output_recycler is None or not output_recycler.recycle(dirpath):
+                shutil.rmtree(dirpath)
         elif dirpath.exists() and not dirpath.is_dir():
             print("Error:", dirpath, "exists and not a directory.")
             return False
@@ -81,55 +124,108 @@ class ExperimentUnit:
 
         self.status = "running"
         self.__dump_info()
+        return True
 
-        # launch the experiment
+    def get_command(self):
         gem5_params_list = ExperimentUnit.__params_dict_to_list(self.gem5_params)
         config_params_list = ExperimentUnit.__params_dict_to_list(self.config_params)
+        return [self.gem5_binary_path] + gem5_params_list + [self.gem5_config_path] + config_params_list
 
-        stdout_path = Path(self.gem5_output_path) / 'run_stdout'
-        stderr_path = Path(self.gem5_output_path) / 'run_stderr'
-        assert(stdout_path != stderr_path)
-        env = {**os.environ, **self.env}
+    def get_env(self):
+        return {**os.environ, **self.env}
 
-        command = [self.gem5_binary_path] + gem5_params_list + [self.gem5_config_path] + config_params_list
+    def get_stdout_path(self):
+        return Path(self.gem5_output_path) / 'run_stdout'
 
-        with open(stdout_path, "w") as f:
-            with open(stderr_path, "w") as g:
-                process_info = subprocess.run(command, stdout=f, stderr=g, env=env)
-        self.return_code = process_info.returncode
+    def get_stderr_path(self):
+        return Path(self.gem5_output_path) / 'run_stderr'
+
+    def start_launch(self):
+        self.launch_time = time.time()
+
+    # telemetry is the host cost of the run, see HostTelemetry
+    def finish_launch(self, return_code, status = "finished", termination_reason = None, telemetry = None):
+        self.return_code = return_code
+        self.run_time = time.time() - self.launch_time
+        self.termination_reason = termination_reason
+        self.telemetry = telemetry
+
+        # written by configs that end the ROI once the bandwidth converged
+        self.convergence = None
+        convergence_path = Path(self.gem5_output_path) / 'convergence.json'
+        if convergence_path.exists():
+            try:
+                with open(convergence_path, "r") as f:
+                    self.convergence = json.load(f)
+            except (OSError, json.JSONDecodeError):
+                print("Warn: failed to read", convergence_path)
+
+        self.status = status
+        self.failure_class, self.failure_evidence = classify_failure(self)
 
         # dump information
-        self.status = "finished"
         self.__dump_info()
 
+    # the unit will not be launched, e.g. because a dependency failed
+    def skip_launch(self, reason):
+        dirpath = Path(self.gem5_output_path)
+        if dirpath.exists() and not dirpath.is_dir():
+            print("Error:", dirpath, "exists and not a directory.")
+            return
+        dirpath.mkdir(parents=True, exist_ok=True)
+        self.termination_reason = reason
+        self.status = "skipped"
+        self.__dump_info()
+
+    def __launch(self):
+        if not self.prepare_launch():
+            return False
+
+        # launch the experiment
+        stdout_path = self.get_stdout_path()
+        stderr_path = self.get_stderr_path()
+        assert(stdout_path != stderr_path)
+
+        self.start_launch()
+        rusage_before = resource.getrusage(resource.RUSAGE_CHILDREN)
+        with open(stdout_path, "w") as f:
+            with open(stderr_path, "w") as g:
+                process_info = subprocess.run(self.get_command(), stdout=f, stderr=g, env=self.get_env())
+        telemetry = get_children_rusage_telemetry(rusage_before, resource.getrusage(resource.RUSAGE_CHILDREN))
+        telemetry["wall_time"] = time.time() - self.launch_time
+        self.finish_launch(process_info.returncode, telemetry = telemetry)
+
     def __to_JSON_str(self):
         return json.dumps(self,
                           default=lambda o: o.__dict__,
                           sort_keys=True,
                           indent=4)
 
+    # rewrites info.json, e.g. after a finish hook added results to the unit
+    def save_info(self):
+        self.__dump_info()
+
+    # info.json is replaced as a whole with a rename, so that readers always
+    # see either the previous or the new record, without a lock file (slow on
+    # NFS). The temporary file is per process, in case two processes write the
+    # same unit.
     def __dump_info(self):
         output_path = Path(self.gem5_output_path)
         info_file = output_path / 'info.json'
-        info_json_path_lock = output_path / 'info.json.lock'
-        try:
-            lock = FileLock(info_json_path_lock)
-            with lock.acquire(timeout=120):
-                with open(info_file, "w") as f:
-                    # https://stackoverflow.com/questions/3768895/how-to-make-a-class-json-serializable
-                    json.dump(self, f,
-                              default=lambda o: o.__dict__,
-                              sort_keys=True,
-                              indent=4)
-                    lock.release()
-        except Timeout:
-            print("Error: __dump_info failed to acquire the lock for file", info_file)
-            exit(1)
+        tmp_path = output_path / f".info.json.{os.getpid()}.tmp"
+        with open(tmp_path, "w") as f:
+            # https://stackoverflow.com/questions/3768895/how-to-make-a-class-json-serializable
+            json.dump(self, f,
+                      default=lambda o: o.__dict__,
+                      sort_keys=True,
+                      separators=(",", ":"))
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp_path, info_file)
 
     def __is_runnable(self, run_if_failed):
         output_path = Path(self.gem5_output_path)
         info_json_path = output_path / 'info.json'
-        info_json_path_lock = output_path / 'info.json.lock'
 
         if not output_path.exists():
             return True
@@ -138,52 +234,45 @@ class ExperimentUnit:
             return True
 
         try:
-            lock = FileLock(info_json_path_lock)
-            with lock.acquire(timeout=120):
-                with open(info_json_path, "r") as f:
-                    j = json.load(f)
-                    if not "return_code" in j:
-                        print("Warn: \"return_code\" not found for", info_json_path)
-                        lock.release()
-                        return True
-                    if not "status" in j:
-                        print("Warn: \"status\" not found for", info_json_path)
-                        lock.release()
-                        return True
-                    if j["status"] == "running" or j["status"] == "finished":
-                        lock.release()
-                        return False
-                    if j["return_code"] == "0":
-                        diff = []
-                        if not self.gem5_binary_path == j["gem5_binary_path"]:
-                            diff.append("gem5_binary_path", self.gem5_binary_path, j["gem5_binary_path"])
-                        elif not self.gem5_output_path == j["gem5_output_path"]:
-                            diff.append("gem5_output_path", self.gem5_output_path, j["gem5_output_path"])
-                        elif not self.gem5_params == j["gem5_params"]:
-                            diff.append("gem5_params", self.gem5_params, j["gem5_params"])
-                        elif not self.gem5_binary_hash == j["gem5_binary_hash"]:
-                            diff.append("gem5_binary_hash", self.gem5_binary_hash, j["gem5_binary_hash"])
-                        elif not self.metadata == j["metadata"]:
-                            diff.append("metadata", self.metadata, j["metadata"])
-                        if len(diff) > 0:
-                            print("Warn: Not rerun an experiment but different information")
-                            pprint(diff)
-                            lock.release()
-                        return False
-                    else:
-                        lock.release()
-                        return run_if_failed
-        except Timeout:
-            print("Warn: failed to acquire the lock for file", info_json_path)
+            with open(info_json_path, "r") as f:
+                j = json.load(f)
+        except json.JSONDecodeError:
+            # written by a version that did not replace it atomically
+            print("Warn: failed to parse", info_json_path)
+            return run_if_failed
+        if not "return_code" in j:
+            print("Warn: \"return_code\" not found for", info_json_path)
+            return True
+        if not "status" in j:
+            print("Warn: \"status\" not found for", info_json_path)
+            return True
+        if j["status"] == "running" or j["status"] == "finished":
             return False
+        if j["return_code"] == "0":
+            diff = []
+            if not self.gem5_binary_path == j["gem5_binary_path"]:
+                diff.append(("gem5_binary_path", self.gem5_binary_path, j["gem5_binary_path"]))
+            elif not self.gem5_output_path == j["gem5_output_path"]:
+                diff.append(("gem5_output_path", self.gem5_output_path, j["gem5_output_path"]))
+            elif not self.gem5_params == j["gem5_params"]:
+                diff.append(("gem5_params", self.gem5_params, j["gem5_params"]))
+            elif not self.gem5_binary_hash == j["gem5_binary_hash"]:
+                diff.append(("gem5_binary_hash", self.gem5_binary_hash, j["gem5_binary_hash"]))
+            elif not self.metadata == j["metadata"]:
+                diff.append(("metadata", self.metadata, j["metadata"]))
+            if len(diff) > 0:
+                print("Warn: Not rerun an experiment but different information")
+                pprint(diff)
+            return False
+        return run_if_failed
 
-        return False
-
-    def try_launch(self, run_if_failed = False, run_if_already_run = True):
+    def should_launch(self, run_if_failed = False, run_if_already_run = True):
         if run_if_already_run:
-            return self.__launch()
+            return True
+        return self.__is_runnable(run_if_failed)
 
-        runnable = self.__is_runnable(run_if_failed)
+    def try_launch(self, run_if_failed = False, run_if_already_run = True):
+        runnable = self.should_launch(run_if_failed, run_if_already_run)
 
         if runnable:
             return self.__launch()
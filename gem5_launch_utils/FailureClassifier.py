@@ -0,0 +1,158 @@
+import json
+import re
+import signal
+import time
+from pathlib import Path
+
+"""
+    Why a unit failed, and what to do about it.
+
+    classify_failure() looks at the return code (a negative return code is
+    the signal that killed gem5), the termination reason and the tails of
+    run_stderr, simerr and the guest terminal, and returns a failure class
+    and the line it was recognized by, e.g. ("panic", "panic: ...").
+
+    Transient classes (the host ran out of memory or disk, or hit an I/O error) are
+    worth another try; RetryPolicy relaunches those units with an exponential
+    backoff, and lowers the concurrency on memory failures. The other classes
+    are deterministic and would fail again the same way: these units, and
+    those out of retries, are quarantined, i.e. not retried and listed in
+        <sweep dir>/quarantine.jsonl
+    for triage. print_failure_summary() is printed at the end of a launch.
+"""
+
+# (class, pattern), the first match wins
+stderr_patterns = [
+    ("out_of_memory", re.compile(rb"std::bad_alloc|Cannot allocate memory|[Oo]ut of memory|MemoryError")),
+    ("disk_full", re.compile(rb"No space left on device|Disk quota exceeded")),
+    ("host_io", re.compile(rb"Stale file handle|Too many open files|Resource temporarily unavailable|Input/output error")),
+    ("panic", re.compile(rb"\bpanic: .*")),
+    ("fatal", re.compile(rb"(?m)^fatal: .*")),
+    ("guest_panic", re.compile(rb"Kernel panic - not syncing.*")),
+    ("config_error", re.compile(rb"Traceback \(most recent call last\)")),
+]
+
+transient_classes = ["out_of_memory", "killed", "disk_full", "host_io"]
+memory_classes = ["out_of_memory", "killed"]
+# not failures of the simulation
+benign_classes = ["cancelled", "requested"]
+
+# the files are scanned from their end
+scanned_filenames = ["run_stderr", "simerr", "board.terminal", "system.terminal"]
+scanned_tail_size = 2**16
+quarantine_filename = "quarantine.jsonl"
+
+def _read_tail(path):
+    try:
+        with open(path, "rb") as f:
+            f.seek(0, 2)
+            size = f.tell()
+            f.seek(max(0, size - scanned_tail_size))
+            return f.read()
+    except OSError:
+        return b""
+
+def _get_line(data, match):
+    start = data.rfind(b"\n", 0, match.start()) + 1
+    end = data.find(b"\n", match.end())
+    if end == -1:
+        end = len(data)
+    return data[start:end].decode(errors = "replace").strip()[:200]
+
+# returns (failure class, evidence), (None, None) if the unit did not fail
+def classify_failure(unit):
+    if unit.status == "cancelled":
+        return "cancelled", None
+    if unit.return_code == 0:
+        return None, None
+    if unit.termination_reason == "timeout":
+        return "timeout", None
+    if unit.termination_reason:
+        # terminated by the watchdog, see Watchdog
+        if unit.termination_reason.startswith("stalled:"):
+            return "hang", unit.termination_reason
+        if unit.termination_reason.startswith("over budget:"):
+            return "over_budget", unit.termination_reason
+        # asked to stop by a hook, e.g. converged
+        return "requested", unit.termination_reason
+
+    tails = [_read_tail(Path(unit.gem5_output_path) / filename) for filename in scanned_filenames]
+    for failure_class, pattern in stderr_patterns:
+        for data in tails:
+            match = pattern.search(data)
+            if match is not None:
+                return failure_class, _get_line(data, match)
+
+    if unit.return_code == -signal.SIGKILL:
+        # nobody here sent it, most likely the kernel's OOM killer
+        return "killed", "SIGKILL"
+    if unit.return_code < 0:
+        try:
+            return "crash", signal.Signals(-unit.return_code).name
+        except ValueError:
+            return "crash", str(unit.return_code)
+    return "unknown", f"return code {unit.return_code}"
+
+def is_transient(failure_class):
+    return failure_class in transient_classes
+
+class RetryPolicy:
+    def __init__(self, max_retries = 2, backoff = 60, backoff_factor = 2, concurrency_factor = 0.75):
+        self.max_retries = max_retries
+        self.backoff = backoff
+        self.backoff_factor = backoff_factor
+        self.concurrency_factor = concurrency_factor
+        self.supervisor = None
+        self.retried = []
+        self.quarantined = []
+
+    def attach(self, supervisor):
+        self.supervisor = supervisor
+        supervisor.add_finish_hook(self.on_finish)
+
+    def on_finish(self, unit):
+        failure_class = unit.failure_class
+        if failure_class is None or failure_class in benign_classes:
+            return
+        if is_transient(failure_class) and unit.retries < self.max_retries:
+            delay = self.backoff * self.backoff_factor ** unit.retries
+            unit.retries += 1
+            print("Warn:", unit.gem5_output_path, "failed with", failure_class + ", retry", unit.retries, "of", self.max_retries, "in", delay, "seconds")
+            if failure_class in memory_classes:
+                max_concurrency = max(1, int(self.supervisor.max_concurrency * self.concurrency_factor))
+                if max_concurrency < self.supervisor.max_concurrency:
+                    print("Info: lowering the maximum concurrency from", self.supervisor.max_concurrency, "to", max_concurrency)
+                    self.supervisor.set_max_concurrency(max_concurrency)
+            self.retried.append(unit)
+            self.supervisor.resubmit(unit, delay)
+            return
+        # deterministic, or transient but out of retries
+        self.quarantine(unit)
+
+    def quarantine(self, unit):
+        self.quarantined.append(unit)
+        record = {"gem5_output_path": str(unit.gem5_output_path),
+                  "uuid": unit.uuid,
+                  "failure_class": unit.failure_class,
+                  "failure_evidence": unit.failure_evidence,
+                  "return_code": unit.return_code,
+                  "time": time.time()}
+        quarantine_path = Path(unit.gem5_output_path).parent / quarantine_filename
+        with open(quarantine_path, "a") as f:
+            f.write(json.dumps(record, sort_keys=True) + "\n")
+
+def print_failure_summary(units, n_examples = 3):
+    failures = {}
+    for unit in units:
+        failure_class = getattr(unit, "failure_class", None)
+        if failure_class is None:
+            continue
+        failures.setdefault(failure_class, []).append(unit)
+    if not failures:
+        return
+    print("Info: failures by class")
+    for failure_class, failed_units in sorted(failures.items(), key = lambda item: len(item[1]), reverse = True):
+        kind = "" if failure_class in benign_classes else "quarantined"
+        print(f"    {failure_class:<16} {len(failed_units):>6} {kind}")
+        for unit in failed_units[:n_examples]:
+            print("        " + str(unit.gem5_output_path) + (": " + unit.failure_evidence if unit.failure_evidence else ""))
@@ -0,0 +1,79 @@
+import hashlib
+import mmap
+import os
+import sqlite3
+from pathlib import Path
+
+"""
+    A cache of file digests shared by all launchers of a user.
+
+    Entries are keyed by (path, inode, size, mtime_ns, algorithm), so a
+    rebuilt gem5 binary or a modified disk image is re-hashed, anything else
+    is a single SQLite lookup. SQLite serializes concurrent writers; the
+    database lives in /tmp of each host, as SQLite locking (and WAL, which
+    needs shared memory) is not safe on NFS, where the home directories of
+    the workers of several hosts usually are. Any SQLite error falls back to
+    hashing the file without the cache.
+
+    On a miss the file is hashed in-process through mmap. md5 is the default
+    so that the digests stay comparable with the md5sums recorded in the
+    launchers and in existing info.json files; blake2b is faster for new
+    uses.
+"""
+
+default_hash_cache_path = Path("/tmp") / f"gem5_launch_utils-{os.getuid()}" / "file_hashes.sqlite"
+
+def hash_file(filepath, algorithm = "md5"):
+    h = hashlib.new(algorithm)
+    with open(filepath, "rb") as f:
+        if os.fstat(f.fileno()).st_size == 0:
+            return h.hexdigest()
+        with mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as data:
+            # hash in chunks, hashlib releases the GIL for large updates
+            chunk_size = 2**24
+            for offset in range(0, len(data), chunk_size):
+                h.update(data[offset:offset + chunk_size])
+    return h.hexdigest()
+
+class HashCache:
+    def __init__(self, path = default_hash_cache_path):
+        self.path = Path(path)
+        self.path.parent.mkdir(mode=0o700, parents=True, exist_ok=True)
+        self.connection = sqlite3.connect(str(self.path), timeout=60)
+        self.connection.execute("PRAGMA journal_mode=WAL")
+        self.connection.execute("""CREATE TABLE IF NOT EXISTS file_hashes (
+                                       path TEXT, inode INTEGER, size INTEGER, mtime_ns INTEGER,
+                                       algorithm TEXT, digest TEXT,
+                                       PRIMARY KEY (path, algorithm))""")
+        self.connection.commit()
+
+    def get_hash(self, filepath, algorithm = "md5"):
+        filepath = str(Path(filepath).absolute())
+        st = os.stat(filepath)
+        row = self.connection.execute("SELECT inode, size, mtime_ns, digest FROM file_hashes WHERE path = ? AND algorithm = ?",
+                                      (filepath, algorithm)).fetchone()
+        if row is not None and tuple(row[:3]) == (st.st_ino, st.st_size, st.st_mtime_ns):
+            return row[3]
+        digest = hash_file(filepath, algorithm)
+        with self.connection:
+            self.connection.execute("INSERT OR REPLACE INTO file_hashes VALUES (?, ?, ?, ?, ?, ?)",
+                                    (filepath, st.st_ino, st.st_size, st.st_mtime_ns, algorithm, digest))
+        return digest
+
+# one connection per process, a connection must not be used across fork()
+_hash_cache = None
+_hash_cache_pid = None
+
+def get_hash_cache():
+    global _hash_cache, _hash_cache_pid
+    if _hash_cache is None or _hash_cache_pid != os.getpid():
+        _hash_cache = HashCache()
+        _hash_cache_pid = os.getpid()
+    return _hash_cache
+
+def get_file_hash(filepath, algorithm = "md5"):
+    try:
+        return get_hash_cache().get_hash(filepath, algorithm)
+    except sqlite3.Error as e:
+        print("Warn: the hash cache failed (" + repr(e) + "), hashing", filepath, "without it")
+        return hash_file(filepath, algorithm)
@@ -0,0 +1,209 @@
+import argparse
+import asyncio
+import json
+import os
+import signal
+import time
+from pathlib import Path
+
+"""
+    What a unit cost the host.
+
+    The supervisor spawns gem5 as a ChildProcess instead of an asyncio
+    subprocess, so that it can reap it with os.wait4() and get its rusage:
+    user/sys CPU time, peak RSS, page faults and block I/O. While gem5 runs,
+    /proc/<pid>/status and /proc/<pid>/io are sampled every sample_interval
+    seconds for the RSS and the bytes read/written, which rusage does not
+    have. The result is unit.telemetry, e.g.
+        {"wall_time": 3605.2, "user_time": 3580.1, "sys_time": 12.3,
+         "max_rss_bytes": 9876543210, "major_faults": 12, "minor_faults": 2345678,
+         "block_read_bytes": 4096, "block_write_bytes": 123456,
+         "read_bytes": 4096, "write_bytes": 123456, "rchar": 1234567, "wchar": 7654321}
+    and is written to info.json.
+
+    summarize_telemetry() groups the units of a sweep, by default by
+    (workload, vlen, num_ccds), to see which combinations dominate the cost:
+        python3 -m gem5_launch_utils.HostTelemetry <sweep dir>
+"""
+
+default_summary_keys = ["workload-naming-string", "vlen", "num_ccds"]
+
+def get_rusage_telemetry(rusage):
+    return {"user_time": rusage.ru_utime,
+            "sys_time": rusage.ru_stime,
+            # kilobytes on Linux
+            "max_rss_bytes": rusage.ru_maxrss * 1024,
+            "major_faults": rusage.ru_majflt,
+            "minor_faults": rusage.ru_minflt,
+            # 512-byte blocks
+            "block_read_bytes": rusage.ru_inblock * 512,
+            "block_write_bytes": rusage.ru_oublock * 512}
+
+# for the blocking launch: the rusage of the children that ended between
+# before and after, the peak RSS is the one of the largest child
+def get_children_rusage_telemetry(before, after):
+    telemetry = get_rusage_telemetry(after)
+    for key, val in get_rusage_telemetry(before).items():
+        if key != "max_rss_bytes":
+            telemetry[key] -= val
+    return telemetry
+
+def _read_proc_fields(path):
+    fields = {}
+    try:
+        with open(path, "r") as f:
+            for line in f:
+                key, _, val = line.partition(":")
+                fields[key] = val.split()[0] if val.split() else None
+    except (OSError, ValueError):
+        pass
+    return fields
+
+class ChildProcess:
+    def __init__(self, command, env, stdout_path, stderr_path, sample_interval = 10):
+        self.sample_interval = sample_interval
+        self.returncode = None
+        self.rusage = None
+        self.start_time = time.time()
+        self.end_time = None
+        self.last_sample = 0
+        self.io = {}
+        self.peak_rss_bytes = 0
+        with open(stdout_path, "w") as f:
+            with open(stderr_path, "w") as g:
+                # a new session keeps the terminal's SIGINT away from gem5,
+                # the supervisor is the one deciding how children die
+                self.pid = os.posix_spawnp(command[0], command, env,
+                                           file_actions = [(os.POSIX_SPAWN_DUP2, f.fileno(), 1),
+                                                           (os.POSIX_SPAWN_DUP2, g.fileno(), 2)],
+                                           setsid = True)
+        self.pidfd = None
+        if hasattr(os, "pidfd_open"):
+            try:
+                self.pidfd = os.pidfd_open(self.pid)
+            except OSError:
+                pass
+
+    def __try_reap(self):
+        if self.returncode is not None:
+            return True
+        try:
+            pid, status, rusage = os.wait4(self.pid, os.WNOHANG)
+        except ChildProcessError:
+            print("Warn: the process", self.pid, "was reaped by someone else")
+            self.returncode = -1
+            pid, status, rusage = self.pid, None, None
+        if pid == 0:
+            return False
+        self.end_time = time.time()
+        if status is not None:
+            self.returncode = os.waitstatus_to_exitcode(status)
+        self.rusage = rusage
+        if self.pidfd is not None:
+            os.close(self.pidfd)
+            self.pidfd = None
+        return True
+
+    async def wait(self):
+        loop = asyncio.get_running_loop()
+        while not self.__try_reap():
+            if self.pidfd is None:
+                await asyncio.sleep(0.5)
+                continue
+            # the pidfd becomes readable when the process exits
+            future = loop.create_future()
+            loop.add_reader(self.pidfd, lambda: future.done() or future.set_result(None))
+            try:
+                await future
+            finally:
+                loop.remove_reader(self.pidfd)
+        return self.returncode
+
+    def send_signal(self, sig):
+        # once reaped, the pid might belong to another process; the process
+        # is the leader of its own session, so its children get it too
+        if self.returncode is None:
+            try:
+                os.killpg(self.pid, sig)
+            except ProcessLookupError:
+                pass
+
+    def terminate(self):
+        self.send_signal(signal.SIGTERM)
+
+    def kill(self):
+        self.send_signal(signal.SIGKILL)
+
+    def sample(self):
+        if self.returncode is not None or time.time() - self.last_sample < self.sample_interval:
+            return
+        self.last_sample = time.time()
+        status = _read_proc_fields(f"/proc/{self.pid}/status")
+        if status.get("VmHWM", None) is not None:
+            self.peak_rss_bytes = max(self.peak_rss_bytes, int(status["VmHWM"]) * 1024)
+        io = _read_proc_fields(f"/proc/{self.pid}/io")
+        if io:
+            self.io = {key: int(io[key]) for key in ["read_bytes", "write_bytes", "rchar", "wchar"] if io.get(key, None) is not None}
+
+    def get_telemetry(self):
+        telemetry = {"wall_time": (self.end_time or time.time()) - self.start_time}
+        if self.rusage is not None:
+            telemetry.update(get_rusage_telemetry(self.rusage))
+        telemetry["max_rss_bytes"] = max(telemetry.get("max_rss_bytes", 0), self.peak_rss_bytes)
+        # the last sample, bytes moved after it are missing
+        telemetry.update(self.io)
+        return telemetry
+
+# infos are info.json dicts, returns one row per group, largest CPU time first
+def summarize_telemetry(infos, keys = default_summary_keys):
+    groups = {}
+    for info in infos:
+        telemetry = info.get("telemetry", None)
+        if not telemetry:
+            continue
+        metadata = info.get("metadata", {})
+        group = tuple(metadata.get(key, None) for key in keys)
+        row = groups.setdefault(group, {"n_units": 0, "cpu_time": 0.0, "wall_time": 0.0, "max_rss_bytes": 0})
+        row["n_units"] += 1
+        row["cpu_time"] += telemetry.get("user_time", 0.0) + telemetry.get("sys_time", 0.0)
+        row["wall_time"] += telemetry.get("wall_time", 0.0)
+        row["max_rss_bytes"] = max(row["max_rss_bytes"], telemetry.get("max_rss_bytes", 0))
+    total_cpu_time = sum(row["cpu_time"] for row in groups.values()) or 1.0
+    rows = []
+    for group, row in groups.items():
+        row = dict(zip(keys, group), **row)
+        row["cpu_share"] = row["cpu_time"] / total_cpu_time
+        rows.append(row)
+    return sorted(rows, key = lambda row: row["cpu_time"], reverse = True)
+
+def print_telemetry_summary(infos, keys = default_summary_keys, n_rows = 20):
+    rows = summarize_telemetry(infos, keys)
+    if not rows:
+        return
+    print("Info: host cost per", "/".join(keys))
+    print("    " + " ".join(f"{key:>24}" for key in keys) + f" {'units':>6} {'cpu hours':>10} {'share':>6} {'mean wall h':>11} {'max rss GiB':>11}")
+    for row in rows[:n_rows]:
+        print("    " + " ".join(f"{str(row[key]):>24}" for key in keys)
+              + f" {row['n_units']:>6} {row['cpu_time'] / 3600:>10.2f} {row['cpu_share']:>6.1%}"
+              + f" {row['wall_time'] / row['n_units'] / 3600:>11.2f} {row['max_rss_bytes'] / 2**30:>11.2f}")
+
+def read_sweep_infos(sweep_path):
+    infos = []
+    for info_path in sorted(Path(sweep_path).glob("*/info.json")):
+        try:
+            with open(info_path, "r") as f:
+                infos.append(json.load(f))
+        except (OSError, json.JSONDecodeError):
+            print("Warn: failed to read", info_path)
+    return infos
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description = "Summarize the host cost of the units of sweeps")
+    parser.add_argument("sweep_paths", type=str, nargs="+", help="Directories holding output folders")
+    parser.add_argument("--keys", type=str, nargs="+", default=default_summary_keys, help="Metadata keys to group by")
+    args = parser.parse_args()
+
+    infos = []
+    for sweep_path in args.sweep_paths:
+        infos.extend(read_sweep_infos(sweep_path))
+    print_telemetry_summary(infos, args.keys, n_rows = None)
@@ -0,0 +1,202 @@
+import os
+import queue
+import shutil
+import threading
+import time
+import uuid
+from pathlib import Path
+
+"""
+    Moves old output directories out of the way instead of deleting them
+    before a (re)launch.
+
+    prepare_launch() used to rmtree the old output directory inline, which
+    for full-system outputs (checkpoints, system.terminal) keeps a slot idle
+    for minutes. With a recycler, the old directory is renamed (atomic, same
+    filesystem) into
+        <sweep dir>/.recycled/generations/<output folder>/<time_ns>/
+    if previous generations are kept for comparison, or into
+        <sweep dir>/.recycled/trash/
+    otherwise. Only the keep_generations newest generations of each output
+    folder are kept. recycle() only renames, everything that walks the
+    folders is left to a background thread at the lowest CPU priority: it
+    deletes the trash and, with a byte_budget, trashes the oldest generations
+    of a sweep while the sweep takes more than byte_budget bytes, counting
+    its live output folders and the generations kept. Live outputs are never
+    deleted, if they alone exceed the budget no generation is kept.
+
+    Trash left behind by an interrupted sweep is deleted the next time a
+    recycler sees the sweep directory.
+"""
+
+recycled_dirname = ".recycled"
+
+def get_directory_size(dirpath):
+    size = 0
+    for root, dirs, files in os.walk(dirpath):
+        for filename in files:
+            try:
+                size += os.lstat(os.path.join(root, filename)).st_size
+            except OSError:
+                pass
+    return size
+
+class OutputRecycler:
+    def __init__(self, keep_generations = 0, byte_budget = None):
+        self.keep_generations = keep_generations
+        self.byte_budget = byte_budget
+        # sweep dirs seen by recycle()
+        self.sweep_paths = set()
+        # per sweep dir: {generation path: size in bytes}, reaper thread only
+        self.generation_sizes = {}
+        # sweep dirs whose byte budget is queued to be enforced
+        self.budget_requests = set()
+        self.budget_lock = threading.Lock()
+        self.over_budget_sweep_paths = set()
+        # ("trash", path), ("clean", sweep dir) or ("budget", sweep dir)
+        self.trash_queue = queue.Queue()
+        self.reaper = threading.Thread(target = self.__reap, name = "OutputRecycler reaper", daemon = True)
+        self.reaper.start()
+
+    def __reap(self):
+        # lowest priority for this thread only, gem5 processes come first
+        try:
+            os.setpriority(os.PRIO_PROCESS, threading.get_native_id(), 19)
+        except (AttributeError, OSError):
+            pass
+        while True:
+            task = self.trash_queue.get()
+            if task is None:
+                self.trash_queue.task_done()
+                return
+            kind, path = task
+            try:
+                if kind == "trash":
+                    shutil.rmtree(path, ignore_errors = True)
+                elif kind == "clean":
+                    # trash left behind by an interrupted sweep
+                    for entry in path.iterdir():
+                        shutil.rmtree(entry, ignore_errors = True)
+                elif kind == "budget":
+                    self.__enforce_byte_budget(path)
+            except OSError as e:
+                print("Warn: the output recycler failed on", path, e)
+            self.trash_queue.task_done()
+
+    def __get_recycled_path(sweep_path):
+        return Path(sweep_path) / recycled_dirname
+
+    def __get_generations_path(dirpath):
+        return OutputRecycler.__get_recycled_path(dirpath.parent) / "generations" / dirpath.name
+
+    def __trash(self, path):
+        trash_path = OutputRecycler.__get_recycled_path(self.__get_sweep_path(path)) / "trash"
+        trash_path.mkdir(parents = True, exist_ok = True)
+        dst = trash_path / f"{path.name}-{uuid.uuid4().hex}"
+        os.rename(path, dst)
+        self.trash_queue.put(("trash", dst))
+
+    def __get_sweep_path(self, path):
+        # path is either an output dir or a generation of one
+        path = Path(path)
+        if recycled_dirname in path.parts:
+            return Path(*path.parts[:path.parts.index(recycled_dirname)])
+        return path.parent
+
+    def __init_sweep(self, sweep_path):
+        if sweep_path in self.sweep_paths:
+            return
+        self.sweep_paths.add(sweep_path)
+        trash_path = OutputRecycler.__get_recycled_path(sweep_path) / "trash"
+        if trash_path.exists():
+            self.trash_queue.put(("clean", trash_path))
+
+    # previous generations of an output dir, newest first
+    def get_generations(self, dirpath):
+        generations_path = OutputRecycler.__get_generations_path(Path(dirpath))
+        if not generations_path.exists():
+            return []
+        return sorted(generations_path.iterdir(), key = lambda path: int(path.name), reverse = True)
+
+    # moves dirpath away, returns False if it could not be
+    def recycle(self, dirpath):
+        dirpath = Path(dirpath)
+        if not dirpath.exists():
+            return True
+        sweep_path = dirpath.parent
+        self.__init_sweep(sweep_path)
+        try:
+            if self.keep_generations <= 0:
+                self.__trash(dirpath)
+                return True
+            generations_path = OutputRecycler.__get_generations_path(dirpath)
+            generations_path.mkdir(parents = True, exist_ok = True)
+            generation = generations_path / str(time.time_ns())
+            os.rename(dirpath, generation)
+        except OSError as e:
+            print("Warn: failed to recycle", dirpath, e)
+            return False
+        for old_generation in self.get_generations(dirpath)[self.keep_generations:]:
+            try:
+                self.__trash(old_generation)
+            except OSError as e:
+                print("Warn: failed to trash", old_generation, e)
+        self.__request_byte_budget(sweep_path)
+        return True
+
+    # at most one queued request per sweep, the reaper sizes the whole sweep
+    def __request_byte_budget(self, sweep_path):
+        if self.byte_budget is None:
+            return
+        with self.budget_lock:
+            if sweep_path in self.budget_requests:
+                return
+            self.budget_requests.add(sweep_path)
+        self.trash_queue.put(("budget", sweep_path))
+
+    def __get_live_size(sweep_path):
+        size = 0
+        for entry in sweep_path.iterdir():
+            if entry.name == recycled_dirname:
+                continue
+            try:
+                size += get_directory_size(entry) if entry.is_dir() else entry.lstat().st_size
+            except OSError:
+                pass
+        return size
+
+    # runs in the reaper thread
+    def __enforce_byte_budget(self, sweep_path):
+        with self.budget_lock:
+            self.budget_requests.discard(sweep_path)
+        sizes = self.generation_sizes.setdefault(sweep_path, {})
+        generations_path = OutputRecycler.__get_recycled_path(sweep_path) / "generations"
+        generations = set(generations_path.glob("*/*")) if generations_path.exists() else set()
+        # generations trashed by recycle() are gone, the sizes of the kept ones
+        # do not change
+        for generation in list(sizes):
+            if not generation in generations:
+                del sizes[generation]
+        for generation in generations:
+            if not generation in sizes:
+                sizes[generation] = get_directory_size(generation)
+        total = OutputRecycler.__get_live_size(sweep_path) + sum(sizes.values())
+        # oldest first, the generation names are creation times
+        for generation in sorted(sizes, key = lambda path: int(path.name)):
+            if total <= self.byte_budget:
+                break
+            try:
+                self.__trash(generation)
+            except OSError:
+                # trashed by recycle() in the meantime
+                pass
+            total -= sizes.pop(generation)
+        if total > self.byte_budget and not sweep_path in self.over_budget_sweep_paths:
+            self.over_budget_sweep_paths.add(sweep_path)
+            print("Warn: the live outputs of", sweep_path, "take", total, "bytes, more than the byte budget of", self.byte_budget)
+
+    # waits for the trash to be deleted if wait is True
+    def close(self, wait = True):
+        if wait:
+            self.trash_queue.join()
+        self.trash_queue.put(None)
@@ -0,0 +1,94 @@
+import os
+import threading
+
+"""
+    Admission control for experiment units.
+
+    Each unit declares an estimated resident memory footprint and the number
+    of host cores it occupies. A unit is admitted only while the sum of the
+    demands of the running units fits in the host budget, which is measured
+    once when the scheduler is created.
+"""
+
+def get_available_memory():
+    # MemAvailable accounts for reclaimable page cache, MemFree does not
+    try:
+        with open("/proc/meminfo", "r") as f:
+            for line in f:
+                if line.startswith("MemAvailable:"):
+                    return int(line.split()[1]) * 1024
+    except OSError:
+        pass
+    return os.sysconf("SC_AVPHYS_PAGES") * os.sysconf("SC_PAGE_SIZE")
+
+def get_total_memory():
+    return os.sysconf("SC_PHYS_PAGES") * os.sysconf("SC_PAGE_SIZE")
+
+def get_available_cores():
+    try:
+        return len(os.sched_getaffinity(0))
+    except AttributeError:
+        return os.cpu_count()
+
+class ResourceScheduler:
+    # gem5 is single threaded and the full system configs simulate 16GiB of
+    # memory, of which a microbenchmark usually touches a few GiB
+    default_unit_memory = 4 * 2**30
+    default_unit_cores = 1
+
+    def __init__(self, memory_budget = None, core_budget = None, memory_headroom = 0.9, low_memory_watermark = 0.05):
+        if memory_budget is None:
+            memory_budget = int(get_available_memory() * memory_headroom)
+        if core_budget is None:
+            core_budget = get_available_cores()
+        self.memory_budget = memory_budget
+        self.core_budget = core_budget
+        # stop admitting anything while the host is below this much free
+        # memory, regardless of our own accounting (other users, page cache)
+        self.low_memory_watermark = int(get_total_memory() * low_memory_watermark)
+        self.reserved_memory = 0
+        self.reserved_cores = 0
+        self.n_running = 0
+        self.lock = threading.Lock()
+
+    def get_unit_demand(self, unit):
+        memory = getattr(unit, "estimated_memory", None)
+        cores = getattr(unit, "estimated_cores", None)
+        if memory is None:
+            memory = ResourceScheduler.default_unit_memory
+        if cores is None:
+            cores = ResourceScheduler.default_unit_cores
+        return memory, cores
+
+    def fits(self, unit):
+        memory, cores = self.get_unit_demand(unit)
+        if self.n_running == 0:
+            # a unit larger than the whole budget still has to run at some
+            # point, so let it run alone
+            if memory > self.memory_budget or cores > self.core_budget:
+                print("Warn:", unit.gem5_output_path, "exceeds the host budget, running it alone")
+            return True
+        if self.reserved_memory + memory > self.memory_budget:
+            return False
+        if self.reserved_cores + cores > self.core_budget:
+            return False
+        if get_available_memory() < self.low_memory_watermark:
+            return False
+        return True
+
+    def try_acquire(self, unit):
+        with self.lock:
+            if not self.fits(unit):
+                return False
+            memory, cores = self.get_unit_demand(unit)
+            self.reserved_memory += memory
+            self.reserved_cores += cores
+            self.n_running += 1
+            return True
+
+    def release(self, unit):
+        with self.lock:
+            memory, cores = self.get_unit_demand(unit)
+            self.reserved_memory -= memory
+            self.reserved_cores -= cores
+            self.n_running -= 1
@@ -0,0 +1,162 @@
+import hashlib
+import json
+import os
+import shutil
+import time
+import uuid
+from pathlib import Path
+
+from .DiskImageFingerprint import get_fingerprint
+from .HashCache import get_file_hash
+
+"""
+    A result cache shared by sweeps, keyed by what the simulation depends on.
+
+    get_content_hash() hashes the content of the gem5 binary and the config
+    script, the gem5 and config parameters, and the extra environment of a
+    unit. Parameters naming the output location or the host (--outdir,
+    --hostname) are left out, and so are the uuid and the metadata. The disk
+    image is represented by its md5sum (the "disk-image-md5sum" metadata, or
+    its fingerprint otherwise), so the same image at another path hits, and a
+    restored boot checkpoint by its group name, which is itself a hash of the
+    boot parameters (see CheckpointPipeline).
+
+    Each successful unit is stored as
+        <cache dir>/<first 2 digits>/<content hash>/
+    holding its output files, hard-linked when the cache is on the same
+    filesystem (copied otherwise), and entry.json. Launching a unit whose
+    content hash is in the cache links the stored files into its output folder
+    and marks it finished, with unit.cached_from set to the output folder that
+    produced them, instead of running gem5.
+
+    Linked files are shared with the cache and every folder restored from it;
+    they must not be modified in place. Modules imported by the config script
+    are not hashed: clear the cache (or change cache_version) after changing
+    them.
+"""
+
+cache_version = 1
+entry_filename = "entry.json"
+
+# gem5 parameters that only say where the outputs go
+ignored_gem5_params = ["--outdir", "-d"]
+# config parameters that do not change the simulated system
+ignored_config_params = ["--hostname"]
+# config parameters naming input files, hashed by content instead of path
+file_config_params = ["--kernel", "--bootloader"]
+disk_image_config_params = ["--disk_image"]
+
+def _get_disk_image_digest(unit, image_path):
+    if unit.metadata.get("disk-image-path", None) == image_path and unit.metadata.get("disk-image-md5sum", None):
+        return unit.metadata["disk-image-md5sum"]
+    return get_fingerprint(image_path)["root"]
+
+def _get_config_params_key(unit):
+    params = {}
+    for key, val in unit.config_params.items():
+        if key in ignored_config_params:
+            continue
+        if key in disk_image_config_params and val and Path(val).exists():
+            val = "disk image " + _get_disk_image_digest(unit, val)
+        elif key in file_config_params and val and Path(val).exists():
+            val = "file " + get_file_hash(val, "md5")
+        elif key == "--restore_checkpoint":
+            # <checkpoint prefix>/<group name>/checkpoint
+            val = "checkpoint " + Path(val).parent.name
+        params[key] = val
+    return params
+
+def get_content_hash(unit):
+    key = {"version": cache_version,
+           "gem5_binary_hash": unit.gem5_binary_hash,
+           "gem5_config_hash": get_file_hash(unit.gem5_config_path, "md5"),
+           "gem5_params": {key: val for key, val in unit.gem5_params.items() if not key in ignored_gem5_params},
+           "config_params": _get_config_params_key(unit),
+           "env": unit.env}
+    s = json.dumps(key, sort_keys=True, default=str)
+    return hashlib.sha256(s.encode()).hexdigest()
+
+# units that write outside of their output folder cannot be restored from it
+def is_cacheable(unit):
+    return not "--take_checkpoint" in unit.config_params
+
+def _link_or_copy(src, dst):
+    try:
+        os.link(src, dst)
+    except OSError:
+        shutil.copy2(src, dst)
+
+def _link_tree(src, dst):
+    shutil.copytree(src, dst, symlinks = True, copy_function = _link_or_copy, dirs_exist_ok = True,
+                    ignore = shutil.ignore_patterns("info.json", ".info.json.*", "info.json.lock", entry_filename))
+
+class ResultCache:
+    def __init__(self, cache_path):
+        self.cache_path = Path(cache_path)
+        self.cache_path.mkdir(parents=True, exist_ok=True)
+        self.n_hits = 0
+        self.n_stored = 0
+
+    def __get_entry_path(self, content_hash):
+        return self.cache_path / content_hash[:2] / content_hash
+
+    def lookup(self, unit):
+        if not is_cacheable(unit):
+            return None
+        entry_path = self.__get_entry_path(get_content_hash(unit))
+        # entry.json is written before the entry is renamed into place
+        if not (entry_path / entry_filename).exists():
+            return None
+        return entry_path
+
+    def get_entry(self, entry_path):
+        with open(Path(entry_path) / entry_filename, "r") as f:
+            return json.load(f)
+
+    # finish hook: stores the outputs of a successful unit
+    def store(self, unit):
+        if unit.status != "finished" or unit.return_code != 0 or unit.cached_from is not None or not is_cacheable(unit):
+            return
+        content_hash = get_content_hash(unit)
+        entry_path = self.__get_entry_path(content_hash)
+        if entry_path.exists():
+            return
+        entry_path.parent.mkdir(parents=True, exist_ok=True)
+        tmp_path = entry_path.parent / f".{content_hash}.{uuid.uuid4().hex}.tmp"
+        try:
+            _link_tree(unit.gem5_output_path, tmp_path)
+            entry = {"content_hash": content_hash,
+                     "gem5_output_path": str(unit.gem5_output_path),
+                     "uuid": unit.uuid,
+                     "run_time": unit.run_time,
+                     "sim_throughput": unit.sim_throughput,
+                     "time": time.time()}
+            with open(tmp_path / entry_filename, "w") as f:
+                json.dump(entry, f, sort_keys=True, indent=4)
+            os.rename(tmp_path, entry_path)
+            self.n_stored += 1
+        except OSError as e:
+            # another process stored the same entry first, or the cache is full
+            if not entry_path.exists():
+                print("Warn: failed to store", unit.gem5_output_path, "in the result cache:", e)
+        finally:
+            if tmp_path.exists():
+                shutil.rmtree(tmp_path, ignore_errors = True)
+
+    # fills the output folder of the unit from a cache entry and finishes it,
+    # as if gem5 had produced the outputs; False if the unit has to be launched
+    def restore(self, unit, entry_path, output_recycler = None):
+        entry = self.get_entry(entry_path)
+        if not unit.prepare_launch(output_recycler):
+            return False
+        unit.start_launch()
+        try:
+            _link_tree(entry_path, unit.gem5_output_path)
+        except OSError as e:
+            print("Warn: failed to restore", unit.gem5_output_path, "from the result cache:", e)
+            return False
+        unit.cached_from = entry["gem5_output_path"]
+        unit.sim_throughput = entry.get("sim_throughput", None)
+        unit.finish_launch(0)
+        self.n_hits += 1
+        return True
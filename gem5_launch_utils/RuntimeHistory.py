@@ -0,0 +1,83 @@
+import json
+import os
+from pathlib import Path
+
+"""
+    Wall-clock runtime history of experiment units, used to launch the
+    predicted-longest units first (LPT scheduling).
+
+    Units are keyed by a normalized signature made of a few metadata fields
+    and the gem5 binary hash, so that the same design point from another
+    sweep (or a rerun) shares its history.
+"""
+
+default_runtime_history_path = Path.home() / ".cache" / "gem5_launch_utils" / "runtime_history.json"
+
+class RuntimeHistory:
+    # the ROI budget (max_roi_ticks, or the rung of an AdaptiveSearch) and the
+    # convergence and sampling parameters change the runtime as much as the
+    # design point; the workload stays first, see __get_workload
+    signature_keys = ["workload-naming-string", "vlen", "num_ccds", "num_channels", "checkpoint-stage", "simpoint-stage",
+                      "max_roi_ticks", "search-roi-ticks", "convergence_params", "sampling_params"]
+
+    def __init__(self, path = default_runtime_history_path):
+        self.path = Path(path)
+        self.history = self.__load()
+
+    def __load(self):
+        if not self.path.exists():
+            return {}
+        try:
+            with open(self.path, "r") as f:
+                return json.load(f)
+        except (OSError, json.JSONDecodeError):
+            print("Warn: failed to read the runtime history", self.path)
+            return {}
+
+    def get_signature(unit):
+        fields = [str(unit.metadata.get(key, "")) for key in RuntimeHistory.signature_keys]
+        fields.append(unit.gem5_binary_hash)
+        return "|".join(fields)
+
+    def __get_workload(signature):
+        return signature.split("|")[0]
+
+    def predict(self, unit):
+        signature = RuntimeHistory.get_signature(unit)
+        if signature in self.history:
+            return self.history[signature]["mean"]
+        # fall back to the longest known run of the same workload
+        workload = RuntimeHistory.__get_workload(signature)
+        same_workload = [entry["mean"] for key, entry in self.history.items() if RuntimeHistory.__get_workload(key) == workload]
+        if same_workload:
+            return max(same_workload)
+        return None
+
+    def record(self, unit, runtime):
+        signature = RuntimeHistory.get_signature(unit)
+        entry = self.history.setdefault(signature, {"n": 0, "mean": 0.0})
+        entry["n"] += 1
+        entry["mean"] += (runtime - entry["mean"]) / entry["n"]
+
+    # LPT: longest predicted runtime first, units without any history go
+    # before everything else as they might be the longest ones
+    def sort_longest_first(self, units):
+        def key(unit):
+            prediction = self.predict(unit)
+            if prediction is None:
+                return (0, 0)
+            return (1, -prediction)
+        return sorted(units, key = key)
+
+    def save(self):
+        # merge with entries recorded by other launchers in the meantime,
+        # then atomically replace the file
+        on_disk = self.__load()
+        for signature, entry in on_disk.items():
+            if not signature in self.history:
+                self.history[signature] = entry
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        tmp_path = self.path.with_name(self.path.name + f".{os.getpid()}.tmp")
+        with open(tmp_path, "w") as f:
+            json.dump(self.history, f, sort_keys=True, indent=4)
+        os.replace(tmp_path, self.path)
@@ -0,0 +1,236 @@
+import uuid
+from pathlib import Path
+
+from .AdaptiveSearch import dram_byte_stat_names
+from .ExperimentUnit import ExperimentUnit
+
+"""
+    SimPoint-style sampled simulation of the ROI of long workloads.
+
+    Instead of simulating the whole ROI with the O3 core, each unit goes
+    through four stages, each a gem5 run of the simpoint config (see
+    experiment-10-CHI-correct-latency/configs/gem5/arm64sve-chi-simpoint.py)
+    in a folder of <unit output>/simpoint/:
+        boot          Atomic CPU up to m5_work_begin(), saves the ROI checkpoint
+        profile       Atomic CPU over the ROI, writes the basic-block vectors
+                      of every `interval` instructions
+        checkpoint    Atomic CPU over the ROI, saves a checkpoint `warmup`
+                      instructions before each simpoint
+        restore-<i>   O3 CPU from the checkpoint of simpoint i, `warmup`
+                      instructions of warmup then one interval in detail
+    Between profile and checkpoint, the simpoints are picked from the
+    basic-block vectors (gem5_stats_utils/SimPoint) and saved to
+    <unit output>/simpoints.json. Once all the restore stages are done, the
+    weighted stats are written to <unit output>/simpoint_stats.json; the unit
+    itself is never launched.
+
+    The pipeline is a unit source for Experiment.add_feedback_source(): each
+    unit advances on its own, a stage is yielded once the previous one
+    finished (retries included), and None while nothing can be yielded. A
+    stage that is skipped because it already ran, or restored from the result
+    cache, counts as done. A failed stage drops the unit from the pipeline.
+
+    SlicePipeline (below) simulates every interval instead of the simpoints,
+    in parallel.
+"""
+
+# config parameters of the units that the stages do not understand
+stripped_config_params = ["--take_checkpoint", "--restore_checkpoint", "--stats_dump_period", "--max_roi_ticks",
+                          "--convergence_interval", "--convergence_window", "--convergence_threshold",
+                          "--sampling_period", "--sampling_warmup", "--sampling_window", "--sampling_error",
+                          "--sampling_confidence", "--sampling_min_windows"]
+default_stat_names = ["simSeconds", "simInsts"] + dram_byte_stat_names
+simpoints_filename = "simpoints.json"
+simpoint_stats_filename = "simpoint_stats.json"
+slices_filename = "slices.json"
+slice_stats_filename = "slice_stats.json"
+
+class SimPointPipeline:
+    name = "simpoint pipeline"
+    work_dirname = "simpoint"
+
+    # units: any iterable of units of the simpoint config
+    def __init__(self, units, interval = 10**8, warmup = 10**7, max_k = 30, stat_names = default_stat_names):
+        self.units = units
+        self.interval = interval
+        self.warmup = warmup
+        self.max_k = max_k
+        self.stat_names = stat_names
+        self.supervisor = None
+        # stage units yielded and not done yet, keyed by uuid
+        self.waiting = {}
+        # whether each stage unit that is done succeeded, keyed by uuid
+        self.done = {}
+        self.n_units = 0
+        self.n_completed = 0
+
+    def attach(self, supervisor):
+        self.supervisor = supervisor
+        supervisor.add_finish_hook(self.on_finish)
+
+    def on_finish(self, unit):
+        if not unit.uuid in self.waiting:
+            return
+        # no status: the unit was not launched by this process
+        status = getattr(unit, "status", None)
+        self.done[unit.uuid] = status is None or (status == "finished" and unit.return_code == 0)
+
+    def __is_done(self, unit):
+        if not unit.uuid in self.done:
+            # skipped units (e.g. a failed dependency) only show up here
+            if self.supervisor is None or not unit.uuid in self.supervisor.finished:
+                return False
+            self.done[unit.uuid] = self.supervisor.finished[unit.uuid] == 0
+        # a unit that is retried is going to finish again, also once it left
+        # supervisor.resubmitted for the queue of launchable units
+        if self.supervisor is not None and unit.uuid in self.supervisor.retrying:
+            return False
+        return True
+
+    def _make_stage(self, unit, stage, config_params):
+        stage_unit = ExperimentUnit.init_from_ExperimentUnit(unit)
+        stage_unit.uuid = str(uuid.uuid4())
+        stage_unit.depends_on = []
+        stage_unit.gem5_output_path = str(Path(unit.gem5_output_path) / self.work_dirname / stage)
+        if "--outdir" in stage_unit.gem5_params:
+            stage_unit.gem5_params["--outdir"] = stage_unit.gem5_output_path
+        for key in stripped_config_params:
+            stage_unit.config_params.pop(key, None)
+        stage_unit.config_params["--simpoint_interval"] = str(self.interval)
+        stage_unit.config_params["--simpoint_warmup"] = str(self.warmup)
+        stage_unit.config_params.update(config_params)
+        stage_unit.add_metadata("simpoint-stage", stage)
+        stage_unit.add_metadata("simpoint-parent", unit.uuid)
+        self.waiting[stage_unit.uuid] = stage_unit
+        return stage_unit
+
+    # yields the stage units, then None until they are all done; True if
+    # they all succeeded
+    def _run_stages(self, stage_units):
+        for stage_unit in stage_units:
+            yield stage_unit
+        while not all(self.__is_done(stage_unit) for stage_unit in stage_units):
+            yield None
+        failed = [stage_unit for stage_unit in stage_units if not self.done[stage_unit.uuid]]
+        for stage_unit in stage_units:
+            self.waiting.pop(stage_unit.uuid, None)
+        for stage_unit in failed:
+            print("Warn:", stage_unit.gem5_output_path, "failed, dropping its unit from the", self.name)
+        return not failed
+
+    # the path of the ROI checkpoint, None if the boot failed
+    def _run_boot(self, unit):
+        boot = self._make_stage(unit, "boot", {"--simpoint_mode": "boot"})
+        if not (yield from self._run_stages([boot])):
+            return None
+        return str(Path(boot.gem5_output_path) / "roi-checkpoint")
+
+    # simulates the simpoints saved in simpoints_path from the checkpoints of
+    # the checkpoint stage and writes their weighted stats to stats_filename
+    def _run_restores(self, unit, checkpoint, simpoints_path, stats_filename):
+        from gem5_stats_utils import SimPoint
+
+        restores = []
+        for simpoint in SimPoint.load_simpoints(simpoints_path)["simpoints"]:
+            index = simpoint["index"]
+            checkpoint_path = str(Path(checkpoint.gem5_output_path) / f"cpt.{index}")
+            # the first interval of the ROI has nothing before it to warm up on
+            restore = self._make_stage(unit, f"restore-{index}", {"--simpoint_mode": "restore", "--simpoint_checkpoint": checkpoint_path,
+                                                                  "--simpoint_warmup": str(min(self.warmup, index * self.interval))})
+            restore.add_metadata("simpoint-index", str(index))
+            restore.add_metadata("simpoint-weight", str(simpoint["weight"]))
+            restores.append(restore)
+        if not (yield from self._run_stages(restores)):
+            return
+        weighted = SimPoint.get_weighted_stats(SimPoint.load_simpoints(simpoints_path), [restore.gem5_output_path for restore in restores], self.stat_names)
+        SimPoint.save_weighted_stats(Path(unit.gem5_output_path) / stats_filename, weighted)
+        self.n_completed += 1
+
+    def _run_unit(self, unit):
+        from gem5_stats_utils import SimPoint
+
+        roi_checkpoint_path = yield from self._run_boot(unit)
+        if roi_checkpoint_path is None:
+            return
+
+        profile = self._make_stage(unit, "profile", {"--simpoint_mode": "profile", "--simpoint_checkpoint": roi_checkpoint_path})
+        if not (yield from self._run_stages([profile])):
+            return
+        try:
+            bbvs = SimPoint.read_bbvs(profile.gem5_output_path)
+        except FileNotFoundError as e:
+            print("Warn:", e, "dropping", unit.gem5_output_path, "from the", self.name)
+            return
+        simpoints = SimPoint.pick_simpoints(bbvs, self.max_k)
+        simpoints_path = Path(unit.gem5_output_path) / simpoints_filename
+        simpoints_path.parent.mkdir(parents=True, exist_ok=True)
+        SimPoint.save_simpoints(simpoints_path, simpoints, len(bbvs), self.interval)
+        print("Info:", len(simpoints), "simpoints out of", len(bbvs), "intervals for", unit.gem5_output_path)
+
+        checkpoint = self._make_stage(unit, "checkpoint", {"--simpoint_mode": "checkpoint", "--simpoint_checkpoint": roi_checkpoint_path,
+                                                           "--simpoints": str(simpoints_path)})
+        if not (yield from self._run_stages([checkpoint])):
+            return
+        yield from self._run_restores(unit, checkpoint, simpoints_path, simpoint_stats_filename)
+
+    # the pipelines of all the units advance in turns
+    def __iter__(self):
+        pipelines = []
+        units = iter(self.units)
+        exhausted = False
+        while pipelines or not exhausted:
+            if not exhausted:
+                try:
+                    pipelines.append(self._run_unit(next(units)))
+                    self.n_units += 1
+                except StopIteration:
+                    exhausted = True
+            yielded = False
+            for pipeline in list(pipelines):
+                try:
+                    unit = next(pipeline)
+                except StopIteration:
+                    pipelines.remove(pipeline)
+                    continue
+                if unit is not None:
+                    yielded = True
+                    yield unit
+            if not yielded and exhausted and pipelines:
+                yield None
+        print("Info: the", self.name, "completed", self.n_completed, "of", self.n_units, "units")
+
+# Parallel simulation of the whole ROI: every interval of the ROI is a slice,
+# simulated in detail by its own unit from a checkpoint taken `warmup`
+# instructions before it, so the slices of one unit run in parallel. The
+# slice checkpoints are taken by a single Atomic run over the ROI (the
+# "slice" mode of the simpoint config) instead of profiling; the slices are
+# saved to <unit output>/slices.json as simpoints of equal weight, and the
+# "total" of <unit output>/slice_stats.json is the sum over the slices, i.e.
+# the stitched whole-ROI value of counts (instructions, bytes read, ticks),
+# from which rates are recomputed.
+class SlicePipeline(SimPointPipeline):
+    name = "slice pipeline"
+    work_dirname = "slices"
+
+    def __init__(self, units, interval = 10**9, warmup = 10**7, stat_names = default_stat_names):
+        super().__init__(units, interval, warmup, stat_names = stat_names)
+
+    def _run_unit(self, unit):
+        from gem5_stats_utils import SimPoint
+
+        roi_checkpoint_path = yield from self._run_boot(unit)
+        if roi_checkpoint_path is None:
+            return
+
+        checkpoint = self._make_stage(unit, "checkpoint", {"--simpoint_mode": "slice", "--simpoint_checkpoint": roi_checkpoint_path})
+        if not (yield from self._run_stages([checkpoint])):
+            return
+        indices = sorted(int(path.name.split(".")[1]) for path in Path(checkpoint.gem5_output_path).glob("cpt.*"))
+        if not indices:
+            print("Warn: no slice checkpoint in", checkpoint.gem5_output_path + ", dropping", unit.gem5_output_path, "from the", self.name)
+            return
+        slices = [{"index": index, "weight": 1 / len(indices), "cluster": index} for index in indices]
+        slices_path = Path(unit.gem5_output_path) / slices_filename
+        SimPoint.save_simpoints(slices_path, slices, len(indices), self.interval)
+        print("Info:", len(indices), "slices of", self.interval, "instructions for", unit.gem5_output_path)
+        yield from self._run_restores(unit, checkpoint, slices_path, slice_stats_filename)
@@ -0,0 +1,97 @@
+import json
+import time
+from pathlib import Path
+
+from gem5_stats_utils.StatsParser import parse_stats_data, end_marker
+
+"""
+    Follows the periodic stats dumps of running units (see --stats_dump_period
+    in experiment-10-CHI-correct-latency/configs/gem5/arm64sve-chi.py).
+
+    On every supervisor poll, the bytes appended to each running unit's
+    stats.txt since the last poll are read, and each new complete dump adds
+    one line to <gem5_output_path>/stats_timeseries.jsonl with the selected
+    stats, e.g.
+        {"dump": 3, "simSeconds": 0.004, "board.memory.mem_ctrl0.dram.bytesRead::total": 123456.0}
+    The dumps are cumulative since the stats reset at the ROI begin. A stat
+    missing from a dump is null (None in the series).
+
+    should_stop(unit, series) may return a reason (a string) to terminate a
+    unit, e.g. when its bandwidth has converged or is clearly off; series is
+    the list of the records above.
+"""
+
+series_filename = "stats_timeseries.jsonl"
+
+class StatsTail:
+    def __init__(self, stat_names, should_stop = None, min_poll_interval = 30):
+        self.stat_names = list(stat_names)
+        if not "simSeconds" in self.stat_names:
+            self.stat_names.append("simSeconds")
+        self.should_stop = should_stop
+        self.min_poll_interval = min_poll_interval
+        self.supervisor = None
+        # per uuid: offset of the first byte not yet parsed, and the series
+        self.offsets = {}
+        self.series = {}
+        self.last_poll = 0
+
+    def attach(self, supervisor):
+        self.supervisor = supervisor
+        supervisor.add_poll_hook(self.poll)
+        supervisor.add_finish_hook(self.poll_unit)
+        supervisor.add_status_hook(self.on_status)
+
+    # a retry writes a new stats.txt (and series) from the start
+    def on_status(self, unit):
+        if unit.status == "running":
+            self.offsets.pop(unit.uuid, None)
+            self.series.pop(unit.uuid, None)
+
+    def get_series(self, unit):
+        return self.series.get(unit.uuid, [])
+
+    def poll(self, running_units):
+        if time.time() - self.last_poll < self.min_poll_interval:
+            return
+        self.last_poll = time.time()
+        for unit in running_units:
+            self.poll_unit(unit)
+
+    def poll_unit(self, unit):
+        stats_path = Path(unit.gem5_output_path) / "stats.txt"
+        if not stats_path.exists():
+            return
+        offset = self.offsets.get(unit.uuid, 0)
+        if stats_path.stat().st_size <= offset:
+            return
+        with open(stats_path, "rb") as f:
+            f.seek(offset)
+            data = f.read()
+        # only parse complete dumps, the rest is read again on the next poll
+        last_end = data.rfind(end_marker)
+        if last_end == -1:
+            return
+        data = data[:last_end + len(end_marker)]
+        self.offsets[unit.uuid] = offset + len(data)
+
+        stats = parse_stats_data(data, self.stat_names)
+        n_dumps = max((len(values) for values in stats.values()), default = 0)
+        series = self.series.setdefault(unit.uuid, [])
+        records = []
+        for i in range(n_dumps):
+            record = {"dump": len(series)}
+            for name, values in stats.items():
+                # NaN (a stat missing from a partial dump) is not valid JSON
+                value = float(values[i])
+                record[name] = value if value == value else None
+            series.append(record)
+            records.append(record)
+        with open(Path(unit.gem5_output_path) / series_filename, "a") as f:
+            for record in records:
+                f.write(json.dumps(record) + "\n")
+
+        if self.should_stop is not None and self.supervisor is not None and records:
+            reason = self.should_stop(unit, series)
+            if reason:
+                self.supervisor.request_termination(unit, reason)
@@ -0,0 +1,266 @@
+import asyncio
+import signal
+import time
+from pathlib import Path
+
+from .HostTelemetry import ChildProcess
+from .ResourceScheduler import ResourceScheduler
+
+"""
+    Runs experiment units as child processes of a single asyncio event loop.
+
+    There is no worker process per slot: the gem5 processes write straight
+    into the per-unit run_stdout/run_stderr files and the loop only waits for
+    them to exit (on a pidfd where available). The supervisor supports
+        . per-unit wall-clock timeouts (unit.timeout, or the supervisor default),
+        . live concurrency changes, either by set_max_concurrency() or by
+          writing a number to concurrency_file,
+        . cancellation: on Ctrl-C every running gem5 process is terminated
+          and its unit is marked as "cancelled" so that it can be relaunched.
+        . host telemetry: the rusage of each gem5 process and samples of its
+          /proc entries end up in unit.telemetry, see HostTelemetry,
+        . with an output_recycler, old output directories are moved away
+          and deleted in the background instead of before the launch.
+
+    A unit is launched only after all the units in its depends_on list have
+    finished with a return code of 0, and is skipped if one of them failed.
+
+    units can be any iterable; it is consumed lazily, only when there are free
+    slots. An iterator may yield None to signal that nothing is available yet
+    (e.g. a work queue that is momentarily empty), it is asked again on the
+    next poll.
+"""
+
+class Supervisor:
+    def __init__(self, max_concurrency, resource_scheduler = None, timeout = None, concurrency_file = None, poll_interval = 1.0, kill_grace_period = 30, output_recycler = None):
+        if resource_scheduler is None:
+            resource_scheduler = ResourceScheduler()
+        self.max_concurrency = max_concurrency
+        self.resource_scheduler = resource_scheduler
+        self.timeout = timeout
+        self.concurrency_file = None if concurrency_file is None else Path(concurrency_file)
+        self.poll_interval = poll_interval
+        self.kill_grace_period = kill_grace_period
+        self.output_recycler = output_recycler
+        self.finish_hooks = []
+        self.poll_hooks = []
+        self.status_hooks = []
+        self.running_units = []
+        # return code of every unit that ended, keyed by uuid
+        self.finished = {}
+        # gem5 process of every running unit, keyed by uuid
+        self.processes = {}
+        # reason of every termination requested by a hook, keyed by uuid
+        self.termination_requests = {}
+        # units to launch again, as (not before this time, unit)
+        self.resubmitted = []
+        # uuids of the resubmitted units until they end again, including
+        # while they wait in the queue of launchable units
+        self.retrying = set()
+
+    # hook(unit) is called after a unit finished and its info.json is written;
+    # once a hook resubmitted the unit, the following hooks are not called, the
+    # retry is going to finish again
+    def add_finish_hook(self, hook):
+        self.finish_hooks.append(hook)
+
+    # hook(unit) is called after every change of the status of a unit written
+    # to its info.json: "running" once its output folder is prepared, then
+    # "finished" (before the finish hooks), "cancelled" or "skipped"
+    def add_status_hook(self, hook):
+        self.status_hooks.append(hook)
+
+    # hook(running_units) is called every poll_interval
+    def add_poll_hook(self, hook):
+        self.poll_hooks.append(hook)
+
+    # asks a running unit to stop (SIGTERM), e.g. from a poll hook that found
+    # it converged or stalled, the reason is recorded in its info.json; a
+    # unit still running kill_grace_period seconds later is killed (SIGKILL)
+    def request_termination(self, unit, reason):
+        process = self.processes.get(unit.uuid, None)
+        if process is None or process.returncode is not None or unit.uuid in self.termination_requests:
+            return
+        print("Info: terminating", unit.gem5_output_path + ":", reason)
+        self.termination_requests[unit.uuid] = reason
+        process.terminate()
+        asyncio.get_running_loop().call_later(self.kill_grace_period, self.__kill, unit, process)
+
+    def __kill(self, unit, process):
+        if process.returncode is not None:
+            return
+        print("Warn:", unit.gem5_output_path, "ignored SIGTERM for", self.kill_grace_period, "seconds, killing it")
+        process.kill()
+
+    # launches a unit again after delay seconds, e.g. from a finish hook that
+    # found a transient failure; its dependents wait for the new outcome
+    def resubmit(self, unit, delay = 0):
+        self.finished.pop(unit.uuid, None)
+        self.retrying.add(unit.uuid)
+        self.resubmitted.append((time.time() + delay, unit))
+
+    def set_max_concurrency(self, max_concurrency):
+        self.max_concurrency = max_concurrency
+
+    def __read_concurrency_file(self):
+        if self.concurrency_file is None or not self.concurrency_file.exists():
+            return
+        try:
+            max_concurrency = int(self.concurrency_file.read_text().strip())
+        except (OSError, ValueError):
+            return
+        if max_concurrency > 0 and max_concurrency != self.max_concurrency:
+            print("Info: changing the maximum concurrency from", self.max_concurrency, "to", max_concurrency)
+            self.max_concurrency = max_concurrency
+
+    async def __terminate(self, process):
+        if process.returncode is not None:
+            return process.returncode
+        process.terminate()
+        try:
+            return await asyncio.wait_for(process.wait(), self.kill_grace_period)
+        except asyncio.TimeoutError:
+            process.kill()
+            return await process.wait()
+
+    def __notify_status(self, unit):
+        for hook in self.status_hooks:
+            hook(unit)
+
+    def __skip(self, unit, reason):
+        self.retrying.discard(unit.uuid)
+        unit.skip_launch(reason)
+        self.__notify_status(unit)
+
+    def __finish(self, unit):
+        self.finished[unit.uuid] = unit.return_code
+        self.retrying.discard(unit.uuid)
+        self.__notify_status(unit)
+        for hook in self.finish_hooks:
+            hook(unit)
+            if unit.uuid in self.retrying:
+                break
+
+    async def __run_unit(self, unit):
+        try:
+            if not unit.prepare_launch(self.output_recycler):
+                self.finished[unit.uuid] = unit.return_code
+                return
+            self.__notify_status(unit)
+            timeout = unit.timeout if unit.timeout is not None else self.timeout
+            self.running_units.append(unit)
+            unit.start_launch()
+            try:
+                process = ChildProcess(unit.get_command(), unit.get_env(), unit.get_stdout_path(), unit.get_stderr_path())
+            except Exception as e:
+                # e.g. a missing binary, ENOMEM, or a parameter that is not a
+                # string; the unit failed, it must not stay "running"
+                print("Error: failed to launch", unit.gem5_output_path + ":", repr(e))
+                unit.finish_launch(-1, termination_reason = f"launch failed: {e!r}")
+                self.__finish(unit)
+                return
+            self.processes[unit.uuid] = process
+            try:
+                return_code = await asyncio.wait_for(process.wait(), timeout)
+                unit.finish_launch(return_code, termination_reason = self.termination_requests.pop(unit.uuid, None), telemetry = process.get_telemetry())
+            except asyncio.TimeoutError:
+                print("Warn:", unit.gem5_output_path, "exceeded its timeout of", timeout, "seconds")
+                return_code = await self.__terminate(process)
+                unit.finish_launch(return_code, termination_reason = "timeout", telemetry = process.get_telemetry())
+            except asyncio.CancelledError:
+                return_code = await self.__terminate(process)
+                unit.finish_launch(return_code, status = "cancelled", termination_reason = "cancelled", telemetry = process.get_telemetry())
+                self.retrying.discard(unit.uuid)
+                self.__notify_status(unit)
+                raise
+            self.__finish(unit)
+        finally:
+            self.processes.pop(unit.uuid, None)
+            if unit in self.running_units:
+                self.running_units.remove(unit)
+            self.resource_scheduler.release(unit)
+
+    # "ready", "blocked" or "failed"
+    def __get_dependency_state(self, unit):
+        state = "ready"
+        for uuid in unit.depends_on:
+            if not uuid in self.finished:
+                state = "blocked"
+            elif self.finished[uuid] != 0:
+                return "failed"
+        return state
+
+    async def __run(self, units):
+        # treat SIGTERM to the launcher like Ctrl-C
+        asyncio.get_running_loop().add_signal_handler(signal.SIGTERM, asyncio.current_task().cancel)
+        units = iter(units)
+        exhausted = False
+        pending = []
+        running = set()
+        try:
+            while True:
+                self.__read_concurrency_file()
+                # pull at most as many launchable units as there are free
+                # slots, units waiting for their dependencies do not count
+                for not_before, unit in list(self.resubmitted):
+                    if time.time() >= not_before:
+                        self.resubmitted.remove((not_before, unit))
+                        pending.append(unit)
+                while not exhausted and sum(self.__get_dependency_state(unit) == "ready" for unit in pending) < self.max_concurrency - len(running):
+                    try:
+                        unit = next(units)
+                    except StopIteration:
+                        exhausted = True
+                        break
+                    if unit is None:
+                        break
+                    pending.append(unit)
+                not_admitted = []
+                for unit in pending:
+                    state = self.__get_dependency_state(unit)
+                    if state == "failed":
+                        print("Warn: skipping", unit.gem5_output_path, "as one of its dependencies failed")
+                        self.__skip(unit, "dependency failed")
+                        self.finished[unit.uuid] = unit.return_code
+                    elif state == "blocked":
+                        not_admitted.append(unit)
+                    elif len(running) < self.max_concurrency and self.resource_scheduler.try_acquire(unit):
+                        running.add(asyncio.create_task(self.__run_unit(unit)))
+                    else:
+                        not_admitted.append(unit)
+                pending = not_admitted
+                if exhausted and not running and not self.resubmitted:
+                    if pending:
+                        # nothing can unblock the remaining units anymore
+                        for unit in pending:
+                            print("Warn: skipping", unit.gem5_output_path, "as its dependencies are not part of the sweep")
+                            self.__skip(unit, "unresolved dependency")
+                    break
+                for process in self.processes.values():
+                    process.sample()
+                for hook in self.poll_hooks:
+                    hook(list(self.running_units))
+                if running:
+                    done, running = await asyncio.wait(running, timeout = self.poll_interval, return_when = asyncio.FIRST_COMPLETED)
+                    for task in done:
+                        if task.exception() is not None:
+                            print("Error: a unit failed to launch:", repr(task.exception()))
+                else:
+                    # nothing fits or nothing is available right now
+                    await asyncio.sleep(self.poll_interval)
+        except asyncio.CancelledError:
+            print("Info: cancelling", len(running), "running units")
+            for task in running:
+                task.cancel()
+            await asyncio.gather(*running, return_exceptions = True)
+            raise
+
+    # True if the run was cancelled (Ctrl-C or SIGTERM), the running units
+    # are then terminated and marked as "cancelled"
+    def run(self, units):
+        try:
+            asyncio.run(self.__run(units))
+        except (asyncio.CancelledError, KeyboardInterrupt):
+            print("Info: the launch was cancelled")
+            return True
+        return False
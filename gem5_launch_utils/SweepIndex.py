@@ -0,0 +1,180 @@
+from concurrent.futures import ThreadPoolExecutor
+import hashlib
+import json
+from pathlib import Path
+import threading
+
+"""
+    An append-only index of the units of a sweep, so that deciding which
+    units to skip on a relaunch reads a single file instead of locking and
+    reading every info.json.
+
+    The index lives in the directory holding the output folders of the
+    units (gem5_output_path_prefix), one JSON record per line, the last
+    record of an output path wins. When the index is missing, it is rebuilt
+    from the info.json files of that directory. A record holds the mtime of
+    the info.json it describes, so that on load the info.json files written
+    without a record (e.g. by a launcher killed between the two writes) are
+    found with a stat per unit and read again, and the output folders that
+    were removed are recorded as such.
+
+    SweepIndices records the status changes of the units reported by the
+    supervisor; the records (and the md5sum of stats.txt they hold) are
+    written by one background thread, in order, off the event loop.
+"""
+
+index_filename = "sweep_index.jsonl"
+
+def get_file_md5sum(filepath):
+    md5 = hashlib.md5()
+    with open(filepath, "rb") as f:
+        for chunk in iter(lambda: f.read(2**20), b""):
+            md5.update(chunk)
+    return md5.hexdigest()
+
+class SweepIndex:
+    def __init__(self, sweep_path):
+        self.sweep_path = Path(sweep_path)
+        self.index_path = self.sweep_path / index_filename
+        self.records = {}
+        if self.index_path.exists():
+            self.__load()
+            self.__reconcile()
+        else:
+            self.repair()
+
+    def get_unit_signature(unit):
+        return SweepIndex.__get_signature(unit.gem5_binary_path, unit.gem5_binary_hash, unit.gem5_config_path,
+                                          unit.gem5_params, unit.config_params, unit.metadata)
+
+    def __get_signature(gem5_binary_path, gem5_binary_hash, gem5_config_path, gem5_params, config_params, metadata):
+        s = json.dumps([gem5_binary_path, gem5_binary_hash, gem5_config_path, gem5_params, config_params, metadata], sort_keys=True)
+        return hashlib.sha1(s.encode()).hexdigest()
+
+    def __load(self):
+        with open(self.index_path, "r") as f:
+            for line in f:
+                try:
+                    record = json.loads(line)
+                except json.JSONDecodeError:
+                    # a torn last line of an interrupted append
+                    continue
+                self.records[record["gem5_output_path"]] = record
+
+    def __append(self, record):
+        # e.g. the running unit whose status change triggered a repair
+        if self.records.get(record["gem5_output_path"], None) == record:
+            return
+        self.records[record["gem5_output_path"]] = record
+        with open(self.index_path, "a") as f:
+            f.write(json.dumps(record, sort_keys=True) + "\n")
+
+    def __make_record(gem5_output_path, signature, status, return_code, info_mtime):
+        stats_path = Path(gem5_output_path) / "stats.txt"
+        output_hash = None
+        if status == "finished" and stats_path.exists():
+            output_hash = get_file_md5sum(stats_path)
+        elif status == "finished" and (Path(gem5_output_path) / "outputs.zst").exists():
+            # packed by gem5_stats_utils/OutputArchive, its index has the md5sum
+            from gem5_stats_utils.OutputArchive import get_output_file_md5sum
+            try:
+                output_hash = get_output_file_md5sum(gem5_output_path, "stats.txt")
+            except FileNotFoundError:
+                pass
+        return {"gem5_output_path": str(gem5_output_path),
+                "signature": signature,
+                "status": status,
+                "return_code": return_code,
+                "output_hash": output_hash,
+                "info_mtime": info_mtime}
+
+    def get_info_mtime(gem5_output_path):
+        try:
+            return (Path(gem5_output_path) / "info.json").stat().st_mtime_ns
+        except OSError:
+            return None
+
+    # rebuild the index from the info.json files of the sweep directory
+    def repair(self):
+        print("Info: rebuilding", self.index_path, "from the info.json files")
+        self.records = {}
+        if not self.sweep_path.exists():
+            return
+        self.index_path.unlink(missing_ok=True)
+        self.__reconcile()
+
+    # reads the info.json files that changed since their record
+    def __reconcile(self):
+        seen = set()
+        for info_path in sorted(self.sweep_path.glob("*/info.json")):
+            gem5_output_path = str(info_path.parent)
+            seen.add(gem5_output_path)
+            info_mtime = SweepIndex.get_info_mtime(gem5_output_path)
+            record = self.records.get(gem5_output_path, None)
+            if record is not None and record.get("info_mtime", None) == info_mtime:
+                continue
+            try:
+                with open(info_path, "r") as f:
+                    j = json.load(f)
+                signature = SweepIndex.__get_signature(j["gem5_binary_path"], j["gem5_binary_hash"], j["gem5_config_path"],
+                                                       j["gem5_params"], j["config_params"], j["metadata"])
+                record = SweepIndex.__make_record(j["gem5_output_path"], signature, j.get("status", None), j.get("return_code", -1), info_mtime)
+            except (OSError, json.JSONDecodeError, KeyError):
+                print("Warn: failed to read", info_path)
+                continue
+            self.__append(record)
+        # a removed output folder has to be simulated again
+        for gem5_output_path, record in list(self.records.items()):
+            if not gem5_output_path in seen and record["status"] is not None and not (Path(gem5_output_path) / "info.json").exists():
+                self.__append(SweepIndex.__make_record(gem5_output_path, None, None, -1, None))
+
+    # the status, return code and info.json mtime are those of the status
+    # change, read by the caller before the unit changes again
+    def record(self, gem5_output_path, signature, status, return_code, info_mtime):
+        self.__append(SweepIndex.__make_record(gem5_output_path, signature, status, return_code, info_mtime))
+
+    def is_runnable(self, unit, run_if_failed):
+        record = self.records.get(str(unit.gem5_output_path), None)
+        if record is None:
+            return True
+        if record["status"] == "running":
+            return False
+        if record["status"] != "finished":
+            # cancelled or skipped
+            return True
+        if record["return_code"] == 0:
+            if record["signature"] != SweepIndex.get_unit_signature(unit):
+                print("Warn: Not rerun an experiment but different information:", unit.gem5_output_path)
+            return False
+        return run_if_failed
+
+# one index per directory holding output folders
+class SweepIndices:
+    def __init__(self):
+        self.indices = {}
+        self.lock = threading.Lock()
+        self.writer = ThreadPoolExecutor(max_workers = 1, thread_name_prefix = "SweepIndex writer")
+
+    def get(self, unit):
+        sweep_path = str(Path(unit.gem5_output_path).parent)
+        with self.lock:
+            if not sweep_path in self.indices:
+                self.indices[sweep_path] = SweepIndex(sweep_path)
+            return self.indices[sweep_path]
+
+    # a status hook of the supervisor: the unit is read now, the index (which
+    # may need a repair) and the md5sum of stats.txt are left to the writer
+    def record(self, unit):
+        args = (str(unit.gem5_output_path), SweepIndex.get_unit_signature(unit), unit.status, unit.return_code,
+                SweepIndex.get_info_mtime(unit.gem5_output_path))
+        self.writer.submit(self.__record, unit, args)
+
+    def __record(self, unit, args):
+        try:
+            self.get(unit).record(*args)
+        except OSError as e:
+            print("Warn: failed to record", args[0], "in the sweep index:", e)
+
+    # waits for the records of the status changes so far
+    def flush(self):
+        self.writer.submit(lambda: None).result()
@@ -0,0 +1,135 @@
+import os
+import time
+from pathlib import Path
+
+from gem5_stats_utils.StatsParser import begin_marker
+
+"""
+    Terminates units that stopped making progress or are on their way to blow
+    their wall-clock budget, so that their slots go back to useful work.
+
+    A unit makes progress when one of its outputs grows (the guest terminal,
+    simout, run_stdout, or stats.txt when the stats are dumped periodically,
+    see --stats_dump_period) or when the simulated tick (finalTick of the
+    last stats dump) advances. A unit without progress for stall_timeout
+    seconds is terminated as "stalled", e.g. a guest that never reaches
+    m5 exit. Note that a guest spinning in its idle loop with periodic stats
+    dumps still counts as progressing. Without --stats_dump_period a healthy
+    ROI can run for hours without any visible progress, so such units are
+    not checked for stalls, only against their budgets (with a warning).
+
+    With a runtime history (see RuntimeHistory), a unit running for more than
+    overrun_factor times its predicted runtime, or one predicted to take more
+    than wall_budget seconds once it ran for budget_grace of it, is
+    terminated as "over budget". The reason is recorded as the unit's
+    termination_reason (FailureClassifier classes it as hang/over_budget).
+"""
+
+watched_filenames = ["board.terminal", "system.terminal", "simout", "run_stdout", "stats.txt"]
+stalled_prefix = "stalled:"
+over_budget_prefix = "over budget:"
+
+def read_last_final_tick(stats_path, tail_size = 2**22):
+    try:
+        with open(stats_path, "rb") as f:
+            f.seek(0, 2)
+            size = f.tell()
+            f.seek(max(0, size - tail_size))
+            data = f.read()
+    except OSError:
+        return None
+    start = data.rfind(begin_marker)
+    while start != -1:
+        pos = data.find(b"\nfinalTick", start)
+        if pos != -1:
+            fields = data[pos + 1:data.find(b"\n", pos + 1)].split()
+            try:
+                return int(float(fields[1]))
+            except (IndexError, ValueError):
+                return None
+        start = data.rfind(begin_marker, 0, start)
+    return None
+
+class Watchdog:
+    def __init__(self, stall_timeout = 3600, wall_budget = None, runtime_history = None, overrun_factor = 3, budget_grace = 0.1, min_poll_interval = 60):
+        self.stall_timeout = stall_timeout
+        self.wall_budget = wall_budget
+        self.runtime_history = runtime_history
+        self.overrun_factor = overrun_factor
+        self.budget_grace = budget_grace
+        self.min_poll_interval = min_poll_interval
+        self.supervisor = None
+        # per uuid: sizes of the watched files, last tick, time of the last progress
+        self.states = {}
+        self.last_poll = 0
+        self.warned_no_dumps = False
+
+    def attach(self, supervisor):
+        self.supervisor = supervisor
+        supervisor.add_poll_hook(self.poll)
+        supervisor.add_finish_hook(self.forget)
+        supervisor.add_status_hook(self.on_status)
+
+    def forget(self, unit):
+        self.states.pop(unit.uuid, None)
+
+    # a retry starts with fresh outputs
+    def on_status(self, unit):
+        if unit.status == "running":
+            self.forget(unit)
+
+    def poll(self, running_units):
+        if time.time() - self.last_poll < self.min_poll_interval:
+            return
+        self.last_poll = time.time()
+        for unit in running_units:
+            reason = self.check(unit)
+            if reason is not None:
+                self.supervisor.request_termination(unit, reason)
+
+    def __get_sizes(self, unit):
+        sizes = {}
+        for filename in watched_filenames:
+            try:
+                sizes[filename] = os.stat(Path(unit.gem5_output_path) / filename).st_size
+            except OSError:
+                pass
+        return sizes
+
+    def __has_periodic_dumps(self, unit):
+        if unit.config_params.get("--stats_dump_period", None):
+            return True
+        if not self.warned_no_dumps:
+            self.warned_no_dumps = True
+            print("Warn: units without --stats_dump_period, e.g.", unit.gem5_output_path + ", show no progress during the ROI, they are only checked against their budgets")
+        return False
+
+    # returns a termination reason, or None if the unit is fine
+    def check(self, unit):
+        now = time.time()
+        sizes = self.__get_sizes(unit)
+        state = self.states.get(unit.uuid, None)
+        if state is None:
+            state = {"sizes": {}, "tick": None, "last_progress": now}
+            self.states[unit.uuid] = state
+        if any(size > state["sizes"].get(filename, 0) for filename, size in sizes.items()):
+            state["last_progress"] = now
+        if sizes.get("stats.txt", 0) > state["sizes"].get("stats.txt", 0):
+            tick = read_last_final_tick(Path(unit.gem5_output_path) / "stats.txt")
+            if tick is not None and tick != state["tick"]:
+                state["tick"] = tick
+                state["last_progress"] = now
+        state["sizes"] = sizes
+
+        if now - state["last_progress"] > self.stall_timeout and self.__has_periodic_dumps(unit):
+            at_tick = f" at tick {state['tick']}" if state["tick"] is not None else ""
+            return f"{stalled_prefix} no progress{at_tick} for {int(now - state['last_progress'])} seconds"
+
+        elapsed = now - unit.launch_time
+        predicted = self.runtime_history.predict(unit) if self.runtime_history is not None else None
+        if predicted:
+            if elapsed > self.overrun_factor * predicted:
+                return f"{over_budget_prefix} running for {int(elapsed)} seconds, {self.overrun_factor}x the predicted {int(predicted)} seconds"
+            if self.wall_budget is not None and elapsed > self.budget_grace * self.wall_budget and predicted > self.wall_budget:
+                return f"{over_budget_prefix} predicted to run for {int(predicted)} seconds, the budget is {self.wall_budget} seconds"
+        return None
@@ -0,0 +1,282 @@
+import argparse
+import json
+import os
+import socket
+import sys
+import time
+from pathlib import Path
+
+from .ExperimentUnit import ExperimentUnit
+from .OutputRecycler import OutputRecycler
+from .RuntimeHistory import RuntimeHistory
+from .Supervisor import Supervisor
+from .SweepIndex import SweepIndices
+
+"""
+    A durable work queue on a shared directory, so that several hosts can
+    work on the same sweep.
+
+    queue_dir/
+        pending/<rank>-<uuid>.json                  units waiting for a worker
+        claimed/<rank>-<uuid>@<host>:<pid>.json     units being run by a worker
+        done/<rank>-<uuid>.json                     units that returned 0
+        failed/<rank>-<uuid>.json                   units that did not
+
+    . A worker claims a unit by renaming it from pending/ to claimed/, rename
+      is atomic so exactly one worker wins.
+    . A worker heartbeats by touching its claimed files. rename() and utime()
+      both update the ctime, which is used as the lease timestamp, so the
+      lease starts at the moment of the claim.
+    . A claim whose ctime is older than lease_timeout belongs to a crashed
+      worker (or host) and is renamed back to pending/ by any worker.
+    . The rank prefix keeps the submission order (longest predicted runtime
+      first) in the directory listing.
+    . A unit is claimed only once all the units in its depends_on list are in
+      done/, whichever worker ran them; a unit whose dependency is in failed/
+      is claimed and moved to failed/ as skipped. Waiting units stay in
+      pending/, so they do not take the slots of a worker.
+
+    Workers are started with,
+        python3 -m gem5_launch_utils.WorkQueue <queue_dir> --n_processes 32
+"""
+
+class WorkQueue:
+    subdirs = ["pending", "claimed", "done", "failed"]
+
+    def __init__(self, queue_dir, lease_timeout = 600):
+        self.queue_dir = Path(queue_dir)
+        self.lease_timeout = lease_timeout
+        self.owner = f"{socket.gethostname()}:{os.getpid()}"
+        for subdir in WorkQueue.subdirs:
+            (self.queue_dir / subdir).mkdir(parents=True, exist_ok=True)
+        # claimed path of each unit run by this worker, keyed by uuid
+        self.claims = {}
+        # units that this host cannot run (e.g. a different gem5 binary)
+        self.rejected = set()
+        # depends_on of each pending unit, keyed by entry name
+        self.dependencies = {}
+        # dependencies found in no subdir by the last scan
+        self.missing = set()
+
+    def __write_atomically(path, d):
+        tmp_path = path.with_name("." + path.name + ".tmp")
+        with open(tmp_path, "w") as f:
+            json.dump(d, f, sort_keys=True, indent=4)
+        os.replace(tmp_path, path)
+
+    def __get_job_name(claimed_name):
+        # <rank>-<uuid>@<host>:<pid>.json -> <rank>-<uuid>.json
+        return claimed_name.split("@")[0] + ".json"
+
+    def __get_uuid(entry):
+        # <rank>-<uuid>.json or <rank>-<uuid>@<host>:<pid>.json -> <uuid>
+        return entry.split("@")[0].removesuffix(".json").split("-", 1)[1]
+
+    def __list(self, subdir):
+        return [entry for entry in os.listdir(self.queue_dir / subdir) if not entry.startswith(".")]
+
+    # "ready", "blocked", "failed" or "unresolved" for each pending entry
+    # that is not rejected, in rank order. pending/ and claimed/ are listed
+    # before done/ and failed/ so that a dependency moving forward is seen in
+    # one of them; it can still be missed while a claim is given back, so a
+    # dependency is unresolved only if two scans in a row found it nowhere.
+    def __get_dependency_states(self):
+        pending = sorted(self.__list("pending"))
+        pending_entries = set(pending)
+        queued = set(WorkQueue.__get_uuid(entry) for entry in pending + self.__list("claimed"))
+        done = set(WorkQueue.__get_uuid(entry) for entry in self.__list("done"))
+        failed = set(WorkQueue.__get_uuid(entry) for entry in self.__list("failed"))
+        self.dependencies = {entry: depends_on for entry, depends_on in self.dependencies.items() if entry in pending_entries}
+        missing = set()
+        states = {}
+        for entry in pending:
+            if entry in self.rejected:
+                continue
+            if not entry in self.dependencies:
+                try:
+                    with open(self.queue_dir / "pending" / entry, "r") as f:
+                        self.dependencies[entry] = json.load(f).get("depends_on", [])
+                except FileNotFoundError:
+                    # another worker got it first
+                    continue
+            state = "ready"
+            for uuid in self.dependencies[entry]:
+                if uuid in done:
+                    continue
+                if uuid in failed:
+                    state = "failed"
+                    break
+                if not uuid in queued:
+                    if uuid in self.missing:
+                        state = "unresolved"
+                        break
+                    missing.add(uuid)
+                state = "blocked"
+            states[entry] = state
+        self.missing = missing
+        return states
+
+    def put(self, units):
+        start_rank = len(list((self.queue_dir / "pending").iterdir()))
+        for rank, unit in enumerate(units, start = start_rank):
+            path = self.queue_dir / "pending" / f"{rank:08d}-{unit.uuid}.json"
+            WorkQueue.__write_atomically(path, unit.to_dict())
+
+    def claim(self):
+        for entry, state in self.__get_dependency_states().items():
+            if state == "blocked":
+                continue
+            src = self.queue_dir / "pending" / entry
+            dst = self.queue_dir / "claimed" / (entry[:-len(".json")] + f"@{self.owner}.json")
+            try:
+                os.rename(src, dst)
+            except FileNotFoundError:
+                # another worker got it first
+                continue
+            os.utime(dst)
+            with open(dst, "r") as f:
+                unit = ExperimentUnit.init_from_dict(json.load(f))
+            if state != "ready":
+                reason = "dependency failed" if state == "failed" else "unresolved dependency"
+                print("Warn: skipping", unit.gem5_output_path + ":", reason)
+                unit.skip_launch(reason)
+                self.claims[unit.uuid] = dst
+                self.complete(unit)
+                continue
+            if not self.__is_runnable_here(unit):
+                self.rejected.add(entry)
+                os.rename(dst, src)
+                continue
+            # the dependencies are in done/, also those run by other workers,
+            # which the supervisor of this worker would wait for forever
+            unit.depends_on = []
+            self.claims[unit.uuid] = dst
+            return unit
+        return None
+
+    def __is_runnable_here(self, unit):
+        if not Path(unit.gem5_binary_path).exists():
+            print("Warn:", unit.gem5_binary_path, "does not exist on", self.owner)
+            return False
+        local_hash = ExperimentUnit.get_md5sum(unit.gem5_binary_path)
+        if local_hash != unit.gem5_binary_hash:
+            print("Warn: the gem5 binary", unit.gem5_binary_path, "on", self.owner, "differs from the one of the submitter")
+            return False
+        return True
+
+    def heartbeat(self):
+        for uuid, path in list(self.claims.items()):
+            try:
+                os.utime(path)
+            except FileNotFoundError:
+                print("Warn: lost the claim of", path.name)
+                del self.claims[uuid]
+
+    def complete(self, unit):
+        claimed_path = self.claims.pop(unit.uuid, None)
+        if claimed_path is None:
+            return
+        subdir = "done" if unit.return_code == 0 else "failed"
+        dst = self.queue_dir / subdir / WorkQueue.__get_job_name(claimed_path.name)
+        try:
+            os.rename(claimed_path, dst)
+        except FileNotFoundError:
+            # our lease expired and someone else reclaimed the unit
+            print("Warn: lost the claim of", claimed_path.name, "before completion")
+            return
+        WorkQueue.__write_atomically(dst, unit.to_dict())
+
+    # gives back the claims of the units that did not complete, e.g. when the
+    # worker is interrupted
+    def release_all(self):
+        for uuid, path in list(self.claims.items()):
+            try:
+                os.rename(path, self.queue_dir / "pending" / WorkQueue.__get_job_name(path.name))
+            except FileNotFoundError:
+                pass
+            del self.claims[uuid]
+
+    def reclaim_stale(self):
+        now = time.time()
+        for entry in os.listdir(self.queue_dir / "claimed"):
+            if entry.startswith("."):
+                continue
+            path = self.queue_dir / "claimed" / entry
+            try:
+                ctime = path.stat().st_ctime
+            except FileNotFoundError:
+                continue
+            if now - ctime < self.lease_timeout:
+                continue
+            try:
+                os.rename(path, self.queue_dir / "pending" / WorkQueue.__get_job_name(entry))
+                print("Info: reclaimed the stale claim", entry)
+            except FileNotFoundError:
+                pass
+
+    # feeds a Supervisor, yields None while other workers still hold claims
+    # that might have to be reclaimed later
+    def iter_units(self, reclaim_interval = 60):
+        last_reclaim = 0
+        while True:
+            if time.time() - last_reclaim > reclaim_interval:
+                self.reclaim_stale()
+                last_reclaim = time.time()
+            unit = self.claim()
+            if unit is not None:
+                yield unit
+            elif not self.__has_runnable_pending() and not self.__has_foreign_claims():
+                # our own claims are already in the supervisor's hands
+                return
+            else:
+                yield None
+
+    # including units waiting for their dependencies
+    def __has_runnable_pending(self):
+        return any(not entry in self.rejected for entry in self.__list("pending"))
+
+    def __has_foreign_claims(self):
+        return any(not entry.endswith(f"@{self.owner}.json") for entry in os.listdir(self.queue_dir / "claimed") if not entry.startswith("."))
+
+def run_worker(queue_dir, n_processes, lease_timeout = 600, heartbeat_interval = 60, timeout = None):
+    queue = WorkQueue(queue_dir, lease_timeout)
+    runtime_history = RuntimeHistory()
+    output_recycler = OutputRecycler()
+    sweep_indices = SweepIndices()
+    supervisor = Supervisor(max_concurrency = n_processes, timeout = timeout, output_recycler = output_recycler)
+
+    last_heartbeat = 0
+    def heartbeat(running_units):
+        nonlocal last_heartbeat
+        if time.time() - last_heartbeat > heartbeat_interval:
+            queue.heartbeat()
+            last_heartbeat = time.time()
+
+    def record_runtime(unit):
+        if unit.return_code == 0 and unit.run_time >= 0:
+            runtime_history.record(unit, unit.run_time)
+
+    supervisor.add_poll_hook(heartbeat)
+    supervisor.add_finish_hook(record_runtime)
+    supervisor.add_finish_hook(queue.complete)
+    # the launcher skips the units already run by the workers
+    supervisor.add_status_hook(sweep_indices.record)
+    try:
+        return supervisor.run(queue.iter_units())
+    finally:
+        sweep_indices.flush()
+        queue.release_all()
+        runtime_history.save()
+        output_recycler.close()
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description = "Run experiment units from a shared work queue")
+    parser.add_argument("queue_dir", type=str, help="Path to the shared queue directory")
+    parser.add_argument("--n_processes", type=int, default=os.cpu_count(), help="Maximum number of concurrent units on this host")
+    parser.add_argument("--lease_timeout", type=int, default=600, help="Seconds without heartbeat after which a claim is considered stale")
+    parser.add_argument("--timeout", type=int, default=None, help="Default wall-clock limit per unit in seconds")
+    args = parser.parse_args()
+
+    if run_worker(args.queue_dir, args.n_processes, lease_timeout = args.lease_timeout, timeout = args.timeout):
+        # cancelled, the claims of the running units were given back
+        sys.exit(1)
@@ -0,0 +1,175 @@
+import argparse
+import hashlib
+import json
+import os
+import struct
+import sys
+from pathlib import Path
+
+import zstandard
+
+"""
+    A random-access zstd archive of the output files of a unit.
+
+    pack_output() replaces the top-level files of an output folder (stats.txt,
+    config.ini, config.json, simout, simerr, run_stdout, run_stderr, ...) with
+        <gem5_output_path>/outputs.zst
+    info.json stays as it is, and directories (e.g. checkpoints) are left
+    alone. Each member is cut into frame_size pieces that are compressed as
+    independent zstd frames, and the member index (offset and compressed size
+    of every frame, size and md5sum of every member) is appended as a zstd
+    skippable frame. Reading a byte range of a member only decompresses the
+    frames holding it, and `zstd -d outputs.zst` still works (it outputs the
+    concatenated members).
+
+    read_output_file() returns the content of an output file whether or not
+    the folder has been packed; the stats parser uses it.
+"""
+
+archive_filename = "outputs.zst"
+# files that are read and rewritten by the launch utilities
+unpacked_filenames = ["info.json", "info.json.lock", archive_filename]
+
+default_frame_size = 2**22
+skippable_frame_magic = 0x184D2A5E
+index_magic = b"G5OUTIDX"
+# index length + index magic at the end of the archive
+trailer_size = 4 + len(index_magic)
+
+def get_archive_path(output_path):
+    return Path(output_path) / archive_filename
+
+class OutputArchive:
+    def __init__(self, archive_path):
+        self.archive_path = Path(archive_path)
+        with open(self.archive_path, "rb") as f:
+            f.seek(-trailer_size, os.SEEK_END)
+            trailer = f.read(trailer_size)
+            if trailer[4:] != index_magic:
+                raise ValueError(f"{self.archive_path} is not an output archive")
+            index_size = struct.unpack("<I", trailer[:4])[0]
+            f.seek(-trailer_size - index_size, os.SEEK_END)
+            self.index = json.loads(f.read(index_size))
+        self.frame_size = self.index["frame_size"]
+        self.members = self.index["members"]
+
+    def get_names(self):
+        return list(self.members.keys())
+
+    def has_member(self, name):
+        return name in self.members
+
+    def get_size(self, name):
+        return self.members[name]["size"]
+
+    def get_md5sum(self, name):
+        return self.members[name]["md5sum"]
+
+    # length None reads up to the end of the member
+    def read(self, name, start = 0, length = None):
+        member = self.members[name]
+        end = member["size"] if length is None else min(member["size"], start + length)
+        if start >= end:
+            return b""
+        first_frame = start // self.frame_size
+        last_frame = (end - 1) // self.frame_size
+        decompressor = zstandard.ZstdDecompressor()
+        pieces = []
+        with open(self.archive_path, "rb") as f:
+            for offset, compressed_size in member["frames"][first_frame:last_frame + 1]:
+                f.seek(offset)
+                pieces.append(decompressor.decompress(f.read(compressed_size)))
+        data = b"".join(pieces)
+        skip = start - first_frame * self.frame_size
+        return data[skip:skip + end - start]
+
+def pack_output(output_path, level = 3, frame_size = default_frame_size, remove_originals = True):
+    output_path = Path(output_path)
+    archive_path = get_archive_path(output_path)
+    if archive_path.exists():
+        print("Warn:", output_path, "is already packed")
+        return None
+    paths = sorted(path for path in output_path.iterdir() if path.is_file() and not path.is_symlink() and not path.name in unpacked_filenames)
+    compressor = zstandard.ZstdCompressor(level = level, write_content_size = True)
+    members = {}
+    tmp_path = output_path / ("." + archive_filename + ".tmp")
+    with open(tmp_path, "wb") as f:
+        for path in paths:
+            frames = []
+            md5 = hashlib.md5()
+            size = 0
+            with open(path, "rb") as g:
+                for chunk in iter(lambda: g.read(frame_size), b""):
+                    md5.update(chunk)
+                    size += len(chunk)
+                    frame = compressor.compress(chunk)
+                    frames.append((f.tell(), len(frame)))
+                    f.write(frame)
+            members[path.name] = {"size": size, "md5sum": md5.hexdigest(), "frames": frames}
+        index = json.dumps({"frame_size": frame_size, "members": members}, separators = (",", ":")).encode()
+        payload = index + struct.pack("<I", len(index)) + index_magic
+        f.write(struct.pack("<II", skippable_frame_magic, len(payload)))
+        f.write(payload)
+    os.replace(tmp_path, archive_path)
+    if remove_originals:
+        for path in paths:
+            path.unlink()
+    return archive_path
+
+def has_output_file(output_path, name):
+    if (Path(output_path) / name).exists():
+        return True
+    archive_path = get_archive_path(output_path)
+    return archive_path.exists() and OutputArchive(archive_path).has_member(name)
+
+# the content of an output file, from the folder or from its archive
+def read_output_file(output_path, name):
+    path = Path(output_path) / name
+    if path.exists():
+        with open(path, "rb") as f:
+            return f.read()
+    archive_path = get_archive_path(output_path)
+    if archive_path.exists():
+        archive = OutputArchive(archive_path)
+        if archive.has_member(name):
+            return archive.read(name)
+    raise FileNotFoundError(str(path))
+
+# the md5sum of an output file without decompressing it if it is archived
+def get_output_file_md5sum(output_path, name):
+    path = Path(output_path) / name
+    if path.exists():
+        md5 = hashlib.md5()
+        with open(path, "rb") as f:
+            for chunk in iter(lambda: f.read(2**20), b""):
+                md5.update(chunk)
+        return md5.hexdigest()
+    archive_path = get_archive_path(output_path)
+    if archive_path.exists():
+        archive = OutputArchive(archive_path)
+        if archive.has_member(name):
+            return archive.get_md5sum(name)
+    raise FileNotFoundError(str(path))
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description = "Pack gem5 output folders, or print a member of a packed one")
+    subparsers = parser.add_subparsers(dest = "command", required = True)
+    pack_parser = subparsers.add_parser("pack")
+    pack_parser.add_argument("output_paths", type=str, nargs="+")
+    pack_parser.add_argument("--level", type=int, default=3, help="zstd compression level")
+    cat_parser = subparsers.add_parser("cat")
+    cat_parser.add_argument("output_path", type=str)
+    cat_parser.add_argument("name", type=str)
+    list_parser = subparsers.add_parser("list")
+    list_parser.add_argument("output_path", type=str)
+    args = parser.parse_args()
+
+    if args.command == "pack":
+        for output_path in args.output_paths:
+            pack_output(output_path, level = args.level)
+    elif args.command == "cat":
+        sys.stdout.buffer.write(read_output_file(args.output_path, args.name))
+    elif args.command == "list":
+        archive = OutputArchive(get_archive_path(args.output_path))
+        for name in archive.get_names():
+            print(name, archive.get_size(name))
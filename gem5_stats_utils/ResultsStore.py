@@ -0,0 +1,244 @@
+import json
+import os
+import uuid
+from pathlib import Path
+
+import pyarrow as pa
+import pyarrow.ipc
+
+from .StatsParser import parse_stats
+
+"""
+    A columnar (Arrow IPC) store of the results of a sweep.
+
+    Each finished unit becomes one row: a few fields of info.json, every
+    metadata key produced by the launcher's metadata_generator, the host
+    telemetry ("telemetry.<key>", see gem5_launch_utils/HostTelemetry), the
+    simulation throughput ("sim.<key>", see SimThroughput) and the selected
+    stats (value of the last dump, or of the dump given by
+    stats_dump). Rows are buffered and written as record-batch files,
+        <store_path>/schema.json
+        <store_path>/part-<uuid>.arrow
+    and compact() merges the parts into one file. read() returns the whole
+    store as a single pyarrow.Table, so cross-sweep analysis never has to
+    glob the results tree or re-parse the output folder names.
+
+    Metadata values are strings in info.json; a metadata column whose values
+    all parse as booleans ("True"/"False"), integers or floats gets that type.
+    The schema grows with the rows: a new key (e.g. the stats of a fourth
+    memory channel) becomes a new column, and a column whose new values do
+    not fit its type is widened, int64 to double and anything else to
+    string. Each part keeps the schema it was written with; read() widens
+    all the parts to the union of their schemas, with nulls for the columns
+    a part does not have.
+"""
+
+info_columns = {"uuid": "string",
+                "gem5_output_path": "string",
+                "gem5_binary_hash": "string",
+                "status": "string",
+                "return_code": "int64",
+                "run_time": "double"}
+
+arrow_types = {"string": pa.string(), "int64": pa.int64(), "double": pa.float64(), "bool": pa.bool_()}
+type_names = {arrow_type: type_name for type_name, arrow_type in arrow_types.items()}
+
+numeric_prefixes = ("stats.", "telemetry.", "sim.")
+
+def infer_type(values):
+    values = [value for value in values if value is not None]
+    if not values:
+        return "string"
+    if all(isinstance(value, bool) or value in ("True", "False") for value in values):
+        return "bool"
+    for type_name, converter in (("int64", int), ("double", float)):
+        try:
+            for value in values:
+                converter(value)
+            return type_name
+        except (TypeError, ValueError):
+            pass
+    return "string"
+
+# the narrowest type holding the values of both types, None is no type yet
+def widen_type(type_name, other_type_name):
+    if type_name is None or type_name == other_type_name:
+        return other_type_name
+    if other_type_name is None:
+        return type_name
+    if set([type_name, other_type_name]) == set(["int64", "double"]):
+        return "double"
+    return "string"
+
+def convert(value, type_name):
+    if value is None:
+        return None
+    try:
+        if type_name == "bool":
+            return value if isinstance(value, bool) else value == "True"
+        if type_name == "int64":
+            return int(value)
+        if type_name == "double":
+            return float(value)
+    except (TypeError, ValueError):
+        return None
+    return str(value)
+
+class ResultsStore:
+    def __init__(self, store_path, stat_names = [], stats_dump = -1, flush_every = 64):
+        self.store_path = Path(store_path)
+        self.store_path.mkdir(parents=True, exist_ok=True)
+        self.schema_path = self.store_path / "schema.json"
+        self.stat_names = list(stat_names)
+        self.stats_dump = stats_dump
+        self.flush_every = flush_every
+        self.buffer = []
+        self.column_types = None
+        if self.schema_path.exists():
+            with open(self.schema_path, "r") as f:
+                self.column_types = json.load(f)
+
+    def get_schema(self):
+        return pa.schema([(name, arrow_types[type_name]) for name, type_name in self.column_types.items()])
+
+    def __make_row(self, info):
+        row = {key: info.get(key, None) for key in info_columns}
+        for key, val in info.get("metadata", {}).items():
+            row[key] = val
+        for key, val in (info.get("telemetry", None) or {}).items():
+            row["telemetry." + key] = val
+        for key, val in (info.get("sim_throughput", None) or {}).items():
+            row["sim." + key] = val
+        stats_path = Path(info["gem5_output_path"]) / "stats.txt"
+        if self.stat_names:
+            try:
+                # also reads packed output folders
+                stats = parse_stats(stats_path, self.stat_names)
+            except FileNotFoundError:
+                stats = {}
+            for name, values in stats.items():
+                if len(values) > 0:
+                    row["stats." + name] = float(values[self.stats_dump])
+        return row
+
+    def __load_schema(self):
+        if not self.schema_path.exists():
+            return {}
+        try:
+            with open(self.schema_path, "r") as f:
+                return json.load(f)
+        except (OSError, json.JSONDecodeError):
+            print("Warn: failed to read", self.schema_path)
+            return {}
+
+    # adds the new columns of rows to the schema and widens the columns whose
+    # values do not fit, merged with what other writers saved in the meantime
+    def __evolve_schema(self, rows):
+        on_disk = self.__load_schema()
+        column_types = dict(info_columns)
+        for types in (on_disk, self.column_types or {}):
+            for key, type_name in types.items():
+                column_types[key] = widen_type(column_types.get(key, None), type_name)
+        keys = []
+        for row in rows:
+            for key in row:
+                if not key in keys:
+                    keys.append(key)
+        for key in keys:
+            values = [row[key] for row in rows if row.get(key, None) is not None]
+            if not values:
+                continue
+            type_name = infer_type(values)
+            if key.startswith(numeric_prefixes):
+                type_name = widen_type("double", type_name)
+            if key in column_types and widen_type(column_types[key], type_name) != column_types[key]:
+                print("Info: widening the column", key, "of", self.store_path, "from", column_types[key], "to", widen_type(column_types[key], type_name))
+            column_types[key] = widen_type(column_types.get(key, None), type_name)
+        self.column_types = column_types
+        if column_types != on_disk:
+            tmp_path = self.schema_path.with_name(self.schema_path.name + f".{os.getpid()}.tmp")
+            with open(tmp_path, "w") as f:
+                json.dump(column_types, f, indent=4)
+            os.replace(tmp_path, self.schema_path)
+
+    # info is the content of a unit's info.json (or ExperimentUnit.to_dict())
+    def add(self, info):
+        self.buffer.append(self.__make_row(info))
+        if len(self.buffer) >= self.flush_every:
+            self.flush()
+
+    def add_unit(self, unit):
+        self.add(unit.to_dict())
+
+    def flush(self):
+        if not self.buffer:
+            return
+        self.__evolve_schema(self.buffer)
+        columns = {name: [convert(row.get(name, None), type_name) for row in self.buffer] for name, type_name in self.column_types.items()}
+        table = pa.Table.from_pydict(columns, schema = self.get_schema())
+        self.__write_part(table)
+        self.buffer = []
+
+    def __write_part(self, table):
+        part_path = self.store_path / f"part-{uuid.uuid4()}.arrow"
+        tmp_path = self.store_path / ("." + part_path.name + ".tmp")
+        with pa.OSFile(str(tmp_path), "wb") as sink:
+            with pa.ipc.new_file(sink, table.schema) as writer:
+                writer.write_table(table)
+        os.replace(tmp_path, part_path)
+
+    def __get_part_paths(self):
+        return sorted(self.store_path.glob("part-*.arrow"))
+
+    def __widen_column(column, type_name):
+        if column.type == arrow_types[type_name]:
+            return column
+        return pa.array([convert(value, type_name) for value in column.to_pylist()], arrow_types[type_name])
+
+    def read(self):
+        part_paths = self.__get_part_paths()
+        if not part_paths:
+            return self.get_schema().empty_table() if self.column_types else pa.table({})
+        tables = [pa.ipc.open_file(pa.memory_map(str(path))).read_all() for path in part_paths]
+        # the union of the schemas of the parts, in the order of schema.json
+        column_types = dict(self.column_types or {})
+        for table in tables:
+            for field in table.schema:
+                column_types[field.name] = widen_type(column_types.get(field.name, None), type_names[field.type])
+        self.column_types = column_types
+        tables = [pa.table({name: ResultsStore.__widen_column(table.column(name), type_name) if name in table.column_names else pa.nulls(len(table), arrow_types[type_name])
+                            for name, type_name in column_types.items()}, schema = self.get_schema())
+                  for table in tables]
+        return pa.concat_tables(tables)
+
+    # merges all parts into one, the last row of a uuid wins
+    def compact(self):
+        part_paths = self.__get_part_paths()
+        if len(part_paths) <= 1:
+            return
+        table = self.read()
+        uuids = table.column("uuid").to_pylist()
+        last = {}
+        for i, unit_uuid in enumerate(uuids):
+            last[unit_uuid] = i
+        table = table.take(sorted(last.values()))
+        self.__write_part(table)
+        for part_path in part_paths:
+            part_path.unlink()
+
+    # one-off ingestion of the info.json files of an existing sweep directory
+    def ingest_sweep(self, sweep_path):
+        known = set()
+        if self.column_types is not None:
+            known = set(self.read().column("uuid").to_pylist())
+        for info_path in sorted(Path(sweep_path).glob("*/info.json")):
+            try:
+                with open(info_path, "r") as f:
+                    info = json.load(f)
+            except (OSError, json.JSONDecodeError):
+                print("Warn: failed to read", info_path)
+                continue
+            if info.get("uuid", None) in known or info.get("status", None) != "finished":
+                continue
+            self.add(info)
+        self.flush()
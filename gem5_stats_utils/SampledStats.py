@@ -0,0 +1,72 @@
+import argparse
+import json
+import statistics
+from pathlib import Path
+
+import numpy as np
+
+from .StatsParser import parse_stats
+
+"""
+    Estimates of sampled simulations (the --sampling_period mode of
+    experiment-10-CHI-correct-latency/configs/gem5/arm64sve-chi.py).
+
+    Each dump of stats.txt of a sampled simulation is one measured window.
+    get_sampled_estimates() takes the mean of each stat over the windows, with
+    the half width of its confidence interval (normal approximation, as in
+    SMARTS), e.g. for 30 windows:
+        {"simSeconds": {"mean": 1e-05, "half_width": 2e-07, "n_windows": 30}, ...}
+    Counts (instructions, bytes read) are per window; for rates and ratios
+    (IPC, bandwidth) the mean is the estimate of the whole ROI.
+
+        python3 -m gem5_stats_utils.SampledStats <output folder> --stats <names>
+"""
+
+def get_z(confidence):
+    return statistics.NormalDist().inv_cdf((1 + confidence) / 2)
+
+def get_estimate(values, confidence = 0.997):
+    values = np.asarray(values, dtype = float)
+    values = values[~np.isnan(values)]
+    if len(values) == 0:
+        return None
+    mean = float(values.mean())
+    half_width = get_z(confidence) * float(values.std(ddof = 1)) / len(values) ** 0.5 if len(values) > 1 else float("inf")
+    return {"mean": mean, "half_width": half_width, "n_windows": len(values)}
+
+def get_sampled_estimates(output_path, names, confidence = 0.997):
+    stats = parse_stats(Path(output_path) / "stats.txt", names)
+    estimates = {}
+    for name, values in stats.items():
+        estimate = get_estimate(values, confidence)
+        if estimate is not None:
+            estimates[name] = estimate
+    return estimates
+
+# the number of windows for a relative error of error, given the windows so far
+# (the half width shrinks with the square root of the number of windows)
+def get_required_windows(values, error, confidence = 0.997):
+    estimate = get_estimate(values, confidence)
+    if estimate is None or estimate["n_windows"] < 2 or estimate["mean"] == 0:
+        return None
+    relative_error = estimate["half_width"] / abs(estimate["mean"])
+    return int(np.ceil(estimate["n_windows"] * (relative_error / error) ** 2))
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description = "Estimate stats with confidence intervals from the windows of a sampled simulation")
+    parser.add_argument("output_path", type=str)
+    parser.add_argument("--stats", type=str, nargs="+", required=True)
+    parser.add_argument("--confidence", type=float, default=0.997)
+    parser.add_argument("--error", type=float, default=None, help="Also print the number of windows needed for this relative error")
+    args = parser.parse_args()
+
+    stats = parse_stats(Path(args.output_path) / "stats.txt", args.stats)
+    for name, values in sorted(stats.items()):
+        estimate = get_estimate(values, args.confidence)
+        if estimate is None:
+            print(f"{name}: no windows")
+            continue
+        line = f"{name}: {estimate['mean']:.6g} +- {estimate['half_width']:.3g} ({estimate['n_windows']} windows)"
+        if args.error is not None:
+            line += f", {get_required_windows(values, args.error, args.confidence)} windows for {args.error}"
+        print(line)
@@ -0,0 +1,233 @@
+import argparse
+import fnmatch
+import gzip
+import json
+import math
+from pathlib import Path
+
+import numpy as np
+
+from .StatsParser import parse_stats
+
+"""
+    SimPoint analysis: picking representative intervals from basic-block
+    vectors, and weighting the stats of their detailed simulations back into
+    whole-program estimates.
+
+    The profiling run writes one basic-block vector (BBV) file per core,
+        <profile output>/simpoint.<core>.bb.gz
+    with one line per interval of `interval` instructions,
+        T:<basic block id>:<count> :<basic block id>:<count> ...
+    The i-th intervals of all cores make up the i-th interval of the program.
+    Profile folders packed by OutputArchive are read from their outputs.zst.
+    pick_simpoints() follows SimPoint 3.0: the vectors are normalized, randomly
+    projected to n_dims dimensions and clustered by k-means for k up to max_k;
+    the smallest k whose BIC reaches bic_threshold of the range of BICs is
+    kept. Each cluster is represented by the interval closest to its
+    centroid, weighted by the fraction of the intervals in the cluster:
+        [{"index": 12, "weight": 0.25, "cluster": 0}, ...]
+
+    get_weighted_stats() combines the last dump of the stats.txt of each
+    simpoint: "per_interval" is the weighted mean, i.e. the estimate for
+    rates and ratios (IPC, bandwidth), and "total" scales it by the number
+    of intervals, the estimate for counts (instructions, bytes read).
+
+        python3 -m gem5_stats_utils.SimPoint pick <profile output> --max_k 30
+        python3 -m gem5_stats_utils.SimPoint weight simpoints.json <simpoint outputs> --stats <names>
+"""
+
+bbv_filename_pattern = "simpoint.*.bb.gz"
+
+def read_bbv_lines(lines):
+    intervals = []
+    for line in lines:
+        if not line.startswith("T"):
+            continue
+        vector = {}
+        for field in line[1:].split():
+            _, block_id, count = field.split(":")
+            vector[int(block_id)] = vector.get(int(block_id), 0) + int(count)
+        intervals.append(vector)
+    return intervals
+
+def read_bbv_file(path):
+    with gzip.open(path, "rt") as f:
+        return read_bbv_lines(f)
+
+# the BBV files of a profile folder packed by OutputArchive
+def _read_archived_bbv_files(profile_path):
+    from .OutputArchive import OutputArchive, get_archive_path
+    archive_path = get_archive_path(profile_path)
+    if not archive_path.exists():
+        return []
+    archive = OutputArchive(archive_path)
+    names = sorted(name for name in archive.get_names() if fnmatch.fnmatch(name, bbv_filename_pattern))
+    return [read_bbv_lines(gzip.decompress(archive.read(name)).decode().splitlines()) for name in names]
+
+# {(core, basic block id): count} per interval, the cores of profile_path
+def read_bbvs(profile_path):
+    paths = sorted(Path(profile_path).glob(bbv_filename_pattern))
+    if paths:
+        per_core = [read_bbv_file(path) for path in paths]
+    else:
+        per_core = _read_archived_bbv_files(profile_path)
+    if not per_core:
+        raise FileNotFoundError(f"no {bbv_filename_pattern} in {profile_path}")
+    n_intervals = max(len(intervals) for intervals in per_core)
+    bbvs = []
+    for i in range(n_intervals):
+        vector = {}
+        for core, intervals in enumerate(per_core):
+            if i < len(intervals):
+                for block_id, count in intervals[i].items():
+                    vector[(core, block_id)] = count
+        bbvs.append(vector)
+    return bbvs
+
+def project_bbvs(bbvs, n_dims = 15, seed = 0):
+    rng = np.random.default_rng(seed)
+    # one random row per basic block, drawn in the order they are first seen
+    rows = {}
+    points = np.zeros((len(bbvs), n_dims))
+    for i, vector in enumerate(bbvs):
+        total = sum(vector.values())
+        if total == 0:
+            continue
+        for key, count in vector.items():
+            if not key in rows:
+                rows[key] = rng.uniform(-1, 1, n_dims)
+            points[i] += rows[key] * (count / total)
+    return points
+
+def _kmeans(points, k, rng, n_iterations = 100):
+    # k-means++ seeding
+    centroids = [points[rng.integers(len(points))]]
+    for _ in range(1, k):
+        distances = np.min([np.sum((points - centroid) ** 2, axis = 1) for centroid in centroids], axis = 0)
+        if distances.sum() == 0:
+            centroids.append(points[rng.integers(len(points))])
+        else:
+            centroids.append(points[rng.choice(len(points), p = distances / distances.sum())])
+    centroids = np.array(centroids)
+    labels = None
+    for _ in range(n_iterations):
+        distances = np.sum((points[:, None, :] - centroids[None, :, :]) ** 2, axis = 2)
+        new_labels = np.argmin(distances, axis = 1)
+        if labels is not None and np.array_equal(labels, new_labels):
+            break
+        labels = new_labels
+        for j in range(k):
+            if np.any(labels == j):
+                centroids[j] = points[labels == j].mean(axis = 0)
+    sse = float(np.sum((points - centroids[labels]) ** 2))
+    return labels, centroids, sse
+
+def kmeans(points, k, n_init = 5, seed = 0):
+    rng = np.random.default_rng(seed)
+    best = None
+    for _ in range(n_init):
+        result = _kmeans(points, k, rng)
+        if best is None or result[2] < best[2]:
+            best = result
+    return best
+
+# Bayesian information criterion of a clustering (Pelleg and Moore, X-means),
+# larger is better
+def get_bic(points, labels, k, sse):
+    n_points, n_dims = points.shape
+    if n_points <= k:
+        return -math.inf
+    variance = sse / (n_points - k) / n_dims
+    if variance <= 0:
+        return math.inf
+    log_likelihood = 0.0
+    for j in range(k):
+        n_cluster = int(np.sum(labels == j))
+        if n_cluster == 0:
+            continue
+        log_likelihood += (- n_cluster / 2 * math.log(2 * math.pi)
+                           - n_cluster * n_dims / 2 * math.log(variance)
+                           - (n_cluster - k) / 2
+                           + n_cluster * math.log(n_cluster)
+                           - n_cluster * math.log(n_points))
+    n_parameters = (k - 1) + k * n_dims + 1
+    return log_likelihood - n_parameters / 2 * math.log(n_points)
+
+def pick_simpoints(bbvs, max_k = 30, n_dims = 15, bic_threshold = 0.9, seed = 0):
+    points = project_bbvs(bbvs, n_dims, seed)
+    clusterings = []
+    for k in range(1, min(max_k, len(points)) + 1):
+        labels, centroids, sse = kmeans(points, k, seed = seed)
+        clusterings.append((k, labels, centroids, get_bic(points, labels, k, sse)))
+    bics = [bic for k, labels, centroids, bic in clusterings if math.isfinite(bic)]
+    k, labels, centroids, bic = clusterings[-1]
+    if bics:
+        threshold = min(bics) + bic_threshold * (max(bics) - min(bics))
+        for clustering in clusterings:
+            if clustering[3] >= threshold:
+                k, labels, centroids, bic = clustering
+                break
+    simpoints = []
+    for j in range(k):
+        members = np.flatnonzero(labels == j)
+        if len(members) == 0:
+            continue
+        distances = np.sum((points[members] - centroids[j]) ** 2, axis = 1)
+        simpoints.append({"index": int(members[np.argmin(distances)]),
+                          "weight": len(members) / len(points),
+                          "cluster": j})
+    return sorted(simpoints, key = lambda simpoint: simpoint["index"])
+
+def save_simpoints(path, simpoints, n_intervals, interval):
+    with open(path, "w") as f:
+        json.dump({"interval": interval, "n_intervals": n_intervals, "simpoints": simpoints}, f, indent = 4)
+
+def load_simpoints(path):
+    with open(path, "r") as f:
+        return json.load(f)
+
+# simpoints as saved by save_simpoints(), output_paths[i] is the output folder
+# of the detailed simulation of simpoints["simpoints"][i]
+def get_weighted_stats(simpoints, output_paths, names):
+    per_interval = {}
+    total_weight = 0.0
+    for simpoint, output_path in zip(simpoints["simpoints"], output_paths):
+        stats = parse_stats(Path(output_path) / "stats.txt", names)
+        total_weight += simpoint["weight"]
+        for name, values in stats.items():
+            if len(values) == 0 or values[-1] != values[-1]:
+                continue
+            per_interval[name] = per_interval.get(name, 0.0) + simpoint["weight"] * float(values[-1])
+    weighted = {}
+    for name, value in per_interval.items():
+        # renormalized if a simpoint is missing
+        value /= total_weight
+        weighted[name] = {"per_interval": value, "total": value * simpoints["n_intervals"]}
+    return weighted
+
+def save_weighted_stats(path, weighted):
+    with open(path, "w") as f:
+        json.dump(weighted, f, indent = 4, sort_keys = True)
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description = "Pick simpoints from basic-block vectors, or weight the stats of their simulations")
+    subparsers = parser.add_subparsers(dest = "command", required = True)
+    pick_parser = subparsers.add_parser("pick")
+    pick_parser.add_argument("profile_path", type=str, help="Output folder holding simpoint.<core>.bb.gz")
+    pick_parser.add_argument("--interval", type=int, default=None, help="Instructions per interval, recorded in the output")
+    pick_parser.add_argument("--max_k", type=int, default=30)
+    pick_parser.add_argument("--output", type=str, default="simpoints.json")
+    weight_parser = subparsers.add_parser("weight")
+    weight_parser.add_argument("simpoints_path", type=str)
+    weight_parser.add_argument("output_paths", type=str, nargs="+", help="Output folders of the simpoints, in the order of simpoints.json")
+    weight_parser.add_argument("--stats", type=str, nargs="+", required=True)
+    args = parser.parse_args()
+
+    if args.command == "pick":
+        bbvs = read_bbvs(args.profile_path)
+        simpoints = pick_simpoints(bbvs, args.max_k)
+        save_simpoints(args.output, simpoints, len(bbvs), args.interval)
+        print("Info:", len(simpoints), "simpoints out of", len(bbvs), "intervals")
+    elif args.command == "weight":
+        weighted = get_weighted_stats(load_simpoints(args.simpoints_path), args.output_paths, args.stats)
+        print(json.dumps(weighted, indent = 4, sort_keys = True))
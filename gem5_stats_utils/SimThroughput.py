@@ -0,0 +1,136 @@
+import argparse
+import json
+from pathlib import Path
+
+from .StatsParser import parse_stats
+
+"""
+    How fast gem5 simulated each unit.
+
+    gem5 reports its own speed in stats.txt (hostSeconds, hostInstRate,
+    hostTickRate, hostMemory). get_sim_throughput() takes them from the last
+    dump, which for the ROI configs covers the ROI since the stats reset at
+    m5_work_begin(). The launcher stores the result as unit.sim_throughput
+    in info.json.
+
+    compare_binaries() lines up the same workloads simulated by different gem5
+    binaries (gem5_binary_hash), e.g. ARM_CHI vs ARM_MESI_Three_Level builds:
+        python3 -m gem5_stats_utils.SimThroughput <sweep dir> ... --compare
+"""
+
+host_stat_names = ["hostSeconds", "hostInstRate", "hostOpRate", "hostTickRate", "hostMemory", "simInsts", "simSeconds"]
+default_workload_keys = ["workload-naming-string", "vlen", "num_ccds", "num_channels"]
+
+def get_sim_throughput(gem5_output_path):
+    try:
+        stats = parse_stats(Path(gem5_output_path) / "stats.txt", host_stat_names)
+    except FileNotFoundError:
+        return None
+    if not "hostSeconds" in stats:
+        return None
+    throughput = {"n_dumps": len(stats["hostSeconds"])}
+    for name, values in stats.items():
+        if len(values) > 0 and values[-1] == values[-1]:
+            throughput[name] = float(values[-1])
+    return throughput
+
+def _get_throughput(info):
+    throughput = info.get("sim_throughput", None)
+    if throughput is None and info.get("status", None) == "finished":
+        throughput = get_sim_throughput(info["gem5_output_path"])
+    return throughput
+
+# per group of keys: number of units, total host seconds, mean rates
+def summarize_sim_throughput(infos, keys = default_workload_keys):
+    groups = {}
+    for info in infos:
+        throughput = _get_throughput(info)
+        if not throughput or not "hostSeconds" in throughput:
+            continue
+        metadata = info.get("metadata", {})
+        group = tuple(metadata.get(key, None) for key in keys)
+        groups.setdefault(group, []).append(throughput)
+    rows = []
+    for group, throughputs in groups.items():
+        row = dict(zip(keys, group))
+        row["n_units"] = len(throughputs)
+        row["host_seconds"] = sum(throughput["hostSeconds"] for throughput in throughputs)
+        for name in ["hostInstRate", "hostTickRate"]:
+            values = [throughput[name] for throughput in throughputs if name in throughput]
+            row[name] = sum(values) / len(values) if values else None
+        row["hostMemory"] = max((throughput.get("hostMemory", 0) for throughput in throughputs), default = 0)
+        rows.append(row)
+    return sorted(rows, key = lambda row: row["host_seconds"], reverse = True)
+
+# {workload group: {gem5_binary_hash: mean hostSeconds}}, only for the
+# workloads that were simulated by more than one binary
+def compare_binaries(infos, keys = default_workload_keys):
+    groups = {}
+    for info in infos:
+        throughput = _get_throughput(info)
+        if not throughput or not "hostSeconds" in throughput:
+            continue
+        metadata = info.get("metadata", {})
+        group = tuple(metadata.get(key, None) for key in keys)
+        groups.setdefault(group, {}).setdefault(info.get("gem5_binary_hash", None), []).append(throughput["hostSeconds"])
+    comparison = {}
+    for group, binaries in groups.items():
+        if len(binaries) > 1:
+            comparison[group] = {binary_hash: sum(values) / len(values) for binary_hash, values in binaries.items()}
+    return comparison
+
+def print_binary_comparison(infos, keys = default_workload_keys):
+    comparison = compare_binaries(infos, keys)
+    if not comparison:
+        print("Info: no workload was simulated by more than one gem5 binary")
+        return
+    # a path the binary was seen at, for display
+    binary_paths = {}
+    for info in infos:
+        binary_paths.setdefault(info.get("gem5_binary_hash", None), info.get("gem5_binary_path", ""))
+    def get_label(binary_hash):
+        return str(binary_hash)[:8] + " " + str(binary_paths.get(binary_hash, ""))
+    # relative to the fastest binary of each workload
+    slowdowns = {}
+    for group, binaries in sorted(comparison.items(), key = lambda item: str(item[0])):
+        fastest = min(binaries.values())
+        print("/".join(str(val) for val in group))
+        for binary_hash, host_seconds in sorted(binaries.items(), key = lambda item: item[1]):
+            slowdown = host_seconds / fastest if fastest > 0 else float("nan")
+            slowdowns.setdefault(binary_hash, []).append(slowdown)
+            print(f"    {get_label(binary_hash):<64} {host_seconds:>12.1f} s {slowdown:>6.2f}x")
+    print("mean slowdown relative to the fastest binary of each workload")
+    for binary_hash, values in sorted(slowdowns.items(), key = lambda item: sum(item[1]) / len(item[1])):
+        print(f"    {get_label(binary_hash):<64} {sum(values) / len(values):>6.2f}x over {len(values)} workloads")
+
+def print_sim_throughput_summary(infos, keys = default_workload_keys):
+    rows = summarize_sim_throughput(infos, keys)
+    if not rows:
+        return
+    print("Info: simulation throughput per", "/".join(keys))
+    print("    " + " ".join(f"{key:>24}" for key in keys) + f" {'units':>6} {'host hours':>10} {'inst/s':>10} {'tick/s':>12} {'max MiB':>9}")
+    for row in rows:
+        inst_rate = f"{row['hostInstRate']:>10.0f}" if row["hostInstRate"] is not None else f"{'-':>10}"
+        tick_rate = f"{row['hostTickRate']:>12.0f}" if row["hostTickRate"] is not None else f"{'-':>12}"
+        print("    " + " ".join(f"{str(row[key]):>24}" for key in keys)
+              + f" {row['n_units']:>6} {row['host_seconds'] / 3600:>10.2f} {inst_rate} {tick_rate} {row['hostMemory'] / 2**20:>9.0f}")
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description = "Summarize the simulation throughput of sweeps")
+    parser.add_argument("sweep_paths", type=str, nargs="+", help="Directories holding output folders")
+    parser.add_argument("--keys", type=str, nargs="+", default=default_workload_keys, help="Metadata keys identifying a workload")
+    parser.add_argument("--compare", action="store_true", help="Compare the gem5 binaries that simulated the same workloads")
+    args = parser.parse_args()
+
+    infos = []
+    for sweep_path in args.sweep_paths:
+        for info_path in sorted(Path(sweep_path).glob("*/info.json")):
+            try:
+                with open(info_path, "r") as f:
+                    infos.append(json.load(f))
+            except (OSError, json.JSONDecodeError):
+                print("Warn: failed to read", info_path)
+    if args.compare:
+        print_binary_comparison(infos, args.keys)
+    else:
+        print_sim_throughput_summary(infos, args.keys)
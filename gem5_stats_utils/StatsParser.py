@@ -0,0 +1,135 @@
+import mmap
+import re
+from multiprocessing import Pool
+from pathlib import Path
+
+import numpy as np
+
+"""
+    A selective parser for gem5's stats.txt.
+
+    Each m5.stats.dump() appends one block to stats.txt,
+        ---------- Begin Simulation Statistics ----------
+        simSeconds     0.001000     # Number of seconds simulated (Second)
+        ...
+        ---------- End Simulation Statistics   ----------
+    The file is memory-mapped and split into blocks, and only the requested
+    stats are extracted. Exact names are found with a substring search,
+    names containing '*' or '?' are matched as globs ('*' does not cross
+    whitespace, so it can span the dots of a stat name).
+
+    For each stat, the result is a NumPy array with one value per dump (NaN
+    where a dump does not have the stat). For distributions and vectors, the
+    first column (the count) is taken.
+
+    Output folders packed by OutputArchive are read from their outputs.zst.
+"""
+
+begin_marker = b"---------- Begin Simulation Statistics ----------"
+end_marker = b"---------- End Simulation Statistics   ----------"
+
+def is_glob(name):
+    return "*" in name or "?" in name
+
+def glob_to_regex(name):
+    regex = re.escape(name.encode())
+    regex = regex.replace(rb"\*", rb"\S*").replace(rb"\?", rb"\S")
+    return regex
+
+def split_dumps(data):
+    blocks = []
+    start = data.find(begin_marker)
+    while start != -1:
+        start += len(begin_marker)
+        end = data.find(end_marker, start)
+        if end == -1:
+            # the dump is being written
+            break
+        blocks.append((start, end))
+        start = data.find(begin_marker, end)
+    return blocks
+
+def _parse_value(line_rest):
+    fields = line_rest.split(None, 1)
+    if not fields:
+        return np.nan
+    try:
+        return float(fields[0])
+    except ValueError:
+        return np.nan
+
+def _find_exact(data, name, start, end):
+    needle = b"\n" + name.encode()
+    pos = data.find(needle, start, end)
+    while pos != -1:
+        value_start = pos + len(needle)
+        # the name must be followed by whitespace, not be a prefix of a longer name
+        if value_start < end and data[value_start:value_start + 1] in (b" ", b"\t"):
+            line_end = data.find(b"\n", value_start, end)
+            if line_end == -1:
+                line_end = end
+            return _parse_value(data[value_start:line_end])
+        pos = data.find(needle, value_start, end)
+    return None
+
+def parse_stats_data(data, names):
+    blocks = split_dumps(data)
+    exact_names = [name for name in names if not is_glob(name)]
+    glob_names = [name for name in names if is_glob(name)]
+    pattern = None
+    if glob_names:
+        pattern = re.compile(rb"^(" + b"|".join(glob_to_regex(name) for name in glob_names) + rb")[ \t]+(\S+)", re.M)
+
+    stats = {}
+    for i, (start, end) in enumerate(blocks):
+        values = {}
+        for name in exact_names:
+            value = _find_exact(data, name, start, end)
+            if value is not None:
+                values[name] = value
+        if pattern is not None:
+            for match in pattern.finditer(data, start, end):
+                values[match.group(1).decode()] = _parse_value(match.group(2))
+        for name, value in values.items():
+            if not name in stats:
+                stats[name] = np.full(len(blocks), np.nan)
+            stats[name][i] = value
+    return stats
+
+def _read_archived(stats_path):
+    from .OutputArchive import read_output_file
+    return read_output_file(stats_path.parent, stats_path.name)
+
+# names is a list of stat names or globs, returns {stat name: np.ndarray}
+def parse_stats(stats_path, names):
+    stats_path = Path(stats_path)
+    if not stats_path.exists():
+        return parse_stats_data(_read_archived(stats_path), names)
+    if stats_path.stat().st_size == 0:
+        return {}
+    with open(stats_path, "rb") as f:
+        with mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as data:
+            return parse_stats_data(data, names)
+
+def get_number_of_dumps(stats_path):
+    stats_path = Path(stats_path)
+    if not stats_path.exists():
+        return len(split_dumps(_read_archived(stats_path)))
+    if stats_path.stat().st_size == 0:
+        return 0
+    with open(stats_path, "rb") as f:
+        with mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as data:
+            return len(split_dumps(data))
+
+def _parse_stats_star(args):
+    stats_path, names = args
+    try:
+        return parse_stats(stats_path, names)
+    except OSError:
+        print("Warn: failed to read", stats_path)
+        return {}
+
+# parses many stats.txt in parallel, returns one dict per path
+def parse_stats_files(stats_paths, names, n_processes = None):
+    with Pool(n_processes) as pool:
+        return pool.map(_parse_stats_star, [(stats_path, names) for stats_path in stats_paths], chunksize = 16)
@@ -1,3 +1,4 @@
+from gem5_launch_utils.DesignSpace import Axis, from_config
 from gem5_launch_utils.Experiment import Experiment
 from gem5_launch_utils.ExperimentUnit import ExperimentUnit
 
@@ -5,6 +6,7 @@ import multiprocessing
 from pathlib import Path
 import socket
 import subprocess
+import sys
 
 from gem5_components.workloads_params.memory_latency_params import MemoryLatencyTestParams
 from gem5_components.workloads_params.isa_extensions import ISAExtension
@@ -23,6 +25,11 @@ disk_image_path = "/projects/gem5/hn/DISK_IMAGES/arm64sve-hpc-2204-20230526.img"
 gem5_binary_md5sum = "7431a465f527fdb001de1a38039df55b"
 disk_image_md5sum = "da7fde7a70e2ef0d7f9656793242df1d"
 
+# admission control: the simulated system has 16GiB of memory, a unit is
+# assumed to be able to touch all of it
+unit_estimated_memory = 16 * 2**30
+unit_estimated_cores = 1
+
 def sanity_check():
     assert(Path(gem5_binary_path).exists())
     assert(Path(gem5_output_path_prefix).exists())
@@ -107,7 +114,9 @@ def generate_experiment_unit(isa, vlen, num_ccds, enable_prefetcher, num_channel
                           gem5_output_path = output_path,
                           gem5_params = gem5_params,
                           config_params = config_params,
-                          env = {})
+                          env = {},
+                          estimated_memory = unit_estimated_memory,
+                          estimated_cores = unit_estimated_cores)
 
     metadata = metadata_generator(isa = isa,
                                   disk_image_path = disk_image_path,
@@ -130,23 +139,33 @@ if __name__ == "__main__":
     sanity_check()
 
     experiment = Experiment()
-
-    for vlen in ARM64SVE_Design_Space.vlen:
-        for num_ccds in [1]: # only use 1 core
-            for enable_prefetcher in ARM64SVE_Design_Space.enable_prefetcher:
-                for num_channels in ARM64SVE_Design_Space.num_channels:
-                    unit = generate_experiment_unit(
-                        isa = "arm64sve",
-                        vlen = str(vlen),
-                        num_ccds = str(num_ccds),
-                        enable_prefetcher = str(enable_prefetcher),
-                        num_channels = str(num_channels),
-                        disk_image_path = disk_image_path,
-                        hostname = socket.gethostname(),
-                        params = MemoryLatencyTestParams(source_path=Path("/home/ubuntu/MemoryLatencyTest/"),
-                                                         with_roi_annotations=True,
-                                                         isa_extensions = [ISAExtension.SVE]))
-                    experiment.add_experiment_unit(unit)
-
-    n_processes = experiment.get_number_of_experiment_units()
-    experiment.launch(n_processes)
+    # no disk image verification: disk_image_md5sum disagrees with the one of
+    # the other launchers for the same disk_image_path and has never been
+    # checked, enable it once it is confirmed against the image, e.g. with
+    #   python3 -m gem5_launch_utils.DiskImageFingerprint <image> --md5sum
+
+    # only use 1 core
+    design_space = from_config(ARM64SVE_Design_Space, ["vlen"]) \
+                   * Axis("num_ccds", [1]) \
+                   * from_config(ARM64SVE_Design_Space, ["enable_prefetcher", "num_channels"])
+    hostname = socket.gethostname()
+
+    def make_unit(point):
+        return generate_experiment_unit(
+            isa = "arm64sve",
+            vlen = str(point["vlen"]),
+            num_ccds = str(point["num_ccds"]),
+            enable_prefetcher = str(point["enable_prefetcher"]),
+            num_channels = str(point["num_channels"]),
+            disk_image_path = disk_image_path,
+            hostname = hostname,
+            params = MemoryLatencyTestParams(source_path=Path("/home/ubuntu/MemoryLatencyTest/"),
+                                             with_roi_annotations=True,
+                                             isa_extensions = [ISAExtension.SVE]))
+
+    experiment.add_experiment_units(design_space.map(make_unit))
+
+    n_processes = len(design_space)
+    if experiment.launch(n_processes):
+        # cancelled
+        sys.exit(1)
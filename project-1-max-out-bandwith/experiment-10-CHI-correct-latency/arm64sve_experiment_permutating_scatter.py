@@ -1,10 +1,13 @@
+from gem5_launch_utils.DesignSpace import from_config
 from gem5_launch_utils.Experiment import Experiment
 from gem5_launch_utils.ExperimentUnit import ExperimentUnit
 
+import json
 import multiprocessing
 from pathlib import Path
 import socket
 import subprocess
+import sys
 
 from gem5_components.workloads_params.permutating_scatter import PermutatingScatterParams
 from gem5_components.workloads_params.isa_extensions import ISAExtension
@@ -23,6 +26,18 @@ disk_image_path = "/projects/gem5/hn/DISK_IMAGES/arm64sve-hpc-2204-20230526.img"
 gem5_binary_md5sum = "7431a465f527fdb001de1a38039df55b"
 disk_image_md5sum = "559dabdef9a021a59c19d51e505cdbdf"
 
+# admission control: the simulated system has 16GiB of memory, a unit is
+# assumed to be able to touch all of it
+unit_estimated_memory = 16 * 2**30
+unit_estimated_cores = 1
+
+# convergence-based early termination: the DRAM bandwidth is sampled every
+# "interval" ticks and the ROI ends once the coefficient of variation of the
+# last "window" samples is below "threshold", e.g.
+#   convergence_params = {"interval": 10**8, "window": 5, "threshold": 0.02}
+# None simulates the whole ROI
+convergence_params = None
+
 def sanity_check():
     assert(Path(gem5_binary_path).exists())
     assert(Path(gem5_output_path_prefix).exists())
@@ -51,6 +66,10 @@ def gem5_params_generator(output_path, command, vlen, num_ccds, enable_prefetche
     config_params["--num_channels"] = num_channels
     config_params["--disk_image"] = disk_image_path
     config_params["--hostname"] = hostname
+    if convergence_params:
+        config_params["--convergence_interval"] = str(convergence_params["interval"])
+        config_params["--convergence_window"] = str(convergence_params["window"])
+        config_params["--convergence_threshold"] = str(convergence_params["threshold"])
 
     return gem5_params, config_params
 
@@ -77,6 +96,8 @@ def metadata_generator(isa, disk_image_path, hostname, command, workload_naming_
     metadata["num_ccds"] = str(num_ccds)
     metadata["enable_prefetcher"] = str(enable_prefetcher)
     metadata["num_channels"] = str(num_channels)
+    if convergence_params:
+        metadata["convergence_params"] = json.dumps(convergence_params, sort_keys=True)
 
     return metadata
 
@@ -107,7 +128,9 @@ def generate_experiment_unit(isa, vlen, num_ccds, enable_prefetcher, num_channel
                           gem5_output_path = output_path,
                           gem5_params = gem5_params,
                           config_params = config_params,
-                          env = {})
+                          env = {},
+                          estimated_memory = unit_estimated_memory,
+                          estimated_cores = unit_estimated_cores)
 
     metadata = metadata_generator(isa = isa,
                                   disk_image_path = disk_image_path,
@@ -130,25 +153,30 @@ if __name__ == "__main__":
     sanity_check()
 
     experiment = Experiment()
-
-    for vlen in ARM64SVE_Design_Space.vlen:
-        for num_ccds in ARM64SVE_Design_Space.num_ccds:
-            for enable_prefetcher in ARM64SVE_Design_Space.enable_prefetcher:
-                for num_channels in ARM64SVE_Design_Space.num_channels:
-                    unit = generate_experiment_unit(
-                        isa = "arm64sve",
-                        vlen = str(vlen),
-                        num_ccds = str(num_ccds),
-                        enable_prefetcher = str(enable_prefetcher),
-                        num_channels = str(num_channels),
-                        disk_image_path = disk_image_path,
-                        hostname = socket.gethostname(),
-                        params = PermutatingScatterParams(source_path=Path("/home/ubuntu/simple-vectorizable-microbenchmarks/permutating_scatter/"),
-                                                          with_roi_annotations=True,
-                                                          seed=17,
-                                                          mod=100_000_007,
-                                                          isa_extensions = [ISAExtension.SVE]))
-                    experiment.add_experiment_unit(unit)
-
-    n_processes = experiment.get_number_of_experiment_units()
-    experiment.launch(n_processes)
+    # checks the disk image against disk_image_md5sum once for the whole sweep
+    experiment.enable_disk_image_verification()
+
+    design_space = from_config(ARM64SVE_Design_Space, ["vlen", "num_ccds", "enable_prefetcher", "num_channels"])
+    hostname = socket.gethostname()
+
+    def make_unit(point):
+        return generate_experiment_unit(
+            isa = "arm64sve",
+            vlen = str(point["vlen"]),
+            num_ccds = str(point["num_ccds"]),
+            enable_prefetcher = str(point["enable_prefetcher"]),
+            num_channels = str(point["num_channels"]),
+            disk_image_path = disk_image_path,
+            hostname = hostname,
+            params = PermutatingScatterParams(source_path=Path("/home/ubuntu/simple-vectorizable-microbenchmarks/permutating_scatter/"),
+                                              with_roi_annotations=True,
+                                              seed=17,
+                                              mod=100_000_007,
+                                              isa_extensions = [ISAExtension.SVE]))
+
+    experiment.add_experiment_units(design_space.map(make_unit))
+
+    n_processes = len(design_space)
+    if experiment.launch(n_processes):
+        # cancelled
+        sys.exit(1)
@@ -1,3 +1,4 @@
+from gem5_launch_utils.DesignSpace import Axis, from_config
 from gem5_launch_utils.Experiment import Experiment
 from gem5_launch_utils.ExperimentUnit import ExperimentUnit
 
@@ -5,6 +6,7 @@ import multiprocessing
 from pathlib import Path
 import socket
 import subprocess
+import sys
 
 from gem5_components.workloads_params.spatter_params import SpatterParams
 from gem5_components.workloads_params.isa_extensions import ISAExtension
@@ -23,6 +25,11 @@ disk_image_path = "/projects/gem5/hn/DISK_IMAGES/arm64sve-hpc-2204-20230526.img"
 gem5_binary_md5sum = "7431a465f527fdb001de1a38039df55b"
 disk_image_md5sum = "559dabdef9a021a59c19d51e505cdbdf"
 
+# admission control: the simulated system has 16GiB of memory, a unit is
+# assumed to be able to touch all of it
+unit_estimated_memory = 16 * 2**30
+unit_estimated_cores = 1
+
 def sanity_check():
     assert(Path(gem5_binary_path).exists())
     assert(Path(gem5_output_path_prefix).exists())
@@ -107,7 +114,9 @@ def generate_experiment_unit(isa, vlen, num_ccds, enable_prefetcher, num_channel
                           gem5_output_path = output_path,
                           gem5_params = gem5_params,
                           config_params = config_params,
-                          env = {})
+                          env = {},
+                          estimated_memory = unit_estimated_memory,
+                          estimated_cores = unit_estimated_cores)
 
     metadata = metadata_generator(isa = isa,
                                   disk_image_path = disk_image_path,
@@ -130,30 +139,35 @@ if __name__ == "__main__":
     sanity_check()
 
     experiment = Experiment()
+    # checks the disk image against disk_image_md5sum once for the whole sweep
+    experiment.enable_disk_image_verification()
 
     # Adding some STREAM workloads
     pattern_files = ["/home/ubuntu/lanl-spatter/patterns/flag/static_2d/001.json",
                      "/home/ubuntu/lanl-spatter/patterns/flag/static_2d/001.nonfp.json",
                      "/home/ubuntu/lanl-spatter/patterns/flag/static_2d/001.fp.json",
                      "/home/ubuntu/lanl-spatter/patterns/xrage/asteroid/spatter.json"]
-    for vlen in ARM64SVE_Design_Space.vlen:
-        for num_ccds in ARM64SVE_Design_Space.num_ccds:
-            for enable_prefetcher in ARM64SVE_Design_Space.enable_prefetcher:
-                for num_channels in ARM64SVE_Design_Space.num_channels:
-                    for json_file in pattern_files:
-                        unit = generate_experiment_unit(
-                            isa = "arm64sve",
-                            vlen = str(vlen),
-                            num_ccds = str(num_ccds),
-                            enable_prefetcher = str(enable_prefetcher),
-                            num_channels = str(num_channels),
-                            disk_image_path = disk_image_path,
-                            hostname = socket.gethostname(),
-                            params = SpatterParams(source_path=Path("/home/ubuntu/simple-vectorizable-microbenchmarks/spatter/"),
-                                                   with_roi_annotations=True,
-                                                   json_filepath=json_file,
-                                                   isa_extensions = [ISAExtension.SVE]))
-                        experiment.add_experiment_unit(unit)
+    design_space = from_config(ARM64SVE_Design_Space, ["vlen", "num_ccds", "enable_prefetcher", "num_channels"]) \
+                   * Axis("json_file", pattern_files)
+    hostname = socket.gethostname()
+
+    def make_unit(point):
+        return generate_experiment_unit(
+            isa = "arm64sve",
+            vlen = str(point["vlen"]),
+            num_ccds = str(point["num_ccds"]),
+            enable_prefetcher = str(point["enable_prefetcher"]),
+            num_channels = str(point["num_channels"]),
+            disk_image_path = disk_image_path,
+            hostname = hostname,
+            params = SpatterParams(source_path=Path("/home/ubuntu/simple-vectorizable-microbenchmarks/spatter/"),
+                                   with_roi_annotations=True,
+                                   json_filepath=point["json_file"],
+                                   isa_extensions = [ISAExtension.SVE]))
+
+    experiment.add_experiment_units(design_space.map(make_unit))
 
     n_processes = 16
-    experiment.launch(n_processes)
+    if experiment.launch(n_processes):
+        # cancelled
+        sys.exit(1)
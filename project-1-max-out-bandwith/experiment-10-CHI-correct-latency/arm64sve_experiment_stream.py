@@ -1,10 +1,15 @@
+from gem5_launch_utils.AdaptiveSearch import SuccessiveHalving
+from gem5_launch_utils.DesignSpace import Axis, from_config
 from gem5_launch_utils.Experiment import Experiment
 from gem5_launch_utils.ExperimentUnit import ExperimentUnit
+from gem5_launch_utils.SimPointPipeline import SimPointPipeline, SlicePipeline
 
+import json
 import multiprocessing
 from pathlib import Path
 import socket
 import subprocess
+import sys
 
 from gem5_components.workloads_params.stream_params import STREAMParams
 from gem5_components.workloads_params.isa_extensions import ISAExtension
@@ -14,6 +19,7 @@ from arm64sve_design_space import ARM64SVE_Design_Space
 experiment_tag = "arm64sve-chi-latency-test-stream"
 gem5_binary_path = "/scr/hn/takekoputa-gem5/build/ARM_CHI/gem5.fast"
 gem5_config_path = "/home/hn/experiments/project-1-max-out-bandwith/experiment-10-CHI-correct-latency/configs/gem5/arm64sve-chi.py"
+gem5_simpoint_config_path = "/home/hn/experiments/project-1-max-out-bandwith/experiment-10-CHI-correct-latency/configs/gem5/arm64sve-chi-simpoint.py"
 gem5_output_path_prefix = "/home/hn/experiments/project-1-max-out-bandwith/experiment-10-CHI-correct-latency/results/" + experiment_tag + "/"
 disk_image_path = "/projects/gem5/hn/DISK_IMAGES/arm64sve-hpc-2204-20230526.img"
 
@@ -23,15 +29,86 @@ disk_image_path = "/projects/gem5/hn/DISK_IMAGES/arm64sve-hpc-2204-20230526.img"
 gem5_binary_md5sum = "7431a465f527fdb001de1a38039df55b"
 disk_image_md5sum = "559dabdef9a021a59c19d51e505cdbdf"
 
+# admission control: the simulated system has 16GiB of memory, a unit is
+# assumed to be able to touch all of it
+unit_estimated_memory = 16 * 2**30
+unit_estimated_cores = 1
+
+# convergence-based early termination: the DRAM bandwidth is sampled every
+# "interval" ticks and the ROI ends once the coefficient of variation of the
+# last "window" samples is below "threshold", e.g.
+#   convergence_params = {"interval": 10**8, "window": 5, "threshold": 0.02}
+# None simulates the whole ROI
+convergence_params = None
+
+# periodic sampling: fast-forward the ROI with the Atomic CPU and simulate a
+# detailed window of "window" ticks, after "warmup" ticks of detailed warmup,
+# every "period" ticks; the ROI ends once the IPC and the DRAM bandwidth are
+# known within "error" (relative, at 99.7% confidence); "warmup" must cover
+# at least the L3 size over the peak DRAM bandwidth, and defaults to twice
+# that (derived by the config from the caches and the memory), e.g.
+#   sampling_params = {"period": 10**10, "window": 10**7, "error": 0.03}
+# None simulates the whole ROI in detail
+sampling_params = None
+
+# distributed mode: set to a directory shared by the hosts, the units are then
+# submitted there and each host runs
+#   python3 -m gem5_launch_utils.WorkQueue <queue_dir> --n_processes <n>
+queue_dir = None
+
+# boot once per group of units with the same boot-relevant parameters, take a
+# checkpoint at m5_work_begin() and restore it for each unit of the group
+boot_checkpoint_path_prefix = None
+
+# dump the stats every this many ticks inside the ROI and follow the dumps
+# into <output>/stats_timeseries.jsonl while the units are running
+stats_dump_period = None
+live_stat_names = ["simSeconds", "board.memory.mem_ctrl*.dram.bytesRead::total", "board.memory.mem_ctrl*.dram.bytesWritten::total"]
+
+# the points of the design space are turned into units only as slots free up;
+# set to a number of points to launch a pseudo-random sample of the space
+design_space_sample_size = None
+
+# adaptive search: instead of simulating the whole ROI of every point, find the
+# highest-bandwidth configuration of each STREAM size by successive halving,
+# every point runs min_roi_ticks of the ROI and the best 1/eta are run again
+# with eta times more, up to max_roi_ticks, e.g.
+#   adaptive_search_params = {"min_roi_ticks": 10**8, "max_roi_ticks": 10**10, "eta": 3}
+# None simulates every point
+adaptive_search_params = None
+
+# sampled simulation: profile the ROI of every point with the Atomic CPU, pick
+# up to max_k representative intervals of "interval" instructions and only
+# simulate those with the O3 CPU, after "warmup" instructions of warmup; the
+# weighted stats go to <output>/simpoint_stats.json, e.g.
+#   simpoint_params = {"interval": 10**8, "warmup": 10**7, "max_k": 30}
+# None simulates the whole ROI
+simpoint_params = None
+
+# parallel ROI slicing: run the ROI of every point once with the Atomic CPU,
+# checkpointing every "interval" instructions, then simulate every slice with
+# the O3 CPU as its own unit after "warmup" instructions of warmup; the
+# stitched stats go to <output>/slice_stats.json, e.g.
+#   slice_params = {"interval": 10**9, "warmup": 10**7}
+# None simulates the whole ROI in one unit
+slice_params = None
+
 def sanity_check():
     assert(Path(gem5_binary_path).exists())
     assert(Path(gem5_output_path_prefix).exists())
     assert(Path(disk_image_path).exists())
 
-def output_folder_generator(isa, workload_naming_string, vlen, num_ccds, enable_prefetcher, num_channels):
-    return "-".join([isa, workload_naming_string, str(vlen), str(num_ccds), str(enable_prefetcher), str(num_channels)])
+def output_folder_generator(isa, workload_naming_string, vlen, num_ccds, enable_prefetcher, num_channels, max_roi_ticks = None):
+    fields = [isa, workload_naming_string, str(vlen), str(num_ccds), str(enable_prefetcher), str(num_channels)]
+    if max_roi_ticks:
+        fields.append("roi" + str(max_roi_ticks))
+    if simpoint_params:
+        fields.append("simpoint")
+    if slice_params:
+        fields.append("sliced")
+    return "-".join(fields)
 
-def gem5_params_generator(output_path, command, vlen, num_ccds, enable_prefetcher, num_channels, disk_image_path, hostname):
+def gem5_params_generator(output_path, command, vlen, num_ccds, enable_prefetcher, num_channels, disk_image_path, hostname, max_roi_ticks = None):
     gem5_params = {}
     config_params = {}
 
@@ -51,10 +128,21 @@ def gem5_params_generator(output_path, command, vlen, num_ccds, enable_prefetche
     config_params["--num_channels"] = num_channels
     config_params["--disk_image"] = disk_image_path
     config_params["--hostname"] = hostname
+    if convergence_params:
+        config_params["--convergence_interval"] = str(convergence_params["interval"])
+        config_params["--convergence_window"] = str(convergence_params["window"])
+        config_params["--convergence_threshold"] = str(convergence_params["threshold"])
+    if max_roi_ticks:
+        config_params["--max_roi_ticks"] = str(max_roi_ticks)
+    if sampling_params:
+        for key, val in sampling_params.items():
+            config_params["--sampling_" + key] = str(val)
+    if stats_dump_period:
+        config_params["--stats_dump_period"] = str(stats_dump_period)
 
     return gem5_params, config_params
 
-def metadata_generator(isa, disk_image_path, hostname, command, workload_naming_string, vlen, num_ccds, enable_prefetcher, num_channels):
+def metadata_generator(isa, disk_image_path, hostname, command, workload_naming_string, vlen, num_ccds, enable_prefetcher, num_channels, max_roi_ticks = None):
     metadata = {}
 
     metadata["tag"] = experiment_tag
@@ -77,10 +165,16 @@ def metadata_generator(isa, disk_image_path, hostname, command, workload_naming_
     metadata["num_ccds"] = str(num_ccds)
     metadata["enable_prefetcher"] = str(enable_prefetcher)
     metadata["num_channels"] = str(num_channels)
+    if max_roi_ticks:
+        metadata["max_roi_ticks"] = str(max_roi_ticks)
+    if convergence_params:
+        metadata["convergence_params"] = json.dumps(convergence_params, sort_keys=True)
+    if sampling_params:
+        metadata["sampling_params"] = json.dumps(sampling_params, sort_keys=True)
 
     return metadata
 
-def generate_experiment_unit(isa, vlen, num_ccds, enable_prefetcher, num_channels, disk_image_path, hostname, params):
+def generate_experiment_unit(isa, vlen, num_ccds, enable_prefetcher, num_channels, disk_image_path, hostname, params, max_roi_ticks = None):
     workload_command = params.get_command()
     workload_naming_string = params.get_naming_string()
 
@@ -89,7 +183,8 @@ def generate_experiment_unit(isa, vlen, num_ccds, enable_prefetcher, num_channel
                                                  vlen = vlen,
                                                  num_ccds = num_ccds,
                                                  enable_prefetcher = enable_prefetcher,
-                                                 num_channels = num_channels)
+                                                 num_channels = num_channels,
+                                                 max_roi_ticks = max_roi_ticks)
 
     output_path = str(Path(gem5_output_path_prefix) / output_folder_name)
 
@@ -100,14 +195,17 @@ def generate_experiment_unit(isa, vlen, num_ccds, enable_prefetcher, num_channel
                                                        enable_prefetcher = enable_prefetcher,
                                                        num_channels = num_channels,
                                                        disk_image_path = disk_image_path,
-                                                       hostname = hostname)
+                                                       hostname = hostname,
+                                                       max_roi_ticks = max_roi_ticks)
 
     unit = ExperimentUnit(gem5_binary_path = gem5_binary_path,
-                          gem5_config_path = gem5_config_path,
+                          gem5_config_path = gem5_simpoint_config_path if simpoint_params or slice_params else gem5_config_path,
                           gem5_output_path = output_path,
                           gem5_params = gem5_params,
                           config_params = config_params,
-                          env = {})
+                          env = {},
+                          estimated_memory = unit_estimated_memory,
+                          estimated_cores = unit_estimated_cores)
 
     metadata = metadata_generator(isa = isa,
                                   disk_image_path = disk_image_path,
@@ -117,7 +215,8 @@ def generate_experiment_unit(isa, vlen, num_ccds, enable_prefetcher, num_channel
                                   vlen = vlen,
                                   num_ccds = num_ccds,
                                   enable_prefetcher = enable_prefetcher,
-                                  num_channels = num_channels)
+                                  num_channels = num_channels,
+                                  max_roi_ticks = max_roi_ticks)
 
     for key, val in metadata.items():
         unit.add_metadata(key, val)
@@ -130,27 +229,53 @@ if __name__ == "__main__":
     sanity_check()
 
     experiment = Experiment()
+    # checks the disk image against disk_image_md5sum once for the whole sweep
+    experiment.enable_disk_image_verification()
 
     # Adding some STREAM workloads
     stream_sizes = [2**k for k in range(20, 25)]
-    for vlen in ARM64SVE_Design_Space.vlen:
-        for num_ccds in ARM64SVE_Design_Space.num_ccds:
-            for enable_prefetcher in ARM64SVE_Design_Space.enable_prefetcher:
-                for num_channels in ARM64SVE_Design_Space.num_channels:
-                    for stream_size in stream_sizes:
-                        unit = generate_experiment_unit(
-                            isa = "arm64sve",
-                            vlen = str(vlen),
-                            num_ccds = str(num_ccds),
-                            enable_prefetcher = str(enable_prefetcher),
-                            num_channels = str(num_channels),
-                            disk_image_path = disk_image_path,
-                            hostname = socket.gethostname(),
-                            params = STREAMParams(source_path=Path("/home/ubuntu/simple-vectorizable-microbenchmarks/stream/"),
-                                                  with_roi_annotations=True,
-                                                  number_of_elements=stream_size,
-                                                  isa_extensions = [ISAExtension.SVE]))
-                        experiment.add_experiment_unit(unit)
-
-    n_processes = experiment.get_number_of_experiment_units()
-    experiment.launch(n_processes)
+    design_space = from_config(ARM64SVE_Design_Space, ["vlen", "num_ccds", "enable_prefetcher", "num_channels"]) \
+                   * Axis("stream_size", stream_sizes)
+    hostname = socket.gethostname()
+
+    def make_unit(point, max_roi_ticks = None):
+        return generate_experiment_unit(
+            isa = "arm64sve",
+            vlen = str(point["vlen"]),
+            num_ccds = str(point["num_ccds"]),
+            enable_prefetcher = str(point["enable_prefetcher"]),
+            num_channels = str(point["num_channels"]),
+            disk_image_path = disk_image_path,
+            hostname = hostname,
+            params = STREAMParams(source_path=Path("/home/ubuntu/simple-vectorizable-microbenchmarks/stream/"),
+                                  with_roi_annotations=True,
+                                  number_of_elements=point["stream_size"],
+                                  isa_extensions = [ISAExtension.SVE]),
+            max_roi_ticks = max_roi_ticks)
+
+    if simpoint_params is not None:
+        experiment.add_feedback_source(SimPointPipeline(design_space.map(make_unit), **simpoint_params))
+    elif slice_params is not None:
+        experiment.add_feedback_source(SlicePipeline(design_space.map(make_unit), **slice_params))
+    elif adaptive_search_params is not None:
+        experiment.add_adaptive_search(SuccessiveHalving(design_space, make_unit, group_keys = ["stream_size"], **adaptive_search_params))
+    elif design_space_sample_size is not None:
+        experiment.add_experiment_units(make_unit(point) for point in design_space.sample(design_space_sample_size))
+    else:
+        experiment.add_experiment_units(design_space.map(make_unit))
+
+    if boot_checkpoint_path_prefix is not None:
+        experiment.enable_boot_checkpoints(boot_checkpoint_path_prefix)
+
+    if stats_dump_period:
+        experiment.enable_live_stats(live_stat_names)
+
+    if queue_dir is not None:
+        experiment.submit_to_queue(queue_dir)
+    else:
+        # the units are added lazily, the memory and cores they demand limit
+        # the concurrency further
+        n_processes = multiprocessing.cpu_count()
+        if experiment.launch(n_processes):
+            # cancelled
+            sys.exit(1)
@@ -0,0 +1,278 @@
+from gem5.components.boards.arm_board import ArmBoard
+from gem5.components.boards.abstract_board import AbstractBoard
+from gem5.components.memory.memory import ChanneledMemory
+from gem5.components.processors.simple_processor import SimpleProcessor
+from gem5.components.processors.cpu_types import CPUTypes
+from gem5.components.processors.simple_switchable_processor import (
+    SimpleSwitchableProcessor,
+)
+from gem5.isas import ISA
+from gem5.utils.requires import requires
+from gem5.utils.override import overrides
+from gem5.resources.resource import Resource, CustomResource, DiskImageResource
+from gem5.simulate.simulator import Simulator
+from gem5.simulate.exit_event import ExitEvent
+
+import m5
+from m5.objects import DDR4_2400_16x4
+from m5.objects import ArmDefaultRelease
+from m5.objects import VExpress_GEM5_Foundation
+from m5.objects import SimPoint
+
+from gem5_components.vector_cores.vector_cores import ARM_SVE_Parameters, SimpleSwitchableVectorProcessor
+
+from saga.cache_hierarchy import SagaCacheHierarchy
+
+from pathlib import Path
+import json
+import re
+
+requires(isa_required=ISA.ARM)
+
+import argparse
+parser = argparse.ArgumentParser()
+parser.add_argument("--vlen", type=int, help="SVE length", required=True)
+parser.add_argument("--num_ccds", type=int, help="Number of cores", required=True)
+parser.add_argument("--command", type=str, help="Command inputted to the guest system", required=True)
+parser.add_argument("--enable_prefetcher", type=str, choices=["True", "False"], help="\"True\" if the prefetcher to L1 should be enable, \"False\" otherwise", required=True)
+parser.add_argument("--num_channels", type=int, help="Number of memory channels", required=True)
+parser.add_argument("--disk_image", type=str, help="Path to the disk image", required=True)
+parser.add_argument("--hostname", type=str, help="Does not affect simulation, but for metadata recording", required=True)
+parser.add_argument("--simpoint_mode", type=str, choices=["boot", "profile", "checkpoint", "slice", "restore"], help="Stage of the SimPoint pipeline, see below", required=True)
+parser.add_argument("--simpoint_checkpoint", type=str, help="Checkpoint to restore: the ROI checkpoint for profile and checkpoint, a simpoint checkpoint for restore", required=False, default=None)
+parser.add_argument("--simpoint_interval", type=int, help="Instructions per interval (on the first core)", required=False, default=10**8)
+parser.add_argument("--simpoint_warmup", type=int, help="Instructions simulated in detail before the interval (restore), or taken before it (checkpoint)", required=False, default=10**7)
+parser.add_argument("--simpoints", type=str, help="simpoints.json of gem5_stats_utils/SimPoint, for checkpoint", required=False, default=None)
+args = parser.parse_args()
+
+"""
+    SimPoint stages of the ROI of a workload, each a separate gem5 run (see
+    gem5_launch_utils/SimPointPipeline):
+        boot        boot with the Atomic CPU and save the ROI checkpoint at
+                    m5_work_begin() to <outdir>/roi-checkpoint
+        profile     restore the ROI checkpoint with the Atomic CPU and write
+                    the basic-block vectors of every simpoint_interval
+                    instructions to <outdir>/simpoint.<core>.bb.gz until
+                    m5_work_end()
+        checkpoint  restore the ROI checkpoint with the Atomic CPU and save
+                    <outdir>/cpt.<index> simpoint_warmup instructions before
+                    each simpoint of the simpoints file
+        slice       like checkpoint, for every interval of the ROI until
+                    m5_work_end() (see gem5_launch_utils/SimPointPipeline,
+                    SlicePipeline)
+        restore     restore a simpoint checkpoint with the O3 CPU, simulate
+                    simpoint_warmup instructions, reset the stats, simulate
+                    simpoint_interval instructions and dump the stats
+    Intervals are counted on the first core; the i-th interval of the program
+    is the i-th interval of every core.
+"""
+
+assert(args.simpoint_mode == "boot" or args.simpoint_checkpoint is not None)
+assert(args.simpoint_mode != "checkpoint" or args.simpoints is not None)
+
+num_ccds = args.num_ccds
+num_cores = 8 * num_ccds
+command = args.command
+vlen = args.vlen
+enable_prefetcher = True if args.enable_prefetcher == "True" else False
+disk_image_path = args.disk_image
+hostname = args.hostname
+simpoint_mode = args.simpoint_mode
+simpoint_checkpoint_path = args.simpoint_checkpoint
+simpoint_interval = args.simpoint_interval
+simpoint_warmup = args.simpoint_warmup
+
+cache_hierarchy = SagaCacheHierarchy()
+
+memory = ChanneledMemory(
+    dram_interface_class = DDR4_2400_16x4,
+    num_channels = 2,
+    interleaving_size = 2**8,
+    size = "16GiB",
+    addr_mapping = None
+)
+
+sve_parameters = ARM_SVE_Parameters(vlen = vlen, is_fullsystem = True)
+# only the detailed simulation of the simpoints uses the O3 core, the other
+# stages need the Atomic CPU (the SimPoint probe only works with it)
+processor = SimpleSwitchableVectorProcessor(
+    starting_core_type = CPUTypes.O3 if simpoint_mode == "restore" else CPUTypes.ATOMIC,
+    switch_core_type = CPUTypes.ATOMIC if simpoint_mode == "restore" else CPUTypes.O3,
+    isa = ISA.ARM,
+    num_cores = num_cores,
+    isa_vector_parameters = sve_parameters
+)
+
+class HighPerformanceArmBoard(ArmBoard):
+    def __init__(
+        self, clk_freq, processor, memory, cache_hierarchy, platform, release
+    ):
+        super().__init__(clk_freq, processor, memory, cache_hierarchy, platform, release)
+
+    @overrides(ArmBoard)
+    def _pre_instantiate(self):
+        super()._pre_instantiate()
+        for core_complex in self.cache_hierarchy.core_complexes:
+            for core_cluster in core_complex.core_clusters:
+                core_cluster.dcache.cache.dataAccessLatency = 5
+                core_cluster.l2cache.cache.dataAccessLatency = 12
+            core_complex.l3cache.cache.dataAccessLatency = 46
+
+    @overrides(ArmBoard)
+    def get_default_kernel_args(self):
+        return [
+            "console=ttyAMA0",
+            "lpj=19988480",
+            "norandmaps",
+            "root=/dev/vda1",
+            "rw",
+            f"mem={self.get_memory().get_size()}",
+            "init=/root/gem5-init.sh",
+        ]
+release = ArmDefaultRelease()
+platform = VExpress_GEM5_Foundation()
+
+# Setup the board.
+board = HighPerformanceArmBoard(
+    clk_freq="4GHz",
+    processor=processor,
+    memory=memory,
+    cache_hierarchy=cache_hierarchy,
+    release=release,
+    platform=platform,
+)
+
+sve_parameters.apply_system_change(board)
+
+# Set the Full System workload.
+board.set_kernel_disk_workload(
+    kernel=Resource("arm64-linux-kernel-5.10.110"),
+    disk_image=DiskImageResource(disk_image_path),
+    bootloader=Resource("arm64-bootloader-foundation"),
+    readfile_contents=f"{command}",
+    checkpoint=Path(simpoint_checkpoint_path) if simpoint_checkpoint_path else None,
+)
+
+if simpoint_mode == "profile":
+    # one probe (and one file) per core
+    for core_idx, core in enumerate(processor.get_cores()):
+        core.core.probeListener = SimPoint(interval = simpoint_interval, profile_file = f"simpoint.{core_idx}.bb.gz")
+
+# the gem5 exit cause that the simulator translates to ExitEvent.MAX_INSTS
+max_insts_cause = "a thread reached the max instruction count"
+
+def schedule_inst_stop(n_insts):
+    # relative to the current instruction count of the first core
+    processor.get_cores()[0].core.scheduleInstStop(0, n_insts, max_insts_cause)
+
+def get_checkpoint_target(index):
+    start = index * simpoint_interval
+    return (start - min(simpoint_warmup, start), index)
+
+# checkpoint and slice modes: (instructions since the ROI checkpoint, simpoint index)
+checkpoint_state = {"targets": [], "position": 0}
+if simpoint_mode == "checkpoint":
+    with open(args.simpoints, "r") as f:
+        simpoints = json.load(f)
+    for simpoint in simpoints["simpoints"]:
+        checkpoint_state["targets"].append(get_checkpoint_target(simpoint["index"]))
+    checkpoint_state["targets"].sort()
+elif simpoint_mode == "slice":
+    # the next slice is added as each one is taken, until the ROI ends
+    checkpoint_state["targets"].append(get_checkpoint_target(0))
+
+def take_simpoint_checkpoints():
+    # saves every checkpoint due at the current position, then schedules
+    # the next one; True once all are taken
+    targets = checkpoint_state["targets"]
+    while targets and targets[0][0] <= checkpoint_state["position"]:
+        target, index = targets.pop(0)
+        if simpoint_mode == "slice":
+            targets.append(get_checkpoint_target(index + 1))
+        checkpoint_path = Path(m5.options.outdir) / f"cpt.{index}"
+        print(f"info: Saving the checkpoint of simpoint {index} to {checkpoint_path}")
+        m5.checkpoint(str(checkpoint_path))
+    if not targets:
+        return True
+    schedule_inst_stop(targets[0][0] - checkpoint_state["position"])
+    checkpoint_state["position"] = targets[0][0]
+    return False
+
+# restore mode: "warmup", then "interval"
+restore_state = {"phase": None}
+
+def start_interval():
+    print(f"info: Resetting stats, simulating {simpoint_interval} instructions")
+    m5.stats.reset()
+    restore_state["phase"] = "interval"
+    schedule_inst_stop(simpoint_interval)
+
+def handle_max_insts():
+    while True:
+        if simpoint_mode == "checkpoint" or simpoint_mode == "slice":
+            yield take_simpoint_checkpoints()
+            continue
+        if simpoint_mode == "restore" and restore_state["phase"] == "warmup":
+            start_interval()
+            yield False
+            continue
+        print(f"info: Dumping stats")
+        m5.stats.dump()
+        yield True
+
+def handle_work_begin():
+    print(f"Exit due to m5_work_begin()")
+    print(f"info: Resetting stats")
+    m5.stats.reset()
+    if simpoint_mode == "boot":
+        checkpoint_path = Path(m5.options.outdir) / "roi-checkpoint"
+        print(f"info: Saving checkpoint to {checkpoint_path}")
+        simulator.save_checkpoint(checkpoint_path)
+        yield True
+    yield False
+
+def handle_work_end():
+    print(f"Exit due to m5_work_end()")
+    if simpoint_mode == "checkpoint" and checkpoint_state["targets"]:
+        print(f"warn: the ROI ended before simpoints {[index for target, index in checkpoint_state['targets']]}")
+    if simpoint_mode == "restore":
+        if restore_state["phase"] == "warmup":
+            # the ROI ended before the interval (the last slice), it is empty
+            m5.stats.reset()
+        # the ROI ended inside the interval, the stats cover what was simulated
+        print(f"info: Dumping stats")
+        m5.stats.dump()
+    yield True
+
+def handle_exit():
+    print(f"Exit due to m5_exit()")
+    yield True
+
+simulator = Simulator(
+    board=board,
+    on_exit_event={
+        ExitEvent.WORKBEGIN: handle_work_begin(),
+        ExitEvent.WORKEND: handle_work_end(),
+        ExitEvent.MAX_INSTS: handle_max_insts(),
+        ExitEvent.EXIT: handle_exit()
+    }
+)
+if simpoint_mode != "boot":
+    # restored inside the ROI, the instruction stops need the instantiated
+    # cores. The stdlib Simulator has no public hook between the instantiation
+    # and the first run(), which calls _instantiate() itself and skips it if
+    # it already happened, so it is called here ahead of run().
+    simulator._instantiate()
+    if simpoint_mode == "checkpoint" or simpoint_mode == "slice":
+        if take_simpoint_checkpoints():
+            print("info: All the simpoint checkpoints are taken")
+            exit(0)
+    elif simpoint_mode == "restore":
+        if simpoint_warmup > 0:
+            print(f"info: Warming up for {simpoint_warmup} instructions")
+            restore_state["phase"] = "warmup"
+            schedule_inst_stop(simpoint_warmup)
+        else:
+            start_interval()
+print("Beginning simulation!")
+simulator.run()
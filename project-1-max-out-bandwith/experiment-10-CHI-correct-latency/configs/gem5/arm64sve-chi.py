@@ -23,6 +23,9 @@ from gem5_components.vector_cores.vector_cores import ARM_SVE_Parameters, Simple
 from saga.cache_hierarchy import SagaCacheHierarchy
 
 from pathlib import Path
+import json
+import re
+import statistics
 
 requires(isa_required=ISA.ARM)
 
@@ -35,8 +38,25 @@ parser.add_argument("--enable_prefetcher", type=str, choices=["True", "False"],
 parser.add_argument("--num_channels", type=int, help="Number of memory channels", required=True)
 parser.add_argument("--disk_image", type=str, help="Path to the disk image", required=True)
 parser.add_argument("--hostname", type=str, help="Does not affect simulation, but for metadata recording", required=True)
+parser.add_argument("--take_checkpoint", type=str, help="Boot with the Atomic CPU, save a checkpoint to this path at m5_work_begin() and exit", required=False, default=None)
+parser.add_argument("--restore_checkpoint", type=str, help="Restore the checkpoint at this path and simulate the ROI with the O3 CPU", required=False, default=None)
+parser.add_argument("--stats_dump_period", type=int, help="If set, dump the stats every this many ticks inside the ROI", required=False, default=None)
+parser.add_argument("--convergence_interval", type=int, help="If set, sample the DRAM bandwidth every this many ticks inside the ROI and end the ROI once it converged", required=False, default=None)
+parser.add_argument("--convergence_window", type=int, help="Number of bandwidth samples the convergence is checked on", required=False, default=5)
+parser.add_argument("--convergence_threshold", type=float, help="The ROI ends when the coefficient of variation of the window is below this", required=False, default=0.02)
+parser.add_argument("--max_roi_ticks", type=int, help="If set, end the ROI after this many ticks, e.g. for a short-budget run of an adaptive search", required=False, default=None)
+parser.add_argument("--sampling_period", type=int, help="If set, sample the ROI: fast-forward with the Atomic CPU and simulate a detailed window every this many ticks", required=False, default=None)
+parser.add_argument("--sampling_warmup", type=int, help="Ticks of detailed warmup before each measured window, the only warming of the caches (the Atomic fast-forward bypasses them); at least the L3 size over the peak DRAM bandwidth, twice that if unset", required=False, default=None)
+parser.add_argument("--sampling_window", type=int, help="Ticks of each measured window", required=False, default=10**7)
+parser.add_argument("--sampling_error", type=float, help="The ROI ends when the confidence intervals of the IPC and the DRAM bandwidth are within this relative error", required=False, default=0.03)
+parser.add_argument("--sampling_confidence", type=float, help="Confidence level of the intervals", required=False, default=0.997)
+parser.add_argument("--sampling_min_windows", type=int, help="Number of windows measured before the error is checked", required=False, default=10)
 args = parser.parse_args()
 
+assert(args.take_checkpoint is None or args.restore_checkpoint is None)
+# the sampling owns the stats resets and dumps
+assert(args.sampling_period is None or (args.stats_dump_period is None and args.convergence_interval is None))
+
 num_ccds = args.num_ccds
 num_cores = 8 * num_ccds
 command = args.command
@@ -44,6 +64,19 @@ vlen = args.vlen
 enable_prefetcher = True if args.enable_prefetcher == "True" else False
 disk_image_path = args.disk_image
 hostname = args.hostname
+take_checkpoint_path = args.take_checkpoint
+restore_checkpoint_path = args.restore_checkpoint
+stats_dump_period = args.stats_dump_period
+convergence_interval = args.convergence_interval
+convergence_window = args.convergence_window
+convergence_threshold = args.convergence_threshold
+max_roi_ticks = args.max_roi_ticks
+sampling_period = args.sampling_period
+sampling_warmup = args.sampling_warmup
+sampling_window = args.sampling_window
+sampling_error = args.sampling_error
+sampling_confidence = args.sampling_confidence
+sampling_min_windows = args.sampling_min_windows
 
 cache_hierarchy = SagaCacheHierarchy()
 
@@ -56,9 +89,11 @@ memory = ChanneledMemory(
 )
 
 sve_parameters = ARM_SVE_Parameters(vlen = vlen, is_fullsystem = True)
+# the checkpoint is taken at m5_work_begin(), so a restored simulation is
+# already in the ROI and starts with the detailed core
 processor = SimpleSwitchableVectorProcessor(
-    starting_core_type = CPUTypes.ATOMIC,
-    switch_core_type = CPUTypes.O3,
+    starting_core_type = CPUTypes.O3 if restore_checkpoint_path else CPUTypes.ATOMIC,
+    switch_core_type = CPUTypes.ATOMIC if restore_checkpoint_path else CPUTypes.O3,
     isa = ISA.ARM,
     num_cores = num_cores,
     isa_vector_parameters = sve_parameters
@@ -112,20 +147,256 @@ board.set_kernel_disk_workload(
     disk_image=DiskImageResource(disk_image_path),
     bootloader=Resource("arm64-bootloader-foundation"),
     readfile_contents=f"{command}",
+    checkpoint=Path(restore_checkpoint_path) if restore_checkpoint_path else None,
 )
 
+# Convergence-based early termination: every convergence_interval ticks the
+# stats are dumped and the DRAM bandwidth of the last interval is computed
+# from the (cumulative) byte counters of the memory controllers. Once the
+# coefficient of variation of the last convergence_window samples is below
+# convergence_threshold, the ROI is ended there. The outcome is written to
+# convergence.json in the output directory.
+convergence_state = {"in_roi": False, "roi_start_tick": 0, "stats_offset": 0, "last_sample": None, "samples": []}
+
+def read_last_dump():
+    stats_path = Path(m5.options.outdir) / "stats.txt"
+    with open(stats_path, "rb") as f:
+        f.seek(convergence_state["stats_offset"])
+        data = f.read()
+    convergence_state["stats_offset"] += len(data)
+    return data[data.rfind(b"---------- Begin Simulation Statistics"):]
+
+def get_dram_bytes(block):
+    sim_seconds = float(re.search(rb"^simSeconds\s+(\S+)", block, re.M).group(1))
+    dram_bytes = sum(float(val) for val in re.findall(rb"^\S+\.dram\.bytes(?:Read|Written)::total\s+(\S+)", block, re.M))
+    return sim_seconds, dram_bytes
+
+def read_dram_bytes_of_last_dump():
+    return get_dram_bytes(read_last_dump())
+
+def write_convergence_record(converged, coefficient_of_variation = None):
+    samples = convergence_state["samples"]
+    record = {
+        "converged": converged,
+        "tick": m5.curTick(),
+        "interval": convergence_interval,
+        "window": convergence_window,
+        "threshold": convergence_threshold,
+        "coefficient_of_variation": coefficient_of_variation,
+        "bandwidth_samples": samples,
+    }
+    with open(Path(m5.options.outdir) / "convergence.json", "w") as f:
+        json.dump(record, f, indent=4)
+
+# Periodic sampling (SMARTS): the ROI is fast-forwarded with the Atomic CPU,
+# and every sampling_period ticks the O3 CPU is switched in for
+# sampling_warmup ticks of detailed warmup, then the stats are reset and
+# sampling_window ticks are measured and dumped. With the Ruby (CHI) caches
+# the Atomic CPU runs in atomic_noncaching mode and bypasses them, so the
+# fast-forward does not warm anything: the detailed warmup is the only
+# warming of the caches and of the DRAM state, and has to be long enough to
+# refill them (at least the L3 size over the DRAM bandwidth); each dump of
+# stats.txt is one window. Once sampling_min_windows windows are measured and
+# the confidence intervals of the mean IPC and DRAM bandwidth are within
+# sampling_error of the means, the ROI is ended there. The windows and the
+# estimates are written to sampling.json in the output directory, see
+# gem5_stats_utils/SampledStats for other stats.
+sampling_state = {"phase": None, "detailed": bool(restore_checkpoint_path), "windows": [], "warmup": sampling_warmup}
+
+# The time to stream the L3 capacity from the DRAM at its peak bandwidth, in
+# ticks (1 tick = 1 ps), read from the instantiated caches and memory
+# controllers. The caches of the hierarchy only exist once the board is
+# connected, so this is called at the ROI begin.
+def get_min_sampling_warmup():
+    l3_bytes = sum(core_complex.l3cache.cache.size.value for core_complex in cache_hierarchy.core_complexes)
+    dram_bandwidth = 0.0
+    for mem_ctrl in memory.get_memory_controllers():
+        dram = mem_ctrl.dram
+        burst_bytes = dram.burst_length.value * dram.device_bus_width.value * dram.devices_per_rank.value / 8
+        dram_bandwidth += burst_bytes / dram.tBURST.value
+    return int(l3_bytes / dram_bandwidth * 10**12)
+
+def check_sampling_warmup():
+    min_warmup = get_min_sampling_warmup()
+    if sampling_state["warmup"] is None:
+        sampling_state["warmup"] = 2 * min_warmup
+    # a shorter warmup leaves the L3 partly cold in every window and biases
+    # the sampled IPC and DRAM bandwidth
+    assert sampling_state["warmup"] >= min_warmup, f"--sampling_warmup {sampling_state['warmup']} is below the L3 refill time of {min_warmup} ticks"
+    assert sampling_period > sampling_state["warmup"] + sampling_window, f"--sampling_period {sampling_period} does not fit the warmup of {sampling_state['warmup']} ticks and the window"
+
+def read_window_of_last_dump():
+    block = read_last_dump()
+    sim_seconds, dram_bytes = get_dram_bytes(block)
+    # the switched-out cores have no IPC
+    ipcs = [float(val) for val in re.findall(rb"^\S+\.ipc\s+(\S+)", block, re.M)]
+    ipc = sum(val for val in ipcs if val == val)
+    return {"tick": m5.curTick(), "ipc": ipc, "dram_bandwidth": dram_bytes / sim_seconds if sim_seconds > 0 else 0.0}
+
+# {metric: (mean, half width of the confidence interval)}
+def get_sampling_estimates():
+    windows = sampling_state["windows"]
+    z = statistics.NormalDist().inv_cdf((1 + sampling_confidence) / 2)
+    estimates = {}
+    for metric in ["ipc", "dram_bandwidth"]:
+        values = [window[metric] for window in windows]
+        mean = statistics.fmean(values)
+        half_width = z * statistics.stdev(values) / len(values) ** 0.5 if len(values) > 1 else float("inf")
+        estimates[metric] = (mean, half_width)
+    return estimates
+
+def write_sampling_record(converged):
+    estimates = get_sampling_estimates() if sampling_state["windows"] else {}
+    record = {
+        "converged": converged,
+        "tick": m5.curTick(),
+        "period": sampling_period,
+        "warmup": sampling_state["warmup"],
+        "window": sampling_window,
+        "error": sampling_error,
+        "confidence": sampling_confidence,
+        "estimates": {metric: {"mean": mean, "half_width": half_width} for metric, (mean, half_width) in estimates.items()},
+        "windows": sampling_state["windows"],
+    }
+    with open(Path(m5.options.outdir) / "sampling.json", "w") as f:
+        json.dump(record, f, indent=4)
+
+def switch_to(detailed):
+    if sampling_state["detailed"] != detailed:
+        processor.switch()
+        sampling_state["detailed"] = detailed
+
+def fast_forward():
+    switch_to(False)
+    sampling_state["phase"] = "fast-forward"
+    m5.scheduleTickExitFromCurrent(sampling_period - sampling_state["warmup"] - sampling_window)
+
+# True once the ROI can end
+def advance_sampling():
+    phase = sampling_state["phase"]
+    if phase == "fast-forward":
+        switch_to(True)
+        sampling_state["phase"] = "warmup"
+        m5.scheduleTickExitFromCurrent(sampling_state["warmup"])
+    elif phase == "warmup":
+        m5.stats.reset()
+        sampling_state["phase"] = "window"
+        m5.scheduleTickExitFromCurrent(sampling_window)
+    elif phase == "window":
+        m5.stats.dump()
+        sampling_state["windows"].append(read_window_of_last_dump())
+        n_windows = len(sampling_state["windows"])
+        if n_windows >= sampling_min_windows:
+            estimates = get_sampling_estimates()
+            if all(mean > 0 and half_width / mean <= sampling_error for mean, half_width in estimates.values()):
+                print(f"info: IPC {estimates['ipc'][0]} and DRAM bandwidth {estimates['dram_bandwidth'][0]} B/s are within {sampling_error} after {n_windows} windows at tick {m5.curTick()}, ending the ROI")
+                return True
+        fast_forward()
+    return False
+
+def end_sampling(converged):
+    sampling_state["phase"] = None
+    write_sampling_record(converged)
+
+def start_roi():
+    convergence_state["in_roi"] = True
+    convergence_state["roi_start_tick"] = m5.curTick()
+    # the stats have just been reset
+    convergence_state["last_sample"] = (0.0, 0.0)
+    if stats_dump_period:
+        # the dumps are cumulative since the stats reset
+        print(f"info: Dumping stats every {stats_dump_period} ticks")
+        m5.stats.periodicStatDump(stats_dump_period)
+    if convergence_interval:
+        print(f"info: Sampling the DRAM bandwidth every {convergence_interval} ticks")
+        m5.scheduleTickExitFromCurrent(convergence_interval)
+    if max_roi_ticks:
+        print(f"info: Ending the ROI after {max_roi_ticks} ticks")
+        m5.scheduleTickExitFromCurrent(max_roi_ticks)
+    if sampling_period:
+        check_sampling_warmup()
+        print(f"info: Sampling a window of {sampling_window} ticks after {sampling_state['warmup']} ticks of warmup every {sampling_period} ticks")
+        fast_forward()
+
+# The ROI tick budget shares the scheduled tick exits with the convergence
+# sampling, the budget is checked first.
+def handle_scheduled_tick():
+    while True:
+        if not convergence_state["in_roi"]:
+            yield False
+            continue
+        if max_roi_ticks and m5.curTick() - convergence_state["roi_start_tick"] >= max_roi_ticks:
+            print(f"info: The ROI tick budget is exhausted at tick {m5.curTick()}, ending the ROI")
+            convergence_state["in_roi"] = False
+            if stats_dump_period:
+                m5.stats.periodicStatDump(0)
+            if convergence_interval:
+                write_convergence_record(False)
+            if sampling_period:
+                # the windows are the dumps
+                end_sampling(False)
+            else:
+                print(f"info: Dumping stats")
+                m5.stats.dump()
+            yield True
+            continue
+        if sampling_period:
+            if advance_sampling():
+                convergence_state["in_roi"] = False
+                end_sampling(True)
+                yield True
+                continue
+            yield False
+            continue
+        if not convergence_interval:
+            yield False
+            continue
+        m5.stats.dump()
+        sim_seconds, dram_bytes = read_dram_bytes_of_last_dump()
+        last_sample = convergence_state["last_sample"]
+        if last_sample and sim_seconds > last_sample[0]:
+            convergence_state["samples"].append((dram_bytes - last_sample[1]) / (sim_seconds - last_sample[0]))
+        convergence_state["last_sample"] = (sim_seconds, dram_bytes)
+        window = convergence_state["samples"][-convergence_window:]
+        if len(window) == convergence_window:
+            mean = sum(window) / len(window)
+            std = (sum((sample - mean) ** 2 for sample in window) / len(window)) ** 0.5
+            if mean > 0 and std / mean < convergence_threshold:
+                print(f"info: DRAM bandwidth converged to {mean} B/s at tick {m5.curTick()}, ending the ROI")
+                convergence_state["in_roi"] = False
+                write_convergence_record(True, std / mean)
+                yield True
+                continue
+        m5.scheduleTickExitFromCurrent(convergence_interval)
+        yield False
+
 def handle_work_begin():
     print(f"Exit due to m5_work_begin()")
     print(f"info: Resetting stats")
     m5.stats.reset()
-    print(f"info: Switching CPU")
-    processor.switch()
+    if take_checkpoint_path:
+        print(f"info: Saving checkpoint to {take_checkpoint_path}")
+        simulator.save_checkpoint(take_checkpoint_path)
+        yield True
+    if not sampling_period:
+        print(f"info: Switching CPU")
+        processor.switch()
+    start_roi()
     yield False
 
 def handle_work_end():
     print(f"Exit due to m5_work_end()")
-    print(f"info: Dumping stats")
-    m5.stats.dump()
+    convergence_state["in_roi"] = False
+    if stats_dump_period:
+        m5.stats.periodicStatDump(0)
+    if convergence_interval:
+        write_convergence_record(False)
+    if sampling_period:
+        # a window cut by the end of the ROI is dropped
+        end_sampling(False)
+    else:
+        print(f"info: Dumping stats")
+        m5.stats.dump()
     yield False
 
 def handle_exit():
@@ -137,8 +408,19 @@ simulator = Simulator(
     on_exit_event={
         ExitEvent.WORKBEGIN: handle_work_begin(), # save checkpoint here
         ExitEvent.WORKEND: handle_work_end(),
+        ExitEvent.SCHEDULED_TICK: handle_scheduled_tick(),
         ExitEvent.EXIT: handle_exit()
     }
 )
+if restore_checkpoint_path:
+    # the restored simulation is already in the ROI, there is no
+    # m5_work_begin() to start from, so do it once the system is instantiated.
+    # The stdlib Simulator has no public hook between the instantiation and
+    # the first run(), which calls _instantiate() itself and skips it if it
+    # already happened, so it is called here ahead of run().
+    simulator._instantiate()
+    print(f"info: Resetting stats")
+    m5.stats.reset()
+    start_roi()
 print("Beginning simulation!")
 simulator.run()
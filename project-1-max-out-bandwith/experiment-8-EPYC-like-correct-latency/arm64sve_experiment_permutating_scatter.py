@@ -1,3 +1,4 @@
+from gem5_launch_utils.DesignSpace import from_config
 from gem5_launch_utils.Experiment import Experiment
 from gem5_launch_utils.ExperimentUnit import ExperimentUnit
 
@@ -124,22 +125,22 @@ if __name__ == "__main__":
 
     experiment = Experiment()
 
-    for vlen in ARM64SVE_Design_Space.vlen:
-        for num_ccds in ARM64SVE_Design_Space.num_ccds:
-            for enable_prefetcher in ARM64SVE_Design_Space.enable_prefetcher:
-                for num_channels in ARM64SVE_Design_Space.num_channels:
-                    unit = generate_experiment_unit(
-                        isa = "arm64sve",
-                        vlen = str(vlen),
-                        num_ccds = str(num_ccds),
-                        enable_prefetcher = str(enable_prefetcher),
-                        num_channels = str(num_channels),
-                        params = PermutatingScatterParams(source_path=Path("/home/ubuntu/simple-vectorizable-microbenchmarks/permutating_scatter/"),
-                                                          with_roi_annotations=True,
-                                                          seed=17,
-                                                          mod=100_000_007,
-                                                          isa_extensions = [ISAExtension.SVE]))
-                    experiment.add_experiment_unit(unit)
-
-    n_processes = experiment.get_number_of_experiment_units()
+    design_space = from_config(ARM64SVE_Design_Space, ["vlen", "num_ccds", "enable_prefetcher", "num_channels"])
+
+    def make_unit(point):
+        return generate_experiment_unit(
+            isa = "arm64sve",
+            vlen = str(point["vlen"]),
+            num_ccds = str(point["num_ccds"]),
+            enable_prefetcher = str(point["enable_prefetcher"]),
+            num_channels = str(point["num_channels"]),
+            params = PermutatingScatterParams(source_path=Path("/home/ubuntu/simple-vectorizable-microbenchmarks/permutating_scatter/"),
+                                              with_roi_annotations=True,
+                                              seed=17,
+                                              mod=100_000_007,
+                                              isa_extensions = [ISAExtension.SVE]))
+
+    experiment.add_experiment_units(design_space.map(make_unit))
+
+    n_processes = len(design_space)
     experiment.launch(n_processes)
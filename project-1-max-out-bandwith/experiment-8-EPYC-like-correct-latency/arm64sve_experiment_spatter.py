@@ -1,3 +1,4 @@
+from gem5_launch_utils.DesignSpace import Axis, from_config
 from gem5_launch_utils.Experiment import Experiment
 from gem5_launch_utils.ExperimentUnit import ExperimentUnit
 
@@ -129,22 +130,22 @@ if __name__ == "__main__":
                      "/home/ubuntu/lanl-spatter/patterns/flag/static_2d/001.nonfp.json",
                      "/home/ubuntu/lanl-spatter/patterns/flag/static_2d/001.fp.json",
                      "/home/ubuntu/lanl-spatter/patterns/xrage/asteroid/spatter.json"]
-    for vlen in ARM64SVE_Design_Space.vlen:
-        for num_ccds in ARM64SVE_Design_Space.num_ccds:
-            for enable_prefetcher in ARM64SVE_Design_Space.enable_prefetcher:
-                for num_channels in ARM64SVE_Design_Space.num_channels:
-                    for json_file in pattern_files:
-                        unit = generate_experiment_unit(
-                            isa = "arm64sve",
-                            vlen = str(vlen),
-                            num_ccds = str(num_ccds),
-                            enable_prefetcher = str(enable_prefetcher),
-                            num_channels = str(num_channels),
-                            params = SpatterParams(source_path=Path("/home/ubuntu/simple-vectorizable-microbenchmarks/spatter/"),
-                                                   with_roi_annotations=True,
-                                                   json_filepath=json_file,
-                                                   isa_extensions = [ISAExtension.SVE]))
-                        experiment.add_experiment_unit(unit)
+    design_space = from_config(ARM64SVE_Design_Space, ["vlen", "num_ccds", "enable_prefetcher", "num_channels"]) \
+                   * Axis("json_file", pattern_files)
+
+    def make_unit(point):
+        return generate_experiment_unit(
+            isa = "arm64sve",
+            vlen = str(point["vlen"]),
+            num_ccds = str(point["num_ccds"]),
+            enable_prefetcher = str(point["enable_prefetcher"]),
+            num_channels = str(point["num_channels"]),
+            params = SpatterParams(source_path=Path("/home/ubuntu/simple-vectorizable-microbenchmarks/spatter/"),
+                                   with_roi_annotations=True,
+                                   json_filepath=point["json_file"],
+                                   isa_extensions = [ISAExtension.SVE]))
+
+    experiment.add_experiment_units(design_space.map(make_unit))
 
     n_processes = 16
     experiment.launch(n_processes)
@@ -1,3 +1,4 @@
+from gem5_launch_utils.DesignSpace import Axis, from_config
 from gem5_launch_utils.Experiment import Experiment
 from gem5_launch_utils.ExperimentUnit import ExperimentUnit
 
@@ -126,22 +127,22 @@ if __name__ == "__main__":
 
     # Adding some STREAM workloads
     stream_sizes = [2**k for k in range(20, 27)]
-    for vlen in ARM64SVE_Design_Space.vlen:
-        for num_ccds in ARM64SVE_Design_Space.num_ccds:
-            for enable_prefetcher in ARM64SVE_Design_Space.enable_prefetcher:
-                for num_channels in ARM64SVE_Design_Space.num_channels:
-                    for stream_size in stream_sizes:
-                        unit = generate_experiment_unit(
-                            isa = "arm64sve",
-                            vlen = str(vlen),
-                            num_ccds = str(num_ccds),
-                            enable_prefetcher = str(enable_prefetcher),
-                            num_channels = str(num_channels),
-                            params = STREAMParams(source_path=Path("/home/ubuntu/simple-vectorizable-microbenchmarks/stream/"),
-                                                  with_roi_annotations=True,
-                                                  number_of_elements=stream_size,
-                                                  isa_extensions = [ISAExtension.SVE]))
-                        experiment.add_experiment_unit(unit)
-
-    n_processes = experiment.get_number_of_experiment_units()
+    design_space = from_config(ARM64SVE_Design_Space, ["vlen", "num_ccds", "enable_prefetcher", "num_channels"]) \
+                   * Axis("stream_size", stream_sizes)
+
+    def make_unit(point):
+        return generate_experiment_unit(
+            isa = "arm64sve",
+            vlen = str(point["vlen"]),
+            num_ccds = str(point["num_ccds"]),
+            enable_prefetcher = str(point["enable_prefetcher"]),
+            num_channels = str(point["num_channels"]),
+            params = STREAMParams(source_path=Path("/home/ubuntu/simple-vectorizable-microbenchmarks/stream/"),
+                                  with_roi_annotations=True,
+                                  number_of_elements=point["stream_size"],
+                                  isa_extensions = [ISAExtension.SVE]))
+
+    experiment.add_experiment_units(design_space.map(make_unit))
+
+    n_processes = len(design_space)
     experiment.launch(n_processes)
@@ -1,3 +1,4 @@
+from gem5_launch_utils.DesignSpace import Axis, from_config
 from gem5_launch_utils.Experiment import Experiment
 from gem5_launch_utils.ExperimentUnit import ExperimentUnit
 
@@ -127,24 +128,24 @@ if __name__ == "__main__":
     # Adding some STREAM workloads
     table_number_of_elements = [2**k for k in range(20, 23)]
     inner_loop_number_of_elements = [128, 512, 1024]
-    for vlen in ARM64SVE_Design_Space.vlen:
-        for num_ccds in ARM64SVE_Design_Space.num_ccds:
-            for enable_prefetcher in ARM64SVE_Design_Space.enable_prefetcher:
-                for num_channels in ARM64SVE_Design_Space.num_channels:
-                    for num_table_elements in table_number_of_elements:
-                        for num_inner_loop_updates in inner_loop_number_of_elements:
-                            unit = generate_experiment_unit(
-                                isa = "arm64sve",
-                                vlen = str(vlen),
-                                num_ccds = str(num_ccds),
-                                enable_prefetcher = str(enable_prefetcher),
-                                num_channels = str(num_channels),
-                                params = GUPSParams(source_path=Path("/home/ubuntu/simple-vectorizable-microbenchmarks/gups/"),
-                                                      with_roi_annotations=True,
-                                                      table_number_of_elements = num_table_elements,
-                                                      number_of_updates_inner_loop = num_inner_loop_updates,
-                                                      isa_extensions = [ISAExtension.SVE]))
-                            experiment.add_experiment_unit(unit)
-
-    n_processes = experiment.get_number_of_experiment_units()
+    design_space = from_config(ARM64SVE_Design_Space, ["vlen", "num_ccds", "enable_prefetcher", "num_channels"]) \
+                   * Axis("num_table_elements", table_number_of_elements) \
+                   * Axis("num_inner_loop_updates", inner_loop_number_of_elements)
+
+    def make_unit(point):
+        return generate_experiment_unit(
+            isa = "arm64sve",
+            vlen = str(point["vlen"]),
+            num_ccds = str(point["num_ccds"]),
+            enable_prefetcher = str(point["enable_prefetcher"]),
+            num_channels = str(point["num_channels"]),
+            params = GUPSParams(source_path=Path("/home/ubuntu/simple-vectorizable-microbenchmarks/gups/"),
+                                  with_roi_annotations=True,
+                                  table_number_of_elements = point["num_table_elements"],
+                                  number_of_updates_inner_loop = point["num_inner_loop_updates"],
+                                  isa_extensions = [ISAExtension.SVE]))
+
+    experiment.add_experiment_units(design_space.map(make_unit))
+
+    n_processes = len(design_space)
     experiment.launch(n_processes)
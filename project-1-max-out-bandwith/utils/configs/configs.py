@@ -32,14 +32,23 @@ class Config:
     #     "key2": {
     #         "type": "path",
     #         "value": "build/binaries/"
+    #     },
+    #     "key3": {
+    #         "type": "int",
+    #         "values": ["512", "2048"]
     #     }
     #     ...
     # ```
+    # "values" makes the attribute a list, e.g. an axis of a design space
+    # (see gem5_launch_utils/DesignSpace.from_config).
     def init_from_json_file(self, filepath):
         content = None
         with open(filepath, "r") as f:
             content = json.load(f)
             for key, val in content.items():
                 assert(val["type"] in Config.available_types)
-                val = self._convert_to_type(val["value"], val["type"])
+                if "values" in val:
+                    val = [self._convert_to_type(v, val["type"]) for v in val["values"]]
+                else:
+                    val = self._convert_to_type(val["value"], val["type"])
                 self.__dict__[key] = val